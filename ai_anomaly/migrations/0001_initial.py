@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('messaging', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alert_type', models.CharField(max_length=64)),
+                ('explanation', models.TextField()),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='messaging.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['detected_at'], name='alert_detected_at_idx')],
+            },
+        ),
+    ]
@@ -6,4 +6,10 @@ class AnomalyAlert(models.Model):
 	explanation = models.TextField()
 	detected_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		indexes = [
+			# Recent-alert listings and 24h counts
+			models.Index(fields=['detected_at'], name='alert_detected_at_idx'),
+		]
+
 # Create your models here.
@@ -0,0 +1,100 @@
+from django.db import migrations, models
+import json
+
+# Frozen copy of p2p_sync.vector_clock's packed format (version 1), so later
+# changes to that module cannot change what this migration writes or reads
+PACKED_FORMAT_VERSION = 1
+
+
+def normalize(clock):
+    if isinstance(clock, str):
+        clock = json.loads(clock) if clock else {}
+    return {str(node_id): int(counter) for node_id, counter in (clock or {}).items() if counter}
+
+
+def encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_entries(entries):
+    out = bytearray([PACKED_FORMAT_VERSION])
+    encode_varint(len(entries), out)
+    previous = 0
+    for index in sorted(entries):
+        encode_varint(index - previous, out)
+        encode_varint(entries[index], out)
+        previous = index
+    return bytes(out)
+
+
+def decode_entries(data):
+    if not data:
+        return {}
+    data = bytes(data)
+    count, pos = decode_varint(data, 1)
+    entries = {}
+    index = 0
+    for _ in range(count):
+        delta, pos = decode_varint(data, pos)
+        counter, pos = decode_varint(data, pos)
+        index += delta
+        entries[index] = counter
+    return entries
+
+
+def pack_json_clocks(apps, schema_editor):
+    ClockNode = apps.get_model('p2p_sync', 'ClockNode')
+    BlockchainTransaction = apps.get_model('blockchain', 'BlockchainTransaction')
+    indexes = {}
+
+    def index_for(node_id):
+        if node_id not in indexes:
+            indexes[node_id] = ClockNode.objects.get_or_create(node_id=node_id)[0].pk
+        return indexes[node_id]
+
+    for row in BlockchainTransaction.objects.only('pk', 'vector_clock').iterator():
+        clock = normalize(row.vector_clock)
+        packed = encode_entries({index_for(node_id): counter for node_id, counter in clock.items()})
+        BlockchainTransaction.objects.filter(pk=row.pk).update(vector_clock_packed=packed)
+
+
+def unpack_json_clocks(apps, schema_editor):
+    """Reverse: restore the JSON clocks (the column is re-added by reversing the later RemoveField)"""
+    ClockNode = apps.get_model('p2p_sync', 'ClockNode')
+    BlockchainTransaction = apps.get_model('blockchain', 'BlockchainTransaction')
+    nodes = dict(ClockNode.objects.values_list('pk', 'node_id'))
+    for row in BlockchainTransaction.objects.only('pk', 'vector_clock_packed').iterator():
+        clock = {nodes[index]: counter for index, counter in decode_entries(row.vector_clock_packed).items()}
+        BlockchainTransaction.objects.filter(pk=row.pk).update(vector_clock=clock)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchain', '0001_initial'),
+        ('p2p_sync', '0003_packed_vector_clock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockchaintransaction',
+            name='vector_clock_packed',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(pack_json_clocks, unpack_json_clocks),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchain', '0002_packed_vector_clock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blockchaintransaction',
+            index=models.Index(fields=['timestamp'], name='master_ledger_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Dropped after 0002 packed the clocks, so rolling back re-adds the column before they are unpacked"""
+
+    dependencies = [
+        ('blockchain', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='blockchaintransaction',
+            name='vector_clock',
+        ),
+    ]
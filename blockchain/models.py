@@ -1,4 +1,11 @@
 from django.db import models
+from p2p_sync import vector_clock as vector_clocks
+
+# Tables written by the command-center scripts rather than migrations; they
+# may be missing
+MASTER_LEDGER_TABLE = 'blockchain_masterledger'
+COMMAND_CENTER_TABLE = 'blockchain_commandcenter'
+
 
 class BlockchainTransaction(models.Model):
     """Master blockchain ledger - central server maintains this"""
@@ -10,5 +17,21 @@ class BlockchainTransaction(models.Model):
     timestamp = models.DateTimeField()
     signature = models.TextField()
     lamport_clock = models.IntegerField(default=0)  # For conflict resolution
-    vector_clock = models.JSONField(default=dict)   # For distributed ordering
-    is_synced = models.BooleanField(default=False)  # Track sync status# Create your models here.
+    vector_clock_packed = models.BinaryField(default=bytes)  # Packed vector clock for distributed ordering
+    is_synced = models.BooleanField(default=False)  # Track sync status
+
+    class Meta:
+        indexes = [
+            # Conflict windows and recent-transaction listings
+            models.Index(fields=['timestamp'], name='master_ledger_ts_idx'),
+        ]
+
+    @property
+    def vector_clock(self):
+        return vector_clocks.unpack(self.vector_clock_packed)
+
+    @vector_clock.setter
+    def vector_clock(self, clock):
+        self.vector_clock_packed = vector_clocks.pack(clock)
+
+# Create your models here.
@@ -2,9 +2,11 @@ from rest_framework import serializers
 from .models import BlockchainTransaction
 
 class BlockchainTransactionSerializer(serializers.ModelSerializer):
+    vector_clock = serializers.DictField(child=serializers.IntegerField(min_value=0), required=False)
+
     class Meta:
         model = BlockchainTransaction
-        fields = '__all__'
+        exclude = ['vector_clock_packed']
 
 # Serializers for legacy blockchain tables (used via raw SQL)
 class MasterLedgerSerializer(serializers.Serializer):
@@ -1,12 +1,13 @@
 from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from django.db import connection, transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from .models import BlockchainTransaction
 from .serializers import BlockchainTransactionSerializer
-import sqlite3
+from p2p_sync.state_history import state_history
 
 # Blockchain transaction CRUD
 class BlockchainTransactionListCreateView(generics.ListCreateAPIView):
@@ -40,26 +41,22 @@ class CommandCenterStatusView(APIView):
     def get(self, request):
         """Get command center status and operational mode"""
         try:
-            conn = sqlite3.connect('db.sqlite3')
-            cursor = conn.cursor()
-            
-            # Get command center status
-            cursor.execute("SELECT name, current_mode, is_active, global_lamport_clock FROM blockchain_commandcenter")
-            cc = cursor.fetchone()
-            
-            # Get device statuses
-            cursor.execute("SELECT device_id, device_type, is_authorized, is_online, clearance_level FROM blockchain_device")
-            devices = cursor.fetchall()
-            
-            # Get recent mode changes
-            cursor.execute("""
-                SELECT old_mode, new_mode, changed_by, timestamp, reason 
-                FROM blockchain_modechangelog 
-                ORDER BY timestamp DESC LIMIT 5
-            """)
-            mode_changes = cursor.fetchall()
-            
-            conn.close()
+            with connection.cursor() as cursor:
+                # Get command center status
+                cursor.execute("SELECT name, current_mode, is_active, global_lamport_clock FROM blockchain_commandcenter")
+                cc = cursor.fetchone()
+                
+                # Get device statuses
+                cursor.execute("SELECT device_id, device_type, is_authorized, is_online, clearance_level FROM blockchain_device")
+                devices = cursor.fetchall()
+                
+                # Get recent mode changes
+                cursor.execute("""
+                    SELECT old_mode, new_mode, changed_by, timestamp, reason 
+                    FROM blockchain_modechangelog 
+                    ORDER BY timestamp DESC LIMIT 5
+                """)
+                mode_changes = cursor.fetchall()
             
             return Response({
                 'command_center': {
@@ -104,28 +101,24 @@ class SwitchModeView(APIView):
             return Response({'error': 'Invalid mode'}, status=400)
         
         try:
-            conn = sqlite3.connect('db.sqlite3')
-            cursor = conn.cursor()
-            
-            # Get current mode
-            cursor.execute("SELECT current_mode FROM blockchain_commandcenter")
-            current_mode = cursor.fetchone()[0]
-            
-            # Update mode
-            cursor.execute("""
-                UPDATE blockchain_commandcenter 
-                SET current_mode = ?, global_lamport_clock = global_lamport_clock + 1
-            """, (new_mode,))
-            
-            # Log mode change
-            cursor.execute("""
-                INSERT INTO blockchain_modechangelog 
-                (old_mode, new_mode, changed_by, timestamp, reason)
-                VALUES (?, ?, ?, datetime('now'), ?)
-            """, (current_mode, new_mode, changed_by, reason))
-            
-            conn.commit()
-            conn.close()
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Get current mode
+                cursor.execute("SELECT current_mode FROM blockchain_commandcenter")
+                current_mode = cursor.fetchone()[0]
+                
+                # Update mode
+                cursor.execute("""
+                    UPDATE blockchain_commandcenter 
+                    SET current_mode = %s, global_lamport_clock = global_lamport_clock + 1
+                """, (new_mode,))
+                
+                # Log mode change
+                cursor.execute("""
+                    INSERT INTO blockchain_modechangelog 
+                    (old_mode, new_mode, changed_by, timestamp, reason)
+                    VALUES (%s, %s, %s, datetime('now'), %s)
+                """, (current_mode, new_mode, changed_by, reason))
+                state_history.record_mode(new_mode)
             
             return Response({
                 'status': 'mode switched',
@@ -143,28 +136,24 @@ class BlockchainStatsView(APIView):
     def get(self, request):
         """Get blockchain statistics"""
         try:
-            conn = sqlite3.connect('db.sqlite3')
-            cursor = conn.cursor()
-            
-            # Get transaction counts
-            cursor.execute("SELECT COUNT(*) FROM blockchain_blockchaintransaction")
-            tx_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM blockchain_masterledger")
-            master_ledger_count = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM blockchain_localledger WHERE is_synced = 0")
-            pending_sync = cursor.fetchone()[0]
-            
-            # Get transactions by mode
-            cursor.execute("""
-                SELECT mode_when_created, COUNT(*) 
-                FROM blockchain_masterledger 
-                GROUP BY mode_when_created
-            """)
-            mode_stats = cursor.fetchall()
-            
-            conn.close()
+            with connection.cursor() as cursor:
+                # Get transaction counts
+                cursor.execute("SELECT COUNT(*) FROM blockchain_blockchaintransaction")
+                tx_count = cursor.fetchone()[0]
+                
+                cursor.execute("SELECT COUNT(*) FROM blockchain_masterledger")
+                master_ledger_count = cursor.fetchone()[0]
+                
+                cursor.execute("SELECT COUNT(*) FROM blockchain_localledger WHERE is_synced = 0")
+                pending_sync = cursor.fetchone()[0]
+                
+                # Get transactions by mode
+                cursor.execute("""
+                    SELECT mode_when_created, COUNT(*) 
+                    FROM blockchain_masterledger 
+                    GROUP BY mode_when_created
+                """)
+                mode_stats = cursor.fetchall()
             
             return Response({
                 'blockchain_transactions': tx_count,
@@ -184,18 +173,15 @@ class RecentTransactionsView(APIView):
         limit = request.query_params.get('limit', 10)
         
         try:
-            conn = sqlite3.connect('db.sqlite3')
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT tx_hash, from_device_id, to_device_id, timestamp, mode_when_created
-                FROM blockchain_masterledger 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            """, (int(limit),))
-            
-            transactions = cursor.fetchall()
-            conn.close()
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT tx_hash, from_device_id, to_device_id, timestamp, mode_when_created
+                    FROM blockchain_masterledger 
+                    ORDER BY timestamp DESC 
+                    LIMIT %s
+                """, (int(limit),))
+                
+                transactions = cursor.fetchall()
             
             tx_data = []
             for tx in transactions:
@@ -217,16 +203,12 @@ class RecentTransactionsView(APIView):
 def blockchain_stats_api(request):
     """Simple API for blockchain statistics"""
     try:
-        conn = sqlite3.connect('db.sqlite3')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM blockchain_masterledger")
-        ledger_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT current_mode FROM blockchain_commandcenter")
-        current_mode = cursor.fetchone()[0]
-        
-        conn.close()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM blockchain_masterledger")
+            ledger_count = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT current_mode FROM blockchain_commandcenter")
+            current_mode = cursor.fetchone()[0]
         
         return JsonResponse({
             'ledger_entries': ledger_count,
@@ -242,136 +224,132 @@ def transaction_list_view(request):
     from django.shortcuts import render
     
     try:
-        conn = sqlite3.connect('db.sqlite3')
-        cursor = conn.cursor()
-        
-        # Get all messaging communications with blockchain tracking
-        cursor.execute("""
-            SELECT 
-                m.id as message_id,
-                m.message_id as msg_hash,
-                m.timestamp, 
-                m.sender_device, 
-                m.recipient_device, 
-                m.content,
-                m.is_anomaly,
-                m.encrypted_payload,
-                m.anomaly_type,
-                bl.tx_hash,
-                bl.mode as blockchain_mode,
-                bl.is_synced,
-                d1.device_name as from_device_name,
-                d2.device_name as to_device_name,
-                d1.clearance_level as from_clearance,
-                d2.clearance_level as to_clearance
-            FROM messaging_message m
-            LEFT JOIN blockchain_masterledger bl ON m.id = bl.message_id
-            LEFT JOIN users_device d1 ON m.sender_device = d1.device_id
-            LEFT JOIN users_device d2 ON m.recipient_device = d2.device_id
-            ORDER BY m.timestamp DESC
-            LIMIT 50
-        """)
-        
-        transactions = []
-        for row in cursor.fetchall():
-            # Determine security level based on content and clearance
-            security_level = "STANDARD"
-            from_clearance = row[14] or 1
-            to_clearance = row[15] or 1
-            max_clearance = max(from_clearance, to_clearance)
+        with connection.cursor() as cursor:
+            # Get all messaging communications with blockchain tracking
+            cursor.execute("""
+                SELECT 
+                    m.id as message_id,
+                    m.message_id as msg_hash,
+                    m.timestamp, 
+                    m.sender_device, 
+                    m.recipient_device, 
+                    m.content,
+                    m.is_anomaly,
+                    m.encrypted_payload,
+                    m.anomaly_type,
+                    bl.tx_hash,
+                    bl.mode as blockchain_mode,
+                    bl.is_synced,
+                    d1.device_name as from_device_name,
+                    d2.device_name as to_device_name,
+                    d1.clearance_level as from_clearance,
+                    d2.clearance_level as to_clearance
+                FROM messaging_message m
+                LEFT JOIN blockchain_masterledger bl ON m.id = bl.message_id
+                LEFT JOIN users_device d1 ON m.sender_device = d1.device_id
+                LEFT JOIN users_device d2 ON m.recipient_device = d2.device_id
+                ORDER BY m.timestamp DESC
+                LIMIT 50
+            """)
+            
+            transactions = []
+            for row in cursor.fetchall():
+                # Determine security level based on content and clearance
+                security_level = "STANDARD"
+                from_clearance = row[14] or 1
+                to_clearance = row[15] or 1
+                max_clearance = max(from_clearance, to_clearance)
+                
+                if max_clearance >= 5:
+                    security_level = "TOP_SECRET"
+                elif max_clearance >= 4:
+                    security_level = "CLASSIFIED" 
+                elif max_clearance >= 3:
+                    security_level = "RESTRICTED"
+                elif max_clearance >= 2:
+                    security_level = "CONFIDENTIAL"
+                
+                # Determine validation status
+                validation_status = "VERIFIED"
+                if row[6]:  # is_anomaly
+                    validation_status = "ANOMALY_DETECTED"
+                elif row[9] and not row[11]:  # has blockchain entry but not synced
+                    validation_status = "PENDING_VALIDATION"
+                elif not row[9]:  # no blockchain entry
+                    validation_status = "NOT_LOGGED"
+                
+                # Use blockchain tx_hash if available, otherwise use message hash
+                tx_hash = row[9] if row[9] else f"msg_{row[1]}"
+                
+                transactions.append({
+                    'tx_hash': tx_hash,
+                    'message_id': row[0],
+                    'timestamp': row[2],
+                    'from_device_id': row[3] if row[3] else 'SYSTEM',
+                    'to_device_id': row[4] if row[4] else 'BROADCAST',
+                    'from_device_name': row[12] if row[12] else row[3],
+                    'to_device_name': row[13] if row[13] else row[4],
+                    'content': row[5] if row[5] else 'ENCRYPTED_PAYLOAD',
+                    'operational_mode': row[10] if row[10] else 'NORMAL',
+                    'is_synced': row[11] if row[11] is not None else False,
+                    'block_type': 'MESSAGE',
+                    'security_level': security_level,
+                    'validation_status': validation_status,
+                    'is_anomaly': row[6] or False,
+                    'anomaly_type': row[8] if row[8] else None,
+                    'is_encrypted': bool(row[7]),
+                    'from_clearance': from_clearance,
+                    'to_clearance': to_clearance,
+                    'has_blockchain_entry': bool(row[9])
+                })
             
-            if max_clearance >= 5:
-                security_level = "TOP_SECRET"
-            elif max_clearance >= 4:
-                security_level = "CLASSIFIED" 
-            elif max_clearance >= 3:
-                security_level = "RESTRICTED"
-            elif max_clearance >= 2:
-                security_level = "CONFIDENTIAL"
+            # Get command center operational status
+            cursor.execute("""
+                SELECT name, current_mode, is_active, global_lamport_clock, 
+                       authority_level, emergency_protocols_active
+                FROM blockchain_commandcenter
+            """)
+            cc_row = cursor.fetchone()
+            command_center = {
+                'name': cc_row[0] if cc_row else 'OPERATION_SainyaSecure_CC',
+                'current_mode': cc_row[1] if cc_row else 'NORMAL',
+                'is_active': cc_row[2] if cc_row else True,
+                'global_lamport_clock': cc_row[3] if cc_row else 0,
+                'authority_level': cc_row[4] if cc_row and len(cc_row) > 4 else 'COMMAND',
+                'emergency_active': cc_row[5] if cc_row and len(cc_row) > 5 else False
+            }
             
-            # Determine validation status
-            validation_status = "VERIFIED"
-            if row[6]:  # is_anomaly
-                validation_status = "ANOMALY_DETECTED"
-            elif row[9] and not row[11]:  # has blockchain entry but not synced
-                validation_status = "PENDING_VALIDATION"
-            elif not row[9]:  # no blockchain entry
-                validation_status = "NOT_LOGGED"
+            # Get blockchain integrity metrics
+            cursor.execute("""
+                SELECT 
+                    COUNT(*) as total_blocks,
+                    COUNT(CASE WHEN is_synced = 0 THEN 1 END) as pending_sync,
+                    COUNT(CASE WHEN mode = 'emergency' THEN 1 END) as emergency_blocks,
+                    COUNT(CASE WHEN block_type = 'COMMAND' THEN 1 END) as command_blocks
+                FROM blockchain_masterledger
+            """)
+            stats_row = cursor.fetchone()
             
-            # Use blockchain tx_hash if available, otherwise use message hash
-            tx_hash = row[9] if row[9] else f"msg_{row[1]}"
+            # Get device authentication status
+            cursor.execute("""
+                SELECT 
+                    COUNT(*) as total_devices,
+                    COUNT(CASE WHEN is_authenticated = 1 THEN 1 END) as authenticated,
+                    COUNT(CASE WHEN is_online = 1 THEN 1 END) as online,
+                    COUNT(CASE WHEN clearance_level >= 4 THEN 1 END) as high_clearance
+                FROM users_device
+            """)
+            device_stats = cursor.fetchone()
             
-            transactions.append({
-                'tx_hash': tx_hash,
-                'message_id': row[0],
-                'timestamp': row[2],
-                'from_device_id': row[3] if row[3] else 'SYSTEM',
-                'to_device_id': row[4] if row[4] else 'BROADCAST',
-                'from_device_name': row[12] if row[12] else row[3],
-                'to_device_name': row[13] if row[13] else row[4],
-                'content': row[5] if row[5] else 'ENCRYPTED_PAYLOAD',
-                'operational_mode': row[10] if row[10] else 'NORMAL',
-                'is_synced': row[11] if row[11] is not None else False,
-                'block_type': 'MESSAGE',
-                'security_level': security_level,
-                'validation_status': validation_status,
-                'is_anomaly': row[6] or False,
-                'anomaly_type': row[8] if row[8] else None,
-                'is_encrypted': bool(row[7]),
-                'from_clearance': from_clearance,
-                'to_clearance': to_clearance,
-                'has_blockchain_entry': bool(row[9])
-            })
-        
-        # Get command center operational status
-        cursor.execute("""
-            SELECT name, current_mode, is_active, global_lamport_clock, 
-                   authority_level, emergency_protocols_active
-            FROM blockchain_commandcenter
-        """)
-        cc_row = cursor.fetchone()
-        command_center = {
-            'name': cc_row[0] if cc_row else 'OPERATION_SainyaSecure_CC',
-            'current_mode': cc_row[1] if cc_row else 'NORMAL',
-            'is_active': cc_row[2] if cc_row else True,
-            'global_lamport_clock': cc_row[3] if cc_row else 0,
-            'authority_level': cc_row[4] if cc_row and len(cc_row) > 4 else 'COMMAND',
-            'emergency_active': cc_row[5] if cc_row and len(cc_row) > 5 else False
-        }
-        
-        # Get blockchain integrity metrics
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_blocks,
-                COUNT(CASE WHEN is_synced = 0 THEN 1 END) as pending_sync,
-                COUNT(CASE WHEN mode = 'emergency' THEN 1 END) as emergency_blocks,
-                COUNT(CASE WHEN block_type = 'COMMAND' THEN 1 END) as command_blocks
-            FROM blockchain_masterledger
-        """)
-        stats_row = cursor.fetchone()
-        
-        # Get device authentication status
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_devices,
-                COUNT(CASE WHEN is_authenticated = 1 THEN 1 END) as authenticated,
-                COUNT(CASE WHEN is_online = 1 THEN 1 END) as online,
-                COUNT(CASE WHEN clearance_level >= 4 THEN 1 END) as high_clearance
-            FROM users_device
-        """)
-        device_stats = cursor.fetchone()
-        
-        # Get recent anomalies
-        cursor.execute("""
-            SELECT m.id, m.sender_device, m.recipient_device, m.timestamp, m.anomaly_type
-            FROM messaging_message m
-            WHERE m.is_anomaly = 1
-            ORDER BY m.timestamp DESC
-            LIMIT 5
-        """)
-        anomalies = cursor.fetchall()
-        
-        conn.close()
+            # Get recent anomalies
+            cursor.execute("""
+                SELECT m.id, m.sender_device, m.recipient_device, m.timestamp, m.anomaly_type
+                FROM messaging_message m
+                WHERE m.is_anomaly = 1
+                ORDER BY m.timestamp DESC
+                LIMIT 5
+            """)
+            anomalies = cursor.fetchall()
         
         context = {
             'transactions': transactions,
@@ -0,0 +1,199 @@
+"""
+Activity timeline for system_activity_api
+Each stream (messages, master ledger) is read newest first with keyset
+pagination and bound parameters; a heap merges the streams, so every page
+costs the same however far back the client has scrolled.
+"""
+from django.db import connection
+from django.utils import timezone
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone as dt_timezone
+from messaging.models import Message
+from users.models import Device
+from blockchain.models import MASTER_LEDGER_TABLE
+import base64
+import heapq
+import itertools
+import json
+
+PAGE_SIZE = 15
+MAX_PAGE_SIZE = 100
+# Written alongside the master ledger by the command-center scripts
+LEDGER_DEVICE_TABLE = 'blockchain_device'
+
+
+class ActivityStream(ABC):
+    """
+    One source table. Rows come back ordered by (timestamp, key) descending;
+    rank breaks timestamp ties between streams, so (timestamp, rank, key)
+    totally orders the merged timeline and doubles as the page cursor.
+    """
+    rank = 0
+    types = ()  # activity_type filter values this stream serves ('' = all)
+
+    def keyset(self, timestamp_column, key_column, cursor):
+        """WHERE clause and params for rows after cursor (timestamp, rank, key) in descending order"""
+        timestamp, rank, key = cursor
+        timestamp = connection.ops.adapt_datetimefield_value(timestamp)
+        if self.rank < rank:
+            return f'{timestamp_column} <= %s', [timestamp]
+        if self.rank > rank:
+            return f'{timestamp_column} < %s', [timestamp]
+        # Same stream: the range on the timestamp index, then the tie-break
+        return (
+            f'{timestamp_column} <= %s AND ({timestamp_column} < %s OR {key_column} < %s)',
+            [timestamp, timestamp, key]
+        )
+
+    def fetch(self, from_device, to_device, activity_type, cursor, limit):
+        """Up to limit (sort key, activity) pairs, newest first"""
+        sql, params = self.query(from_device, to_device, activity_type, cursor, limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [((row[0], self.rank, row[1]), self.activity(row)) for row in rows]
+
+    @abstractmethod
+    def query(self, from_device, to_device, activity_type, cursor, limit):
+        """(sql, params) selecting (timestamp, key, ...) rows after cursor, newest first"""
+
+    @abstractmethod
+    def activity(self, row):
+        """system_activity_api activity dict for one row of query()"""
+
+
+class MessageStream(ActivityStream):
+    rank = 1
+    types = ('', 'Message', 'Anomaly')
+
+    def query(self, from_device, to_device, activity_type, cursor, limit):
+        where, params = [], []
+        if from_device:
+            where.append('sd.device_id = %s')
+            params.append(from_device)
+        if to_device:
+            where.append('rd.device_id = %s')
+            params.append(to_device)
+        if activity_type == 'Anomaly':
+            where.append('m.anomaly_flag')  # Matches message_anomaly_ts_idx's condition
+        if cursor is not None:
+            clause, clause_params = self.keyset('m.timestamp', 'm.id', cursor)
+            where.append(clause)
+            params.extend(clause_params)
+        return f"""
+            SELECT m.timestamp, m.id, sd.device_id, rd.device_id, m.anomaly_flag, m.msg_id, m.payload, m.blockchain_tx
+            FROM {Message._meta.db_table} m
+            LEFT JOIN {Device._meta.db_table} sd ON m.sender_id = sd.id
+            LEFT JOIN {Device._meta.db_table} rd ON m.receiver_id = rd.id
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT %s
+        """, params + [limit]
+
+    def activity(self, row):
+        return {
+            'type': 'Message',
+            'timestamp': as_utc(row[0]).isoformat(),
+            'from_device': row[2] if row[2] else 'SYSTEM',
+            'to_device': row[3] if row[3] else 'BROADCAST',
+            'status': 'Anomaly' if row[4] else 'Secure',
+            'hash': row[7][:8] + '...' if row[7] else f'msg_{row[5][:8]}...',
+            'msg_id': row[5],
+            'content': row[6][:50] + '...' if row[6] and len(row[6]) > 50 else row[6] or 'ENCRYPTED',
+            'anomaly_type': None
+        }
+
+
+class LedgerStream(ActivityStream):
+    rank = 0
+    types = ('', 'Blockchain')
+
+    def query(self, from_device, to_device, activity_type, cursor, limit):
+        where, params = [], []
+        if from_device:
+            where.append('fd.device_id = %s')
+            params.append(from_device)
+        if to_device:
+            where.append('td.device_id = %s')
+            params.append(to_device)
+        if cursor is not None:
+            clause, clause_params = self.keyset('bl.timestamp', 'bl.tx_hash', cursor)
+            where.append(clause)
+            params.extend(clause_params)
+        return f"""
+            SELECT bl.timestamp, bl.tx_hash, fd.device_id, td.device_id, bl.from_device_id, bl.to_device_id,
+                   bl.is_resync, bl.mode_when_created
+            FROM {MASTER_LEDGER_TABLE} bl
+            LEFT JOIN {LEDGER_DEVICE_TABLE} fd ON bl.from_device_id = fd.id
+            LEFT JOIN {LEDGER_DEVICE_TABLE} td ON bl.to_device_id = td.id
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY bl.timestamp DESC, bl.tx_hash DESC
+            LIMIT %s
+        """, params + [limit]
+
+    def activity(self, row):
+        return {
+            'type': 'Blockchain',
+            'timestamp': as_utc(row[0]).isoformat(),
+            'from_device': row[2] or (str(row[4]) if row[4] else 'COMMAND_CENTER'),
+            'to_device': row[3] or (str(row[5]) if row[5] else 'ALL_UNITS'),
+            'status': 'Synced' if not row[6] else 'Resync',
+            'hash': row[1][:8] + '...' if row[1] else 'No Hash',
+            'mode': row[7] or 'normal',
+            'content': 'BLOCKCHAIN_TRANSACTION'
+        }
+
+
+def as_utc(value):
+    """Raw cursors return naive UTC datetimes (USE_TZ storage)"""
+    return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+
+
+class ActivityQuery:
+    """
+    Pages of the merged timeline. page() fetches limit + 1 rows per stream
+    and keeps the newest limit overall: anything left over means another
+    page exists, and the last row kept becomes its cursor.
+    """
+
+    def __init__(self):
+        self._streams = None  # Checked once per worker: the master ledger tables may be missing
+
+    def streams(self):
+        if self._streams is None:
+            tables = set(connection.introspection.table_names())
+            self._streams = [MessageStream()]
+            if {MASTER_LEDGER_TABLE, LEDGER_DEVICE_TABLE} <= tables:
+                self._streams.append(LedgerStream())
+        return self._streams
+
+    def page(self, from_device='', to_device='', activity_type='', cursor=None, limit=PAGE_SIZE):
+        """(activities newest first, cursor for the next page or None); cursor is an encoded string"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        position = decode_cursor(cursor) if cursor else None
+        fetched = [
+            stream.fetch(from_device, to_device, activity_type, position, limit + 1)
+            for stream in self.streams() if activity_type in stream.types
+        ]
+        merged = heapq.merge(*fetched, key=lambda item: item[0], reverse=True)
+        page = list(itertools.islice(merged, limit))
+        more = sum(len(rows) for rows in fetched) > len(page)
+        return [activity for _, activity in page], encode_cursor(page[-1][0]) if more else None
+
+
+def encode_cursor(key):
+    timestamp, rank, row_key = key
+    raw = json.dumps([as_utc(timestamp).isoformat(), rank, row_key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, rank, key) from encode_cursor's output; ValueError if malformed"""
+    try:
+        timestamp, rank, row_key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(timestamp), int(rank), row_key
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'invalid cursor: {e}') from e
+
+# Singleton instance
+activity_query = ActivityQuery()
@@ -0,0 +1,27 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from urllib.parse import parse_qs
+from .feed import ACTIVITY_GROUP, matches
+
+
+class ActivityFeedConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes activity events to one dashboard. Filters come from the query
+    string (from_device, to_device, type), as for system_activity_api; the
+    client loads the initial list from that API once, then listens here.
+    """
+
+    async def connect(self):
+        query = parse_qs(self.scope['query_string'].decode())
+        self.from_device = query.get('from_device', [''])[0]
+        self.to_device = query.get('to_device', [''])[0]
+        self.activity_type = query.get('type', [''])[0]
+        await self.channel_layer.group_add(ACTIVITY_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(ACTIVITY_GROUP, self.channel_name)
+
+    async def activity_event(self, message):
+        event = message['event']
+        if matches(event, self.from_device, self.to_device, self.activity_type):
+            await self.send_json(event)
@@ -0,0 +1,124 @@
+"""
+Live activity feed for open dashboards
+Each message, ledger block and anomaly alert is published once, after
+commit, to the ACTIVITY_GROUP channel layer group; the layer fans it out to
+every ActivityFeedConsumer, which filters it and pushes it over its socket.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from messaging.models import Message
+from p2p_sync.models import LocalLedgerBlock
+from p2p_sync.signals import blocks_imported
+from ai_anomaly.models import AnomalyAlert
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_GROUP = 'dashboard_activity'
+
+
+def publish(event):
+    """Send event to every subscribed dashboard; never raises into the writer"""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(ACTIVITY_GROUP, {'type': 'activity.event', 'event': event})
+    except Exception:
+        logger.exception('Activity feed publish failed')
+
+
+def publish_on_commit(event):
+    transaction.on_commit(lambda: publish(event))
+
+
+def matches(event, from_device='', to_device='', activity_type=''):
+    """Same filters as system_activity_api; 'Anomaly' selects anomalous messages and alerts"""
+    if from_device and event['from_device'] != from_device:
+        return False
+    if to_device and event['to_device'] != to_device:
+        return False
+    if activity_type == 'Anomaly':
+        return event['status'] == 'Anomaly'
+    return not activity_type or event['type'] == activity_type
+
+
+# Events use system_activity_api's activity fields, so the dashboard renders both alike
+
+def message_hash(message):
+    return message.blockchain_tx[:8] + '...' if message.blockchain_tx else f'msg_{message.msg_id[:8]}...'
+
+
+def message_event(message):
+    return {
+        'type': 'Message',
+        'timestamp': message.timestamp.isoformat(),
+        'from_device': message.sender.device_id,
+        'to_device': message.receiver.device_id,
+        'status': 'Anomaly' if message.anomaly_flag else 'Secure',
+        'hash': message_hash(message),
+        'msg_id': message.msg_id,
+        'content': message.payload[:50] + '...' if len(message.payload) > 50 else message.payload or 'ENCRYPTED',
+        'anomaly_type': None
+    }
+
+
+def block_event(block, device_id):
+    return {
+        'type': 'Blockchain',
+        'timestamp': block.timestamp.isoformat(),
+        'from_device': device_id,
+        'to_device': 'LOCAL_LEDGER',
+        'status': 'Synced' if block.is_synced else 'Pending',
+        'hash': block.payload_hash[:8] + '...',
+        'block_id': block.block_id,
+        'mode': 'local',
+        'content': 'LEDGER_BLOCK'
+    }
+
+
+def alert_event(alert):
+    message = alert.message
+    return {
+        'type': 'Anomaly',
+        'timestamp': alert.detected_at.isoformat(),
+        'from_device': message.sender.device_id,
+        'to_device': message.receiver.device_id,
+        'status': 'Anomaly',
+        'hash': message_hash(message),
+        'msg_id': message.msg_id,
+        'content': alert.explanation[:50] + '...' if len(alert.explanation) > 50 else alert.explanation,
+        'anomaly_type': alert.alert_type
+    }
+
+
+@receiver(post_save, sender=Message, dispatch_uid='activity_feed_message')
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish_on_commit(message_event(instance))
+
+
+@receiver(post_save, sender=LocalLedgerBlock, dispatch_uid='activity_feed_block')
+def block_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish_on_commit(block_event(instance, instance.device.device_id))
+
+
+@receiver(post_save, sender=AnomalyAlert, dispatch_uid='activity_feed_alert')
+def alert_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish_on_commit(alert_event(instance))
+
+
+@receiver(blocks_imported, dispatch_uid='activity_feed_import')
+def blocks_imported_from_peer(sender, device, block_ids, **kwargs):
+    """One event per peer import (which can hold thousands of blocks), for its newest block"""
+    latest = LocalLedgerBlock.objects.filter(block_id__in=block_ids).order_by('-timestamp', '-pk').first()
+    if latest is None:
+        return
+    event = block_event(latest, device.device_id)
+    event['content'] = f'{len(block_ids)} LEDGER_BLOCKS IMPORTED' if len(block_ids) > 1 else event['content']
+    publish(event)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from dashboard.models import TimelineEvent
+from dashboard.timeline import timeline, BACKFILL_CHUNK_SIZE
+import time
+
+
+class Command(BaseCommand):
+    help = 'Append audit timeline events for messages and master ledger entries written before the timeline existed (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE,
+                            help=f'Rows read and inserted per batch (default {BACKFILL_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🗂️  OPERATION SainyaSecure - AUDIT TIMELINE BACKFILL'))
+        self.stdout.write('=' * 70)
+
+        started = time.monotonic()
+        added = timeline.backfill(chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(f"• Added {added['message']} message and {added['blockchain']} ledger events in {elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f'• Timeline holds {TimelineEvent.objects.count()} events'))
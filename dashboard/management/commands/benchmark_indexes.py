@@ -0,0 +1,165 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from blockchain.models import BlockchainTransaction
+from p2p_sync.models import LocalLedgerBlock
+from messaging.models import Message
+from ai_anomaly.models import AnomalyAlert
+from datetime import timedelta
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+BENCHMARK_MODELS = [LocalLedgerBlock, Message, AnomalyAlert, BlockchainTransaction]
+SEED_DEVICES = 50
+SEED_SPAN = timedelta(days=90)
+INSERT_BATCH = 50000
+
+
+class Command(BaseCommand):
+    help = 'Seed a scratch SQLite DB and compare hot-query plans and latency without and with the Meta.indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Rows per seeded table (default 1,000,000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query; the best run is reported')
+        parser.add_argument('--path', help='Scratch database file (default: a temporary file, removed afterwards)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_indexes builds its scratch DB with the SQLite schema editor')
+
+        self.stdout.write(self.style.SUCCESS('📈 OPERATION SainyaSecure - INDEX BENCHMARK'))
+        self.stdout.write('=' * 70)
+
+        path = options['path'] or os.path.join(tempfile.mkdtemp(), 'index_benchmark.sqlite3')
+        create_sql, index_sql = self.collect_schema()
+        db = sqlite3.connect(path)
+        try:
+            for statement in create_sql:
+                db.execute(statement)
+
+            started = time.monotonic()
+            now = timezone.now()
+            self.seed(db, options['rows'], now)
+            self.stdout.write(f"• Seeded {options['rows']:,} rows per table in {time.monotonic() - started:.1f}s ({path})")
+            self.stdout.write('')
+
+            queries = self.hot_queries(now)
+            before = self.measure(db, queries, options['repeat'])
+
+            started = time.monotonic()
+            for statement in index_sql:
+                db.execute(statement)
+            db.execute('ANALYZE')
+            self.stdout.write(f'• Built {len(index_sql)} indexes in {time.monotonic() - started:.1f}s')
+            self.stdout.write('')
+
+            after = self.measure(db, queries, options['repeat'])
+        finally:
+            db.close()
+            if not options['path']:
+                os.remove(path)
+
+        for name, _, _ in queries:
+            (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+            speedup = ms_before / ms_after if ms_after > 0 else float('inf')
+            self.stdout.write(self.style.WARNING(f'🔎 {name}'))
+            self.stdout.write(f'    Before: {ms_before:9.2f} ms | {plan_before}')
+            self.stdout.write(f'    After:  {ms_after:9.2f} ms | {plan_after}')
+            self.stdout.write(f'    Speedup: {speedup:.1f}x')
+
+    def collect_schema(self):
+        """CREATE TABLE statements (with FK indexes) and the Meta.indexes statements, separately"""
+        index_names = {index.name for model in BENCHMARK_MODELS for index in model._meta.indexes}
+        with connection.schema_editor(collect_sql=True, atomic=False) as editor:
+            for model in BENCHMARK_MODELS:
+                editor.create_model(model)
+        create_sql, index_sql = [], []
+        for statement in editor.collected_sql:
+            statement = statement.rstrip(';')
+            if any(f'"{name}"' in statement for name in index_names):
+                index_sql.append(statement)
+            else:
+                create_sql.append(statement)
+        return create_sql, index_sql
+
+    def seed(self, db, rows, now):
+        """Insert rows per table with timestamps spread over SEED_SPAN"""
+        rng = random.Random(42)
+        span = int(SEED_SPAN.total_seconds())
+
+        def stamp():
+            return (now - timedelta(seconds=rng.randrange(span))).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+        def batches(make_row):
+            for start in range(0, rows, INSERT_BATCH):
+                yield [make_row(i) for i in range(start, min(start + INSERT_BATCH, rows))]
+
+        inserts = [
+            (
+                'INSERT INTO p2p_sync_localledgerblock (block_id, prev_hash, payload_hash, timestamp, signature, '
+                'device_id, lamport_clock, vector_clock_packed, is_synced, sync_attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                lambda i: (f'block_{i}', f'{i - 1:064x}', f'{i:064x}', stamp(), '', rng.randrange(SEED_DEVICES) + 1,
+                           i, b'', rng.random() < 0.95, 0),
+            ),
+            (
+                'INSERT INTO messaging_message (msg_id, sender_id, receiver_id, payload, timestamp, blockchain_tx, anomaly_flag) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                lambda i: (f'msg_{i}', rng.randrange(SEED_DEVICES) + 1, rng.randrange(SEED_DEVICES) + 1, 'payload',
+                           stamp(), None, rng.random() < 0.02),
+            ),
+            (
+                'INSERT INTO ai_anomaly_anomalyalert (message_id, alert_type, explanation, detected_at) VALUES (?, ?, ?, ?)',
+                lambda i: (rng.randrange(rows) + 1, 'pattern', '', stamp()),
+            ),
+            (
+                'INSERT INTO blockchain_blockchaintransaction (tx_hash, block_id, sender, receiver, payload_hash, timestamp, '
+                'signature, lamport_clock, vector_clock_packed, is_synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                lambda i: (f'tx_{i}', f'block_{i}', 'sender', 'broadcast', f'{i:064x}', stamp(), '', i, b'', True),
+            ),
+        ]
+        for sql, make_row in inserts:
+            for batch in batches(make_row):
+                db.executemany(sql, batch)
+            db.commit()
+
+    def hot_queries(self, now):
+        """(name, sql, params) for the ORM queries the indexes target"""
+        day_ago = now - timedelta(hours=24)
+        queries = [
+            ('Resync chunk (device, unsynced, lamport order)', LocalLedgerBlock.objects.filter(
+                device_id=7, is_synced=False).order_by('lamport_clock', 'pk')[:201], False),
+            ('Chain head seed (device latest block)', LocalLedgerBlock.objects.filter(
+                device_id=7).order_by('-timestamp', '-pk')[:1], False),
+            ('Pending sync count', LocalLedgerBlock.objects.filter(is_synced=False).values('pk'), True),
+            ('Message anomaly count', Message.objects.filter(anomaly_flag=True).values('pk'), True),
+            ('Messages in last 24h', Message.objects.filter(timestamp__gte=day_ago).values('pk'), True),
+            ('Recent messages page', Message.objects.order_by('-timestamp')[:50], False),
+            ('Alerts in last 24h', AnomalyAlert.objects.filter(detected_at__gte=day_ago).values('pk'), True),
+            ('Master ledger conflict window', BlockchainTransaction.objects.filter(
+                timestamp__gt=day_ago, timestamp__lt=day_ago + timedelta(seconds=2)), False),
+        ]
+        compiled = []
+        for name, queryset, count in queries:
+            sql, params = queryset.query.sql_with_params()
+            sql = sql.replace('%s', '?')
+            if count:
+                sql = f'SELECT COUNT(*) FROM ({sql})'
+            compiled.append((name, sql, params))
+        return compiled
+
+    def measure(self, db, queries, repeat):
+        """{name: (query plan, best latency in ms)}"""
+        results = {}
+        for name, sql, params in queries:
+            plan = ' / '.join(row[-1] for row in db.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+            best = None
+            for _ in range(max(1, repeat)):
+                started = time.perf_counter()
+                db.execute(sql, params).fetchall()
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (plan, best)
+        return results
@@ -0,0 +1,138 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from p2p_sync.anti_entropy import encode_message, decode_message
+from p2p_sync.wire import (
+    encode_envelope, decode_envelope, encode_block, decode_block, message_hash,
+    encode_batch, decode_batch, CodecSelector, CODEC_ZLIB, CODEC_LZMA
+)
+from datetime import timedelta
+import base64
+import hashlib
+import json
+import random
+import time
+
+SAMPLE_DEVICES = 20
+SIGNATURE_BYTES = 256  # RSA-2048 PSS signature
+
+
+class Command(BaseCommand):
+    help = 'Compare size and encode/decode speed of the binary wire format against JSON for P2P envelopes and ledger blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=10000, help='Sample records per kind (default 10,000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per codec; the best run is reported')
+        parser.add_argument('--batch', type=int, default=50, help='Envelopes per batch frame (default 50)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📡 OPERATION SainyaSecure - WIRE FORMAT BENCHMARK'))
+        self.stdout.write('=' * 70)
+
+        envelopes, blocks = self.samples(options['records'])
+        for name, records, codecs in [
+            ('Message envelopes', envelopes, [
+                ('JSON (sorted keys)', self.json_encode, json.loads),
+                ('JSON (compact)', encode_message, decode_message),
+                ('Binary v1', encode_envelope, decode_envelope),
+            ]),
+            ('Ledger blocks', blocks, [
+                ('JSON (sorted keys)', self.json_encode, json.loads),
+                ('JSON (compact)', encode_message, decode_message),
+                ('Binary v1', encode_block, decode_block),
+            ]),
+            ('Message hash form', envelopes, [
+                ('JSON (sorted keys)', self.json_hash, None),
+                ('Binary v1', message_hash, None),
+            ]),
+        ]:
+            self.stdout.write(self.style.WARNING(f'🔎 {name} ({len(records):,} records)'))
+            baseline = None
+            for label, encode, decode in codecs:
+                size, encode_us, decode_us = self.measure(records, encode, decode, options['repeat'])
+                baseline = baseline or size
+                line = f'    {label:<20} encode {encode_us:7.2f} µs'
+                if decode is not None:
+                    line += f' | decode {decode_us:7.2f} µs | {size:7.1f} B/record ({size / baseline:.0%})'
+                self.stdout.write(line)
+
+        self.report_batches(envelopes, options['batch'], options['repeat'])
+
+    def report_batches(self, envelopes, batch_size, repeat):
+        """Per-message size and cost of batch frames under each codec"""
+        encoded = [encode_envelope(envelope) for envelope in envelopes]
+        batches = [encoded[i:i + batch_size] for i in range(0, len(encoded), batch_size)]
+        baseline = sum(len(envelope) for envelope in encoded) / len(encoded)
+        self.stdout.write(self.style.WARNING(f'🔎 Batch frames ({len(batches):,} x {batch_size} envelopes)'))
+        self.stdout.write(f'    {"Unbatched binary":<20} {baseline:7.1f} B/message, {len(encoded):,} frames')
+        for label, encode in [
+            ('Batch, none', lambda batch: encode_batch(batch, ())),
+            ('Batch, zlib', lambda batch: encode_batch(batch, (CODEC_ZLIB,))),
+            ('Batch, lzma', lambda batch: encode_batch(batch, (CODEC_LZMA,))),
+            ('Batch, per link', CodecSelector().encode),
+        ]:
+            size, encode_us, decode_us = self.measure(batches, encode, decode_batch, repeat)
+            self.stdout.write(
+                f'    {label:<20} {size / batch_size:7.1f} B/message ({size / batch_size / baseline:.0%}) | '
+                f'encode {encode_us / batch_size:7.2f} µs | decode {decode_us / batch_size:7.2f} µs per message'
+            )
+
+    def json_encode(self, record):
+        return json.dumps(record, sort_keys=True).encode()
+
+    def json_hash(self, record):
+        return hashlib.sha256(json.dumps({
+            field: record[field] for field in ('sender', 'receiver', 'payload', 'timestamp')
+        }, sort_keys=True).encode()).hexdigest()
+
+    def samples(self, count):
+        """Envelopes and blocks shaped like the ones send_p2p_message/anti-entropy produce"""
+        rng = random.Random(42)
+        now = timezone.now()
+        devices = [f'DEVICE_{i:03d}' for i in range(SAMPLE_DEVICES)]
+        envelopes, blocks = [], []
+        prev_hash = 'genesis'
+        for i in range(count):
+            sender, receiver = rng.sample(devices, 2)
+            timestamp = (now - timedelta(seconds=rng.randrange(86400))).isoformat()
+            payload_hash = hashlib.sha256(str(i).encode()).hexdigest()
+            signature = base64.b64encode(rng.randbytes(SIGNATURE_BYTES)).decode()
+            clock = {device: rng.randrange(1, 5000) for device in rng.sample(devices, 4)}
+            envelopes.append({
+                'sender': sender,
+                'receiver': receiver,
+                'payload': f'Move to grid {rng.randrange(10000):04d} at {rng.randrange(24):02d}00 hours',
+                'timestamp': timestamp,
+                'payload_hash': payload_hash,
+                'signature': signature,
+                'lamport_clock': 1000 + i,
+                'vector_clock': clock
+            })
+            blocks.append({
+                'block_id': f'block_{payload_hash[:16]}',
+                'prev_hash': prev_hash,
+                'payload_hash': payload_hash,
+                'signature': signature,
+                'device_id': sender,
+                'lamport_clock': 1000 + i,
+                'vector_clock': clock,
+                'timestamp': timestamp
+            })
+            prev_hash = payload_hash
+        return envelopes, blocks
+
+    def measure(self, records, encode, decode, repeat):
+        """(mean encoded size, best mean encode µs, best mean decode µs)"""
+        best_encode = best_decode = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            encoded = [encode(record) for record in records]
+            elapsed = (time.perf_counter() - started) / len(records) * 1e6
+            best_encode = elapsed if best_encode is None else min(best_encode, elapsed)
+            if decode is not None:
+                started = time.perf_counter()
+                for data in encoded:
+                    decode(data)
+                elapsed = (time.perf_counter() - started) / len(records) * 1e6
+                best_decode = elapsed if best_decode is None else min(best_decode, elapsed)
+        size = sum(len(data) for data in encoded) / len(records)
+        return size, best_encode, best_decode
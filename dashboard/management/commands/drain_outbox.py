@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from p2p_sync.p2p_comm import p2p_manager
+import time
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending P2P outbox messages (resumes after a crash); runs until interrupted unless --once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one drain pass, wait --wait seconds for acks, then exit')
+        parser.add_argument('--wait', type=float, default=5.0, help='Seconds to wait for acks with --once (default 5)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📬 OPERATION SainyaSecure - P2P OUTBOX DRAINER'))
+        self.stdout.write('=' * 70)
+
+        outbox = p2p_manager.outbox
+        stats = outbox.pending_counts()
+        self.stdout.write(f"• Pending: {stats['pending']} ({stats['due']} due now)")
+
+        try:
+            if options['once']:
+                result = outbox.drain()
+                self.stdout.write(f"• Queued {result['queued']} of {result['due']} due messages")
+                time.sleep(options['wait'])
+            else:
+                outbox.start()
+                self.stdout.write('• Drainer running, Ctrl+C to stop')
+                while True:
+                    time.sleep(60)
+                    stats = outbox.pending_counts()
+                    self.stdout.write(f"  Pending: {stats['pending']} ({stats['due']} due)")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            outbox.stop()
+            p2p_manager.transport.stop()
+
+        stats = outbox.pending_counts()
+        self.stdout.write(self.style.SUCCESS(f"• Stopped with {stats['pending']} pending"))
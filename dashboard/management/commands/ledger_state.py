@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from users.models import Device
+from p2p_sync.state_history import state_history, BLOCK_LIST_SIZE
+from dashboard.views import parse_replay_time
+import time
+
+
+class Command(BaseCommand):
+    help = ('Show ledger state (mode, per-device block counts) at a past instant, take a state snapshot, '
+            'or keep snapshots current with --watch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='ISO datetime to reconstruct (default now; naive values are server time)')
+        parser.add_argument('--device', help='Also list this device_id\'s blocks at that instant')
+        parser.add_argument('--limit', type=int, default=BLOCK_LIST_SIZE,
+                            help=f'Blocks listed with --device (default {BLOCK_LIST_SIZE})')
+        parser.add_argument('--snapshot', action='store_true', help='Take a snapshot now and exit')
+        parser.add_argument('--watch', action='store_true',
+                            help='Take snapshots whenever one is due, until interrupted (run this under the process manager)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('⏪ OPERATION SainyaSecure - LEDGER STATE HISTORY'))
+        self.stdout.write('=' * 70)
+
+        if options['snapshot']:
+            snapshot = state_history.take_snapshot()
+            self.stdout.write(self.style.SUCCESS(
+                f'• Snapshot {snapshot.pk} at {snapshot.taken_at.isoformat()} ({len(snapshot.devices)} devices)'
+            ))
+            return
+        if options['watch']:
+            self.watch()
+            return
+
+        try:
+            at = parse_replay_time(options['at']) or timezone.now()
+            started = time.perf_counter()
+            state = state_history.state_at(at)
+            elapsed = (time.perf_counter() - started) * 1000
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"• State at {at.isoformat()} | mode: {state['mode'].upper()}")
+        self.stdout.write(
+            f"• From snapshot {state['snapshot']['id']} ({state['snapshot']['taken_at'].isoformat()}) "
+            f"+ {state['replayed_deltas']} deltas in {elapsed:.1f} ms"
+        )
+        totals = state['totals']
+        self.stdout.write(f"• Blocks: {totals['total']} | Synced: {totals['synced']} | Pending: {totals['pending']}")
+
+        self.stdout.write('')
+        self.stdout.write(self.style.WARNING('🔎 Devices'))
+        for device in state['devices']:
+            if options['device'] and device['device_id'] != options['device']:
+                continue
+            self.stdout.write(
+                f"  {device['device_id']:<24} blocks {device['total']:>8} | synced {device['synced']:>8} | "
+                f"pending {device['pending']:>8}"
+            )
+
+        if options['device']:
+            device = Device.objects.filter(device_id=options['device']).first()
+            if device is None:
+                raise CommandError(f"unknown device: {options['device']!r}")
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING(f"🔎 Newest blocks of {options['device']}"))
+            for block in state_history.device_blocks_at(device, at, limit=options['limit']):
+                status = 'synced' if block['synced'] else 'pending'
+                self.stdout.write(f"  {block['timestamp'].isoformat()} {block['block_id'][:32]:<32} {status}")
+
+    def watch(self):
+        interval = min(60, settings.LEDGER_SNAPSHOT_INTERVAL)
+        self.stdout.write(
+            f'• Snapshotting every {settings.LEDGER_SNAPSHOT_INTERVAL}s or {settings.LEDGER_SNAPSHOT_MAX_DELTAS} '
+            'deltas, Ctrl+C to stop'
+        )
+        try:
+            while True:
+                snapshot = state_history.snapshot_if_due()
+                if snapshot is not None:
+                    self.stdout.write(f'  Snapshot {snapshot.pk} at {snapshot.taken_at.isoformat()}')
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+from blockchain.views import CommandCenterStatusView
+from dashboard.stats import dashboard_stats
+from dashboard.views import dashboard_stats_api
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import time
+
+# CONN_MAX_AGE per mode: 0 reopens the database on every request, like the old
+# per-view sqlite3.connect('db.sqlite3'); 60 reuses each worker's connection
+MODES = [('connect per request', 0), ('persistent connection', 60)]
+
+
+class Command(BaseCommand):
+    help = 'Load test dashboard_stats_api and CommandCenterStatusView with and without persistent DB connections (p50/p99)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint per mode (default 2000)')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Worker threads (default 1); threads share the GIL, so p99 above 1 mostly measures scheduling')
+        parser.add_argument('--warmup', type=int, default=50, help='Untimed requests per worker first (default 50)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('⏱️  OPERATION SainyaSecure - DASHBOARD LOAD TEST'))
+        self.stdout.write('=' * 70)
+        self.stdout.write(
+            f"• {options['requests']} requests per endpoint per mode, {options['concurrency']} workers, "
+            f"{connection.vendor} at {connection.settings_dict['NAME']}"
+        )
+
+        factory = APIRequestFactory()
+        user = User(username='loadtest')  # Unsaved: satisfies IsAuthenticated without touching auth tables
+        command_center = CommandCenterStatusView.as_view()
+
+        def stats_request():
+            dashboard_stats.invalidate()  # Measure the query, not the cached snapshot
+            return dashboard_stats_api(factory.get('/dashboard/api/stats/'))
+
+        def command_center_request():
+            request = factory.get('/blockchain/command-center/')
+            force_authenticate(request, user=user)
+            return command_center(request)
+
+        endpoints = [('dashboard_stats_api', stats_request), ('CommandCenterStatusView', command_center_request)]
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for name, view in endpoints:
+                self.stdout.write('')
+                self.stdout.write(self.style.WARNING(f'🔎 {name}'))
+                results = {}
+                for mode, conn_max_age in MODES:
+                    # Wrappers in every thread share this settings dict
+                    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+                    results[mode] = self.run(view, options)
+                    p50, p99, rps = results[mode]
+                    self.stdout.write(f'    {mode:<22} p50 {p50:7.3f} ms | p99 {p99:7.3f} ms | {rps:8.0f} req/s')
+                (slow_p50, slow_p99, _), (fast_p50, fast_p99, _) = results[MODES[0][0]], results[MODES[1][0]]
+                self.stdout.write(
+                    f'    Persistent connections: p50 {slow_p50 / fast_p50:.1f}x, p99 {slow_p99 / fast_p99:.1f}x faster'
+                )
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+
+    def run(self, view, options):
+        """(p50 ms, p99 ms, requests/s) for view under options['concurrency'] workers"""
+        workers = max(1, options['concurrency'])
+        per_worker = max(1, options['requests'] // workers)
+
+        def request(timings=None):
+            # Mirror the handler's lifecycle: close_old_connections runs on both signals
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            try:
+                response = view()
+                if response.status_code != 200:
+                    raise RuntimeError(f'status {response.status_code}')
+            finally:
+                request_finished.send(sender=self.__class__)
+            if timings is not None:
+                timings.append((time.perf_counter() - started) * 1000)
+
+        def worker(_):
+            timings = []
+            try:
+                for _ in range(options['warmup']):
+                    request()
+                for _ in range(per_worker):
+                    request(timings)
+            finally:
+                connection.close()
+            return timings
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timings = [ms for result in pool.map(worker, range(workers)) for ms in result]
+        percentiles = statistics.quantiles(timings, n=100)
+        return percentiles[49], percentiles[98], workers * 1000 / statistics.mean(timings)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from p2p_sync.ledger_stats import ledger_stats
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recount local ledger blocks per device and correct drifted pending/total counters (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🧮 OPERATION SainyaSecure - LEDGER COUNTER RECONCILIATION'))
+        self.stdout.write('=' * 70)
+
+        started = time.monotonic()
+        corrections = ledger_stats.reconcile()
+        elapsed = time.monotonic() - started
+
+        for correction in corrections:
+            before = correction['before']
+            before_text = f'{before[0]} total / {before[1]} pending' if before else 'no counters'
+            after = correction['after']
+            self.stdout.write(self.style.WARNING(
+                f"  🟡 Device #{correction['device_pk']} | {before_text} -> {after[0]} total / {after[1]} pending"
+            ))
+
+        totals = ledger_stats.totals()
+        self.stdout.write('')
+        self.stdout.write(f"• Blocks: {totals['total']} total, {totals['pending']} pending sync")
+        if corrections:
+            self.stdout.write(self.style.WARNING(f'• Corrected {len(corrections)} devices in {elapsed:.2f}s'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'• All counters accurate ({elapsed:.2f}s)'))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from p2p_sync.chain_verifier import chain_verifier
+import time
+
+
+class Command(BaseCommand):
+    help = 'Verify local ledger chain integrity per device, resuming from stored checkpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--device',
+            action='append',
+            dest='devices',
+            help='Only verify this device_id (repeatable)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-verify every chain from genesis and audit stored checkpoints',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🔗 OPERATION SainyaSecure - LEDGER CHAIN VERIFICATION'))
+        self.stdout.write('=' * 70)
+        mode = 'Full audit from genesis' if options['full'] else 'Incremental from checkpoints'
+        self.stdout.write(f'Mode: {mode}')
+        self.stdout.write('')
+
+        started = time.monotonic()
+        total_verified = 0
+        broken = 0
+
+        for result in chain_verifier.verify_all(device_ids=options['devices'], full=options['full']):
+            total_verified += result['verified_blocks']
+            if result['status'] == 'ok':
+                self.stdout.write(
+                    f"  🟢 {result['device_id']} | +{result['verified_blocks']} blocks | "
+                    f"Height: {result['height']} | Digest: {result['chain_digest'][:16]}..."
+                )
+            else:
+                broken += 1
+                failure = result['failure']
+                self.stdout.write(self.style.ERROR(
+                    f"  🔴 {result['device_id']} | {failure['reason']} at height {failure['height']} "
+                    f"(block {failure['block_id']})"
+                ))
+
+        elapsed = time.monotonic() - started
+        rate = total_verified / elapsed if elapsed > 0 else 0
+        self.stdout.write('')
+        self.stdout.write(f'• Blocks verified: {total_verified} in {elapsed:.2f}s ({rate:.0f} blocks/s)')
+        if broken:
+            self.stdout.write(self.style.ERROR(f'• Broken chains: {broken}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('• All chains intact'))
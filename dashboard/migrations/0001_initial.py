@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('message', 'Message'), ('blockchain', 'Blockchain')], max_length=16)),
+                ('ref', models.CharField(max_length=128)),
+                ('timestamp', models.DateTimeField()),
+                ('from_device', models.CharField(blank=True, default='', max_length=128)),
+                ('to_device', models.CharField(blank=True, default='', max_length=128)),
+                ('anomaly', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp'], name='timeline_ts_idx'), models.Index(fields=['from_device', 'timestamp'], name='timeline_from_ts_idx'), models.Index(fields=['to_device', 'timestamp'], name='timeline_to_ts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'ref'), name='timeline_kind_ref_uniq')],
+            },
+        ),
+    ]
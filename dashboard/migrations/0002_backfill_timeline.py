@@ -0,0 +1,90 @@
+from datetime import timezone as dt_timezone
+from django.db import migrations
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+CHUNK_SIZE = 2000
+# Script-managed tables without models (see blockchain.models)
+MASTER_LEDGER_TABLE = 'blockchain_masterledger'
+LEDGER_DEVICE_TABLE = 'blockchain_device'
+
+
+def as_utc(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+
+
+def backfill_timeline(apps, schema_editor):
+    """Timeline events for rows written before the timeline existed, as dashboard.timeline.backfill() writes them"""
+    TimelineEvent = apps.get_model('dashboard', 'TimelineEvent')
+    Message = apps.get_model('messaging', 'Message')
+    BlockchainTransaction = apps.get_model('blockchain', 'BlockchainTransaction')
+    LocalLedgerBlock = apps.get_model('p2p_sync', 'LocalLedgerBlock')
+    alias = schema_editor.connection.alias
+
+    messages = Message.objects.using(alias).order_by('pk').values_list(
+        'msg_id', 'timestamp', 'sender__device_id', 'receiver__device_id', 'anomaly_flag'
+    )
+    for start in range(0, messages.count(), CHUNK_SIZE):
+        TimelineEvent.objects.using(alias).bulk_create([
+            TimelineEvent(kind='message', ref=msg_id, timestamp=timestamp, from_device=sender,
+                          to_device=receiver, anomaly=anomaly)
+            for msg_id, timestamp, sender, receiver, anomaly in messages[start:start + CHUNK_SIZE]
+        ], ignore_conflicts=True)
+
+    transactions = BlockchainTransaction.objects.using(alias).order_by('pk').values_list(
+        'tx_hash', 'block_id', 'timestamp', 'sender', 'receiver'
+    )
+    for start in range(0, transactions.count(), CHUNK_SIZE):
+        chunk = list(transactions[start:start + CHUNK_SIZE])
+        # Merged transactions name their sender by Device pk; show the local block's device_id
+        senders = dict(LocalLedgerBlock.objects.using(alias).filter(
+            block_id__in=[block_id for _, block_id, _, _, _ in chunk]
+        ).values_list('block_id', 'device__device_id'))
+        TimelineEvent.objects.using(alias).bulk_create([
+            TimelineEvent(
+                kind='blockchain', ref=tx_hash, timestamp=timestamp, to_device=receiver,
+                from_device=senders.get(block_id, sender) if tx_hash == f'tx_{block_id}' else sender
+            )
+            for tx_hash, block_id, timestamp, sender, receiver in chunk
+        ], ignore_conflicts=True)
+
+    connection = schema_editor.connection
+    if MASTER_LEDGER_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT bl.tx_hash, bl.timestamp, fd.device_id, td.device_id, bl.from_device_id, bl.to_device_id
+            FROM {MASTER_LEDGER_TABLE} bl
+            LEFT JOIN {LEDGER_DEVICE_TABLE} fd ON bl.from_device_id = fd.id
+            LEFT JOIN {LEDGER_DEVICE_TABLE} td ON bl.to_device_id = td.id
+        """)
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            TimelineEvent.objects.using(alias).bulk_create([
+                TimelineEvent(
+                    kind='blockchain',
+                    ref=row[0],
+                    timestamp=as_utc(row[1]),
+                    from_device=row[2] or str(row[4] or ''),
+                    to_device=row[3] or str(row[5] or '')
+                )
+                for row in rows
+            ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('messaging', '0003_message_device_ts_indexes'),
+        ('blockchain', '0003_hot_query_indexes'),
+        ('p2p_sync', '0009_ledger_state_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timeline, migrations.RunPython.noop),
+    ]
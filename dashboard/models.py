@@ -1,5 +1,32 @@
 from django.db import models
 
-# Placeholder for dashboard models (extend as needed)
 
-# Create your models here.
+class TimelineEvent(models.Model):
+	"""
+	Audit timeline row for one message or master ledger entry, appended in the
+	writer's transaction (see dashboard.timeline). Only anomaly is updated later.
+	"""
+	KIND_CHOICES = [
+		('message', 'Message'),
+		('blockchain', 'Blockchain'),
+	]
+
+	kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+	ref = models.CharField(max_length=128)  # msg_id or tx_hash
+	timestamp = models.DateTimeField()
+	from_device = models.CharField(max_length=128, blank=True, default='')
+	to_device = models.CharField(max_length=128, blank=True, default='')
+	anomaly = models.BooleanField(default=False)
+
+	class Meta:
+		constraints = [
+			# Appends and backfills are idempotent
+			models.UniqueConstraint(fields=['kind', 'ref'], name='timeline_kind_ref_uniq'),
+		]
+		indexes = [
+			# Replay pages: (timestamp, id) keyset over a time range
+			models.Index(fields=['timestamp'], name='timeline_ts_idx'),
+			# Per-device replay, one index per direction
+			models.Index(fields=['from_device', 'timestamp'], name='timeline_from_ts_idx'),
+			models.Index(fields=['to_device', 'timestamp'], name='timeline_to_ts_idx'),
+		]
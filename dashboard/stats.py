@@ -0,0 +1,114 @@
+"""
+Aggregate counters for the dashboard polling endpoints
+Every counter comes from one SELECT (conditional aggregation plus scalar
+subqueries), shared by all pollers for DASHBOARD_STATS_TTL seconds.
+"""
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.utils import timezone
+from datetime import timedelta
+from messaging.models import Message
+from users.models import Device
+from blockchain.models import BlockchainTransaction, MASTER_LEDGER_TABLE, COMMAND_CENTER_TABLE
+from p2p_sync.models import ChainHead
+from ai_anomaly.models import AnomalyAlert
+import threading
+import time
+
+
+class DashboardStats:
+    """
+    Counters computed together and cached per worker. A poller that finds the
+    snapshot stale takes the lock and recomputes; pollers arriving meanwhile
+    wait on the lock and reuse its result, so a burst costs one query.
+    Local ledger totals are the ChainHead counters (see LedgerStats); a
+    missing command-center table reads as 0 / 'normal'.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = settings.DASHBOARD_STATS_TTL if ttl is None else ttl
+        self._snapshot = None  # (time.monotonic(), counters)
+        self._tables = None  # Optional tables present, checked once per worker
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current counters (a shared dict; do not modify)"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot[0] < self.ttl:
+            return snapshot[1]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot[0] < self.ttl:
+                return snapshot[1]
+            counters = self.compute()
+            self._snapshot = (time.monotonic(), counters)
+            return counters
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def compute(self):
+        """Run the aggregate query; rechecks the optional tables if one was dropped"""
+        if self._tables is None:
+            self._tables = self._optional_tables()
+        try:
+            return self._query()
+        except OperationalError:
+            tables = self._optional_tables()
+            if tables == self._tables:
+                raise
+            self._tables = tables
+            return self._query()
+
+    def _optional_tables(self):
+        present = set(connection.introspection.table_names())
+        return frozenset(table for table in (MASTER_LEDGER_TABLE, COMMAND_CENTER_TABLE) if table in present)
+
+    def _query(self):
+        now = timezone.now()
+        day_ago = connection.ops.adapt_datetimefield_value(now - timedelta(hours=24))
+        master_ledger = (
+            f'(SELECT COUNT(*) FROM {MASTER_LEDGER_TABLE})' if MASTER_LEDGER_TABLE in self._tables else '0'
+        )
+        current_mode = (
+            f'(SELECT current_mode FROM {COMMAND_CENTER_TABLE} LIMIT 1)' if COMMAND_CENTER_TABLE in self._tables
+            else 'NULL'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT
+                    m.total, m.anomalies, m.recent,
+                    (SELECT COUNT(*) FROM {BlockchainTransaction._meta.db_table}),
+                    {master_ledger},
+                    l.total, l.pending,
+                    (SELECT COUNT(*) FROM {Device._meta.db_table}),
+                    a.total, a.recent,
+                    {current_mode}
+                FROM
+                    (SELECT COUNT(*) AS total,
+                            COUNT(CASE WHEN anomaly_flag THEN 1 END) AS anomalies,
+                            COUNT(CASE WHEN timestamp >= %s THEN 1 END) AS recent
+                     FROM {Message._meta.db_table}) m,
+                    (SELECT COALESCE(SUM(height), 0) AS total, COALESCE(SUM(pending_blocks), 0) AS pending
+                     FROM {ChainHead._meta.db_table}) l,
+                    (SELECT COUNT(*) AS total,
+                            COUNT(CASE WHEN detected_at >= %s THEN 1 END) AS recent
+                     FROM {AnomalyAlert._meta.db_table}) a
+            """, [day_ago, day_ago])
+            row = cursor.fetchone()
+        return {
+            'messages': {'total': row[0], 'anomalies': row[1], 'recent_24h': row[2]},
+            'blockchain': {
+                'transactions': row[3],
+                'master_ledger': row[4],
+                'local_blocks': row[5],
+                'pending_sync': row[6]
+            },
+            'devices': {'total': row[7]},
+            'alerts': {'total': row[8], 'recent': row[9]},
+            'current_mode': row[10] or 'normal',
+            'computed_at': now
+        }
+
+# Singleton instance
+dashboard_stats = DashboardStats()
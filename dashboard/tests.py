@@ -1,3 +1,107 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from users.models import Device
+from messaging.models import Message
+from p2p_sync.blockchain_sync import blockchain_sync
+from p2p_sync.models import LocalLedgerBlock
+from .consumers import ActivityFeedConsumer
+from .feed import matches
+from .models import TimelineEvent
+from .timeline import timeline
 
-# Create your tests here.
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class TimelineMergeTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create(username='timeline_owner')
+        # A digit-only device_id must not be mistaken for another device's pk
+        Device.objects.create(device_id='unit_x', owner=owner, public_key='mock_key_unit_x')
+        self.devices = [
+            Device.objects.create(device_id=device_id, owner=owner, public_key=f'mock_key_{device_id}')
+            for device_id in ('1', 'unit_b')
+        ]
+        self.blocks = [
+            LocalLedgerBlock.objects.create(
+                block_id=f'block_{device.device_id}', prev_hash='genesis', payload_hash=f'{index:064x}',
+                signature='', device=device
+            )
+            for index, device in enumerate(self.devices)
+        ]
+
+    def senders(self):
+        return dict(TimelineEvent.objects.filter(kind='blockchain').values_list('ref', 'from_device'))
+
+    def test_merged_blocks_show_sending_device_id(self):
+        with transaction.atomic():
+            blockchain_sync.merge_blocks(self.blocks)
+
+        expected = {f'tx_{block.block_id}': block.device.device_id for block in self.blocks}
+        self.assertEqual(self.senders(), expected)
+
+        TimelineEvent.objects.all().delete()
+        timeline.backfill()
+        self.assertEqual(self.senders(), expected)
+
+
+class ActivityFilterTests(SimpleTestCase):
+    event = {'type': 'Message', 'from_device': 'unit_a', 'to_device': 'unit_b', 'status': 'Anomaly'}
+
+    def test_matches(self):
+        self.assertTrue(matches(self.event))
+        self.assertTrue(matches(self.event, from_device='unit_a', to_device='unit_b', activity_type='Message'))
+        self.assertFalse(matches(self.event, from_device='unit_b'))
+        self.assertFalse(matches(self.event, to_device='unit_a'))
+        self.assertFalse(matches(self.event, activity_type='Blockchain'))
+        # 'Anomaly' selects anomalous messages as well as alerts
+        self.assertTrue(matches(self.event, activity_type='Anomaly'))
+        self.assertFalse(matches({**self.event, 'status': 'Secure'}, activity_type='Anomaly'))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class ActivityFeedConsumerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='feed_owner')
+        cls.unit_a = Device.objects.create(device_id='unit_a', owner=owner, public_key='mock_key_unit_a')
+        cls.unit_b = Device.objects.create(device_id='unit_b', owner=owner, public_key='mock_key_unit_b')
+
+    async def connect(self, query=''):
+        communicator = WebsocketCommunicator(ActivityFeedConsumer.as_asgi(), f'/ws/dashboard/activity/?{query}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def send_message(self, msg_id, sender, receiver):
+        """Save a message and return the on_commit callbacks it queued, without running them"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            Message.objects.create(msg_id=msg_id, sender=sender, receiver=receiver, payload='attack at dawn')
+        return callbacks
+
+    async def test_events_are_published_after_commit_and_filtered(self):
+        await get_channel_layer().flush()
+        from_a = await self.connect('from_device=unit_a')
+        blocks_only = await self.connect('type=Blockchain')
+
+        callbacks = await sync_to_async(self.send_message)('msg_from_a', self.unit_a, self.unit_b)
+        self.assertTrue(await from_a.receive_nothing())
+
+        for callback in callbacks:
+            await sync_to_async(callback)()
+        event = await from_a.receive_json_from()
+        self.assertEqual((event['type'], event['msg_id'], event['from_device']), ('Message', 'msg_from_a', 'unit_a'))
+        self.assertTrue(await blocks_only.receive_nothing())
+
+        callbacks = await sync_to_async(self.send_message)('msg_from_b', self.unit_b, self.unit_a)
+        for callback in callbacks:
+            await sync_to_async(callback)()
+        self.assertTrue(await from_a.receive_nothing())
+
+        await from_a.disconnect()
+        await blocks_only.disconnect()
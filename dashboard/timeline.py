@@ -0,0 +1,173 @@
+"""
+Materialized audit timeline behind AuditReplayView
+Messages and master ledger entries append a TimelineEvent as they are
+written, so replay pages walk the timeline's timestamp indexes instead of
+sorting both source tables on every call.
+"""
+from django.db import connection
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from messaging.models import Message
+from blockchain.models import BlockchainTransaction, MASTER_LEDGER_TABLE
+from p2p_sync.models import LocalLedgerBlock
+from p2p_sync.signals import transactions_merged
+from .models import TimelineEvent
+from .activity import as_utc, decode_cursor, encode_cursor
+import heapq
+import itertools
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+BACKFILL_CHUNK_SIZE = 2000
+
+
+class Timeline:
+    """
+    Writes go through record_*() (bulk, ignore_conflicts on (kind, ref)), so
+    backfill() can run at any time. replay() pages by a (timestamp, id)
+    keyset in either direction; a device filter reads the from- and
+    to-device indexes separately and merges them, avoiding an OR that
+    would sort the whole range.
+    """
+
+    def record_messages(self, messages):
+        TimelineEvent.objects.bulk_create([
+            TimelineEvent(
+                kind='message',
+                ref=message.msg_id,
+                timestamp=message.timestamp,
+                from_device=message.sender.device_id,
+                to_device=message.receiver.device_id,
+                anomaly=message.anomaly_flag
+            )
+            for message in messages
+        ], ignore_conflicts=True)
+
+    def record_transactions(self, transactions, sender_device_ids=None):
+        """sender_device_ids: device_id shown as each transaction's sender (default tx.sender)"""
+        if sender_device_ids is None:
+            sender_device_ids = [tx.sender for tx in transactions]
+        TimelineEvent.objects.bulk_create([
+            TimelineEvent(
+                kind='blockchain',
+                ref=tx.tx_hash,
+                timestamp=tx.timestamp,
+                from_device=sender_device_id,
+                to_device=tx.receiver
+            )
+            for tx, sender_device_id in zip(transactions, sender_device_ids)
+        ], ignore_conflicts=True)
+
+    def set_anomaly(self, msg_id, anomaly):
+        TimelineEvent.objects.filter(kind='message', ref=msg_id).exclude(anomaly=anomaly).update(anomaly=anomaly)
+
+    def backfill(self, chunk_size=BACKFILL_CHUNK_SIZE):
+        """Append events for rows written before the timeline existed; returns {'message', 'blockchain'} counts"""
+        before = {kind: TimelineEvent.objects.filter(kind=kind).count() for kind in ('message', 'blockchain')}
+        messages = Message.objects.select_related('sender', 'receiver').order_by('pk')
+        for chunk in chunked(messages.iterator(chunk_size=chunk_size), chunk_size):
+            self.record_messages(chunk)
+        for chunk in chunked(BlockchainTransaction.objects.order_by('pk').iterator(chunk_size=chunk_size), chunk_size):
+            self.record_transactions(chunk, self._merged_sender_device_ids(chunk))
+        if MASTER_LEDGER_TABLE in connection.introspection.table_names():
+            self._backfill_legacy_ledger(chunk_size)
+        return {
+            kind: TimelineEvent.objects.filter(kind=kind).count() - count
+            for kind, count in before.items()
+        }
+
+    def _merged_sender_device_ids(self, transactions):
+        """Sending device_id of each transaction, read from the local block it was merged from when there is one"""
+        senders = dict(LocalLedgerBlock.objects.filter(
+            block_id__in=[tx.block_id for tx in transactions]
+        ).values_list('block_id', 'device__device_id'))
+        return [
+            senders.get(tx.block_id, tx.sender) if tx.tx_hash == f'tx_{tx.block_id}' else tx.sender
+            for tx in transactions
+        ]
+
+    def _backfill_legacy_ledger(self, chunk_size):
+        """Rows of the script-managed blockchain_masterledger table, which has no model"""
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT bl.tx_hash, bl.timestamp, fd.device_id, td.device_id, bl.from_device_id, bl.to_device_id
+                FROM {MASTER_LEDGER_TABLE} bl
+                LEFT JOIN blockchain_device fd ON bl.from_device_id = fd.id
+                LEFT JOIN blockchain_device td ON bl.to_device_id = td.id
+            """)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                TimelineEvent.objects.bulk_create([
+                    TimelineEvent(
+                        kind='blockchain',
+                        ref=row[0],
+                        timestamp=as_utc(row[1]),
+                        from_device=row[2] or str(row[4] or ''),
+                        to_device=row[3] or str(row[5] or '')
+                    )
+                    for row in rows
+                ], ignore_conflicts=True)
+
+    def replay(self, start=None, end=None, device=None, cursor=None, limit=PAGE_SIZE, ascending=False):
+        """
+        (events, cursor for the next page or None) in [start, end), newest
+        first unless ascending; device matches either end of the event
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        events = TimelineEvent.objects.all()
+        if start is not None:
+            events = events.filter(timestamp__gte=start)
+        if end is not None:
+            events = events.filter(timestamp__lt=end)
+        if cursor:
+            timestamp, _, pk = decode_cursor(cursor)
+            # A range on the timestamp index, then the id tie-break
+            if ascending:
+                events = events.filter(timestamp__gte=timestamp).exclude(timestamp=timestamp, pk__lte=pk)
+            else:
+                events = events.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, pk__gte=pk)
+        order = ('timestamp', 'pk') if ascending else ('-timestamp', '-pk')
+
+        if device:
+            streams = [
+                list(events.filter(from_device=device).order_by(*order)[:limit + 1]),
+                list(events.filter(to_device=device).exclude(from_device=device).order_by(*order)[:limit + 1])
+            ]
+        else:
+            streams = [list(events.order_by(*order)[:limit + 1])]
+        merged = heapq.merge(*streams, key=lambda event: (event.timestamp, event.pk), reverse=not ascending)
+        page = list(itertools.islice(merged, limit))
+        more = sum(len(stream) for stream in streams) > len(page)
+        return page, encode_cursor((page[-1].timestamp, 0, page[-1].pk)) if more else None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+@receiver(post_save, sender=Message, dispatch_uid='timeline_message')
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        timeline.record_messages([instance])
+    else:
+        timeline.set_anomaly(instance.msg_id, instance.anomaly_flag)
+
+
+@receiver(post_save, sender=BlockchainTransaction, dispatch_uid='timeline_transaction')
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.record_transactions([instance])
+
+
+@receiver(transactions_merged, dispatch_uid='timeline_merge')
+def transactions_merged_into_ledger(sender, transactions, sender_device_ids, **kwargs):
+    timeline.record_transactions(transactions, sender_device_ids)
+
+# Singleton instance
+timeline = Timeline()
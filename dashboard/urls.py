@@ -11,6 +11,7 @@ urlpatterns = [
     # API endpoints
     path('summary/', views.DashboardSummaryView.as_view(), name='dashboard-summary'),
     path('audit-replay/', views.AuditReplayView.as_view(), name='audit-replay'),
+    path('audit-state/', views.AuditStateView.as_view(), name='audit-state'),
     path('system-status/', views.SystemStatusView.as_view(), name='system-status'),
     
     # Simple API functions
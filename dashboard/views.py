@@ -6,38 +6,41 @@ from django.http import JsonResponse
 from django.views.generic import TemplateView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from django.db.models import Count
+from django.utils.dateparse import parse_datetime
+from django.db import connection
 from messaging.models import Message
 from users.models import Device
 from blockchain.models import BlockchainTransaction
-from p2p_sync.models import LocalLedgerBlock
-from ai_anomaly.models import AnomalyAlert
-import sqlite3
+from p2p_sync.state_history import state_history, BLOCK_LIST_SIZE
+from .stats import dashboard_stats
+from .activity import activity_query, PAGE_SIZE
+from .timeline import timeline, PAGE_SIZE as TIMELINE_PAGE_SIZE
 
 # Dashboard endpoints
 class DashboardSummaryView(APIView):
 	permission_classes = [IsAuthenticated]
 	def get(self, request):
 		# Aggregate messages, blocks, alerts, connectivity status
+		stats = dashboard_stats.get()
 		summary_data = {
 			'messages': {
-				'total': Message.objects.count(),
-				'recent_24h': Message.objects.filter(timestamp__gte=timezone.now() - timezone.timedelta(hours=24)).count(),
-				'anomalies': Message.objects.filter(anomaly_flag=True).count()
+				'total': stats['messages']['total'],
+				'recent_24h': stats['messages']['recent_24h'],
+				'anomalies': stats['messages']['anomalies']
 			},
 			'blockchain': {
-				'transactions': BlockchainTransaction.objects.count(),
-				'local_blocks': LocalLedgerBlock.objects.count(),
-				'pending_sync': LocalLedgerBlock.objects.filter(is_synced=False).count()
+				'transactions': stats['blockchain']['transactions'],
+				'local_blocks': stats['blockchain']['local_blocks'],
+				'pending_sync': stats['blockchain']['pending_sync']
 			},
 			'devices': {
-				'total': Device.objects.count(),
-				'active': Device.objects.count(),  # Mock - all devices as active
+				'total': stats['devices']['total'],
+				'active': stats['devices']['total'],  # Mock - all devices as active
 				'online': 0  # Mock - no real-time status yet
 			},
 			'alerts': {
-				'total': AnomalyAlert.objects.count(),
-				'recent': AnomalyAlert.objects.filter(detected_at__gte=timezone.now() - timezone.timedelta(hours=24)).count()
+				'total': stats['alerts']['total'],
+				'recent': stats['alerts']['recent']
 			}
 		}
 		return Response({'summary': summary_data})
@@ -46,60 +49,89 @@ class DashboardSummaryView(APIView):
 class AuditReplayView(APIView):
 	permission_classes = [IsAuthenticated]
 	def get(self, request):
-		# Return timeline of past messages/blocks
+		"""
+		Page through the audit timeline, newest first (order=asc to replay
+		forward). Filters: start/end (ISO datetimes, end exclusive), device
+		(either end); pass next_cursor back as cursor for the next page.
+		"""
 		try:
-			conn = sqlite3.connect('db.sqlite3')
-			cursor = conn.cursor()
-			
-			# Get combined timeline from messages and blockchain entries
-			cursor.execute("""
-				SELECT 'message' as type, msg_id as id, timestamp, sender_id, receiver_id, anomaly_flag
-				FROM messaging_message
-				UNION ALL
-				SELECT 'blockchain' as type, tx_hash as id, timestamp, from_device_id, to_device_id, NULL
-				FROM blockchain_masterledger
-				ORDER BY timestamp DESC
-				LIMIT 50
-			""")
-			
-			timeline_data = []
-			for row in cursor.fetchall():
-				timeline_data.append({
-					'type': row[0],
-					'id': row[1],
-					'timestamp': row[2],
-					'from': row[3],
-					'to': row[4],
-					'anomaly': row[5] if row[5] is not None else False
-				})
-			
-			conn.close()
-			return Response({'timeline': timeline_data})
+			start = parse_replay_time(request.query_params.get('start'))
+			end = parse_replay_time(request.query_params.get('end'))
+			events, next_cursor = timeline.replay(
+				start=start,
+				end=end,
+				device=request.query_params.get('device') or None,
+				cursor=request.query_params.get('cursor'),
+				limit=int(request.query_params.get('limit', TIMELINE_PAGE_SIZE)),
+				ascending=request.query_params.get('order') == 'asc'
+			)
+		except ValueError as e:
+			return Response({'timeline': [], 'error': str(e)}, status=400)
 		except Exception as e:
 			return Response({'timeline': [], 'error': str(e)})
 
+		timeline_data = [{
+			'type': event.kind,
+			'id': event.ref,
+			'timestamp': event.timestamp,
+			'from': event.from_device,
+			'to': event.to_device,
+			'anomaly': event.anomaly
+		} for event in events]
+		return Response({'timeline': timeline_data, 'next_cursor': next_cursor})
+
+# Ledger state at a past instant
+class AuditStateView(APIView):
+	permission_classes = [IsAuthenticated]
+	def get(self, request):
+		"""
+		Rebuild ledger state as of at (ISO datetime, default now): command
+		center mode and per-device block counts. With device, also that
+		device's newest blocks at the time (limit) and whether each was synced.
+		"""
+		try:
+			at = parse_replay_time(request.query_params.get('at')) or timezone.now()
+			state = state_history.state_at(at)
+			device_id = request.query_params.get('device')
+			if device_id:
+				device = Device.objects.filter(device_id=device_id).first()
+				if device is None:
+					raise ValueError(f'unknown device: {device_id!r}')
+				state['devices'] = [entry for entry in state['devices'] if entry['device_id'] == device_id]
+				state['blocks'] = state_history.device_blocks_at(
+					device, at, limit=int(request.query_params.get('limit', BLOCK_LIST_SIZE))
+				)
+		except ValueError as e:
+			return Response({'error': str(e)}, status=400)
+		return Response(state)
+
+def parse_replay_time(value):
+	"""ISO datetime query parameter; naive values are in the server's time zone"""
+	if not value:
+		return None
+	parsed = parse_datetime(value)
+	if parsed is None:
+		raise ValueError(f'invalid datetime: {value!r}')
+	return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
 class SystemStatusView(APIView):
 	permission_classes = [IsAuthenticated]
 	
 	def get(self, request):
 		"""Get overall system status"""
 		try:
-			conn = sqlite3.connect('db.sqlite3')
-			cursor = conn.cursor()
-			
-			# Command center status
-			cursor.execute("SELECT name, current_mode, is_active, global_lamport_clock FROM blockchain_commandcenter")
-			cc = cursor.fetchone()
-			
-			# Device status counts
-			cursor.execute("SELECT is_online, COUNT(*) FROM blockchain_device GROUP BY is_online")
-			device_status = dict(cursor.fetchall())
-			
-			# Recent activity
-			cursor.execute("SELECT COUNT(*) FROM messaging_message WHERE timestamp > datetime('now', '-1 hour')")
-			recent_messages = cursor.fetchone()[0]
-			
-			conn.close()
+			with connection.cursor() as cursor:
+				# Command center status
+				cursor.execute("SELECT name, current_mode, is_active, global_lamport_clock FROM blockchain_commandcenter")
+				cc = cursor.fetchone()
+				
+				# Device status counts
+				cursor.execute("SELECT is_online, COUNT(*) FROM blockchain_device GROUP BY is_online")
+				device_status = dict(cursor.fetchall())
+				
+				# Recent activity
+				cursor.execute("SELECT COUNT(*) FROM messaging_message WHERE timestamp > datetime('now', '-1 hour')")
+				recent_messages = cursor.fetchone()[0]
 			
 			return Response({
 				'command_center': {
@@ -143,106 +175,101 @@ class DashboardHomeView(TemplateView):
 
 def dashboard_home(request):
     """Simple function-based view for dashboard home"""
-    import sqlite3
     from django.utils import timezone
     
     try:
-        conn = sqlite3.connect('db.sqlite3')
-        cursor = conn.cursor()
-        
-        # Get basic counts
-        context = {
-            'message_count': Message.objects.count(),
-            'blockchain_count': BlockchainTransaction.objects.count(),
-            'device_count': Device.objects.count(),
-            'recent_messages': Message.objects.select_related('sender', 'receiver').order_by('-timestamp')[:5],
-            'devices': Device.objects.all(),
-        }
-        
-        # Get recent blockchain transactions with device info from master ledger
-        cursor.execute("""
-            SELECT tx_hash, timestamp, from_device_id, to_device_id, mode_when_created, is_resync, 'blockchain' as block_type
-            FROM blockchain_masterledger 
-            ORDER BY timestamp DESC 
-            LIMIT 5
-        """)
-        
-        recent_transactions = []
-        for row in cursor.fetchall():
-            recent_transactions.append({
-                'tx_hash': row[0],
-                'timestamp': row[1],
-                'from_device_id': row[2] if row[2] else 'SYSTEM',
-                'to_device_id': row[3] if row[3] else 'ALL',
-                'mode': row[4] or 'normal',
-                'is_synced': not row[5],  # is_resync=True means not synced
-                'block_type': row[6] or 'message'
-            })
-        
-        context['recent_transactions'] = recent_transactions
-        
-        # Get system activity with real device communications
-        cursor.execute("""
-            SELECT 
-                'message' as type,
-                m.timestamp,
-                s.device_id as from_device,
-                r.device_id as to_device,
-                m.anomaly_flag,
-                m.msg_id,
-                m.blockchain_tx
-            FROM messaging_message m
-            JOIN users_device s ON m.sender_id = s.id
-            JOIN users_device r ON m.receiver_id = r.id
-            ORDER BY m.timestamp DESC
-            LIMIT 10
-        """)
-        
-        system_activities = []
-        for row in cursor.fetchall():
-            system_activities.append({
-                'type': 'Message',
-                'timestamp': row[1],
-                'from_device': row[2],
-                'to_device': row[3],
-                'status': 'Anomaly' if row[4] else 'Secure',
-                'details': f"{row[2]} → {row[3]}",
-                'hash': row[6] if row[6] else 'No Hash',
-                'msg_id': row[5]
-            })
-        
-        # Add blockchain activities
-        cursor.execute("""
-            SELECT 
-                'blockchain' as type,
-                timestamp,
-                from_device_id,
-                to_device_id,
-                is_resync,
-                tx_hash,
-                mode_when_created
-            FROM blockchain_masterledger
-            ORDER BY timestamp DESC
-            LIMIT 5
-        """)
-        
-        for row in cursor.fetchall():
-            system_activities.append({
-                'type': 'Blockchain',
-                'timestamp': row[1],
-                'from_device': row[2] if row[2] else 'SYSTEM',
-                'to_device': row[3] if row[3] else 'ALL',
-                'status': 'Resync' if row[4] else 'Normal',
-                'details': f"{row[2] or 'SYSTEM'} → {row[3] or 'ALL'}",
-                'hash': row[5][:16] + '...' if row[5] else 'No Hash',
-                'mode': row[6] or 'normal'
-            })
-        
-        # Sort all activities by timestamp
-        system_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        context['system_activities'] = system_activities[:8]  # Show latest 8 activities
-        
-        conn.close()
+        with connection.cursor() as cursor:
+            # Get basic counts
+            context = {
+                'message_count': Message.objects.count(),
+                'blockchain_count': BlockchainTransaction.objects.count(),
+                'device_count': Device.objects.count(),
+                'recent_messages': Message.objects.select_related('sender', 'receiver').order_by('-timestamp')[:5],
+                'devices': Device.objects.all(),
+            }
+            
+            # Get recent blockchain transactions with device info from master ledger
+            cursor.execute("""
+                SELECT tx_hash, timestamp, from_device_id, to_device_id, mode_when_created, is_resync, 'blockchain' as block_type
+                FROM blockchain_masterledger 
+                ORDER BY timestamp DESC 
+                LIMIT 5
+            """)
+            
+            recent_transactions = []
+            for row in cursor.fetchall():
+                recent_transactions.append({
+                    'tx_hash': row[0],
+                    'timestamp': row[1],
+                    'from_device_id': row[2] if row[2] else 'SYSTEM',
+                    'to_device_id': row[3] if row[3] else 'ALL',
+                    'mode': row[4] or 'normal',
+                    'is_synced': not row[5],  # is_resync=True means not synced
+                    'block_type': row[6] or 'message'
+                })
+            
+            context['recent_transactions'] = recent_transactions
+            
+            # Get system activity with real device communications
+            cursor.execute("""
+                SELECT 
+                    'message' as type,
+                    m.timestamp,
+                    s.device_id as from_device,
+                    r.device_id as to_device,
+                    m.anomaly_flag,
+                    m.msg_id,
+                    m.blockchain_tx
+                FROM messaging_message m
+                JOIN users_device s ON m.sender_id = s.id
+                JOIN users_device r ON m.receiver_id = r.id
+                ORDER BY m.timestamp DESC
+                LIMIT 10
+            """)
+            
+            system_activities = []
+            for row in cursor.fetchall():
+                system_activities.append({
+                    'type': 'Message',
+                    'timestamp': row[1],
+                    'from_device': row[2],
+                    'to_device': row[3],
+                    'status': 'Anomaly' if row[4] else 'Secure',
+                    'details': f"{row[2]} → {row[3]}",
+                    'hash': row[6] if row[6] else 'No Hash',
+                    'msg_id': row[5]
+                })
+            
+            # Add blockchain activities
+            cursor.execute("""
+                SELECT 
+                    'blockchain' as type,
+                    timestamp,
+                    from_device_id,
+                    to_device_id,
+                    is_resync,
+                    tx_hash,
+                    mode_when_created
+                FROM blockchain_masterledger
+                ORDER BY timestamp DESC
+                LIMIT 5
+            """)
+            
+            for row in cursor.fetchall():
+                system_activities.append({
+                    'type': 'Blockchain',
+                    'timestamp': row[1],
+                    'from_device': row[2] if row[2] else 'SYSTEM',
+                    'to_device': row[3] if row[3] else 'ALL',
+                    'status': 'Resync' if row[4] else 'Normal',
+                    'details': f"{row[2] or 'SYSTEM'} → {row[3] or 'ALL'}",
+                    'hash': row[5][:16] + '...' if row[5] else 'No Hash',
+                    'mode': row[6] or 'normal'
+                })
+            
+            # Sort all activities by timestamp
+            system_activities.sort(key=lambda x: x['timestamp'], reverse=True)
+            context['system_activities'] = system_activities[:8]  # Show latest 8 activities
         
     except Exception as e:
         print(f"Dashboard error: {e}")
@@ -265,33 +292,13 @@ def dashboard_home(request):
 def dashboard_stats_api(request):
     """Simple API for dashboard statistics"""
     try:
-        conn = sqlite3.connect('db.sqlite3')
-        cursor = conn.cursor()
-        
-        # Get various counts
-        cursor.execute("SELECT COUNT(*) FROM messaging_message")
-        message_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM messaging_message WHERE anomaly_flag = 1")
-        anomaly_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM blockchain_masterledger")
-        blockchain_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM users_device")
-        device_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT current_mode FROM blockchain_commandcenter")
-        current_mode = cursor.fetchone()
-        
-        conn.close()
-        
+        stats = dashboard_stats.get()
         return JsonResponse({
-            'messages': message_count,
-            'anomalies': anomaly_count,
-            'blockchain_entries': blockchain_count,
-            'devices': device_count,
-            'current_mode': current_mode[0] if current_mode else 'normal',
+            'messages': stats['messages']['total'],
+            'anomalies': stats['messages']['anomalies'],
+            'blockchain_entries': stats['blockchain']['master_ledger'],
+            'devices': stats['devices']['total'],
+            'current_mode': stats['current_mode'],
             'system_status': 'operational'
         })
     except Exception as e:
@@ -299,99 +306,20 @@ def dashboard_stats_api(request):
 
 @csrf_exempt
 def system_activity_api(request):
-    """API for fetching real-time system activity with filtering"""
+    """API for fetching real-time system activity with filtering; pass next_cursor back as cursor for older pages"""
     try:
-        import sqlite3
-        
         # Get filter parameters
         from_device = request.GET.get('from_device', '')
         to_device = request.GET.get('to_device', '')
         activity_type = request.GET.get('type', '')
         
-        conn = sqlite3.connect('db.sqlite3')
-        cursor = conn.cursor()
-        
-        activities = []
-        
-        # Build dynamic WHERE clauses for filtering
-        message_where = "WHERE 1=1"
-        blockchain_where = "WHERE 1=1"
-        
-        if from_device:
-            message_where += f" AND m.sender_device = '{from_device}'"
-            blockchain_where += f" AND bl.from_device_id = '{from_device}'"
-        
-        if to_device:
-            message_where += f" AND m.recipient_device = '{to_device}'"
-            blockchain_where += f" AND bl.to_device_id = '{to_device}'"
-        
-        # Get message activities with content
-        if not activity_type or activity_type == 'Message' or activity_type == 'Anomaly':
-            cursor.execute(f"""
-                SELECT 
-                    m.timestamp,
-                    sd.device_id as sender_device,
-                    rd.device_id as receiver_device,
-                    m.anomaly_flag,
-                    m.msg_id,
-                    m.payload,
-                    m.blockchain_tx
-                FROM messaging_message m
-                LEFT JOIN users_device sd ON m.sender_id = sd.id
-                LEFT JOIN users_device rd ON m.receiver_id = rd.id
-                WHERE 1=1
-                {f"AND sd.device_id = '{from_device}'" if from_device else ''}
-                {f"AND rd.device_id = '{to_device}'" if to_device else ''}
-                {'AND m.anomaly_flag = 1' if activity_type == 'Anomaly' else ''}
-                ORDER BY m.timestamp DESC
-                LIMIT 10
-            """)
-            
-            for row in cursor.fetchall():
-                activities.append({
-                    'type': 'Message',
-                    'timestamp': row[0],
-                    'from_device': row[1] if row[1] else 'SYSTEM',
-                    'to_device': row[2] if row[2] else 'BROADCAST',
-                    'status': 'Anomaly' if row[3] else 'Secure',
-                    'hash': row[6][:8] + '...' if row[6] else f'msg_{row[4][:8]}...',
-                    'msg_id': row[4],
-                    'content': row[5][:50] + '...' if row[5] and len(row[5]) > 50 else row[5] or 'ENCRYPTED',
-                    'anomaly_type': None
-                })
-        
-        # Get blockchain activities
-        if not activity_type or activity_type == 'Blockchain':
-            cursor.execute(f"""
-                SELECT 
-                    bl.timestamp,
-                    bl.from_device_id,
-                    bl.to_device_id,
-                    bl.is_resync,
-                    bl.tx_hash,
-                    bl.mode_when_created
-                FROM blockchain_masterledger bl
-                WHERE 1=1
-                {f"AND bl.from_device_id = '{from_device}'" if from_device else ''}
-                {f"AND bl.to_device_id = '{to_device}'" if to_device else ''}
-                ORDER BY bl.timestamp DESC
-                LIMIT 10
-            """)
-            
-            for row in cursor.fetchall():
-                activities.append({
-                    'type': 'Blockchain',
-                    'timestamp': row[0],
-                    'from_device': str(row[1]) if row[1] else 'COMMAND_CENTER',
-                    'to_device': str(row[2]) if row[2] else 'ALL_UNITS',
-                    'status': 'Synced' if not row[3] else 'Resync',
-                    'hash': row[4][:8] + '...' if row[4] else 'No Hash',
-                    'mode': row[5] or 'normal',
-                    'content': 'BLOCKCHAIN_TRANSACTION'
-                })
-        
-        # Sort by timestamp
-        activities.sort(key=lambda x: x['timestamp'], reverse=True)
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+            activities, next_cursor = activity_query.page(
+                from_device, to_device, activity_type, cursor=request.GET.get('cursor'), limit=limit
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e), 'activities': [], 'filter_info': {}}, status=400)
         
         # Add filter info to response
         filter_info = {
@@ -401,10 +329,9 @@ def system_activity_api(request):
             'active_filters': bool(from_device or to_device or activity_type)
         }
         
-        conn.close()
-        
         return JsonResponse({
-            'activities': activities[:15],
+            'activities': activities,
+            'next_cursor': next_cursor,
             'timestamp': timezone.now().isoformat(),
             'filter_info': filter_info
         })
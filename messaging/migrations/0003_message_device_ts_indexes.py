@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_hot_query_indexes'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'timestamp'], name='message_sender_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'timestamp'], name='message_receiver_ts_idx'),
+        ),
+    ]
@@ -9,4 +9,15 @@ class Message(models.Model):
 	blockchain_tx = models.CharField(max_length=128, null=True, blank=True)  # Blockchain tx hash
 	anomaly_flag = models.BooleanField(default=False)
 
+	class Meta:
+		indexes = [
+			# Recent-message listings and 24h counts
+			models.Index(fields=['timestamp'], name='message_ts_idx'),
+			# Anomaly counts and anomaly timelines
+			models.Index(fields=['timestamp'], condition=models.Q(anomaly_flag=True), name='message_anomaly_ts_idx'),
+			# Per-device listings, newest first (MessagesByPeerView ORs the two)
+			models.Index(fields=['sender', 'timestamp'], name='message_sender_ts_idx'),
+			models.Index(fields=['receiver', 'timestamp'], name='message_receiver_ts_idx'),
+		]
+
 # Create your models here.
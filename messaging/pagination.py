@@ -0,0 +1,44 @@
+"""
+Cursor pagination for message listings
+Pages seek on the (timestamp, id) indexes from an opaque cursor, so the
+newest page and one a year back cost the same; no COUNT(*) or OFFSET.
+"""
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns list views read: MessageSerializer's fields plus the device and
+# owner names it renders, leaving out device keys and user credentials
+LIST_FIELDS = (
+    'msg_id', 'payload', 'timestamp', 'blockchain_tx', 'anomaly_flag',
+    'sender', 'sender__device_id', 'sender__owner', 'sender__owner__username',
+    'receiver', 'receiver__device_id', 'receiver__owner', 'receiver__owner__username',
+)
+
+
+class MessageCursorPagination(CursorPagination):
+    """Newest first; ?limit= sets the page size, ?cursor= comes from the previous page's next link"""
+    ordering = ('-timestamp', '-id')
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+    def __init__(self, page_size=None):
+        if page_size is not None:
+            self.page_size = page_size
+
+
+def list_queryset(queryset):
+    """queryset with the devices and owners list views render joined in and nothing else loaded"""
+    return queryset.select_related('sender__owner', 'receiver__owner').only(*LIST_FIELDS)
+
+
+def paginate_messages(request, queryset, page_size=None):
+    """(page of messages, next page URL or None) for plain Django views"""
+    paginator = MessageCursorPagination(page_size)
+    if not isinstance(request, Request):
+        request = Request(request)
+    page = paginator.paginate_queryset(list_queryset(queryset), request)
+    return page, paginator.get_next_link()
@@ -3,14 +3,18 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils import timezone
+from django.db.models import Q
+from users.models import Device
 from .models import Message
 from .serializers import MessageSerializer
+from .pagination import MessageCursorPagination, list_queryset, paginate_messages
 
 # Send/Receive Message
 class MessageListCreateView(generics.ListCreateAPIView):
-	queryset = Message.objects.all()
+	queryset = list_queryset(Message.objects.all())
 	serializer_class = MessageSerializer
 	permission_classes = [permissions.IsAuthenticated]
+	pagination_class = MessageCursorPagination
 
 class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
 	queryset = Message.objects.all()
@@ -21,10 +25,14 @@ class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
 class MessagesByPeerView(generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
-        peer_id = self.kwargs.get('peer_id')
-        return Message.objects.filter(sender__device_id=peer_id) | Message.objects.filter(receiver__device_id=peer_id)
+        # Filter on the device's pk, so each side of the OR can use its (device, timestamp) index
+        device = Device.objects.filter(device_id=self.kwargs.get('peer_id')).only('pk').first()
+        if device is None:
+            return Message.objects.none()
+        return list_queryset(Message.objects.filter(Q(sender=device) | Q(receiver=device)))
 
 # P2P Message Handling
 from rest_framework.views import APIView
@@ -41,6 +49,12 @@ class SendP2PMessageView(APIView):
         receiver_peer_id = request.data.get('receiver_peer_id')
         message_payload = request.data.get('payload')
         
+        # Envelopes and payload hashes carry text fields only
+        if not isinstance(message_payload, str):
+            return Response({'error': 'payload must be a string'}, status=400)
+        if not isinstance(receiver_peer_id, str) or not receiver_peer_id:
+            return Response({'error': 'receiver_peer_id must be a non-empty string'}, status=400)
+        
         try:
             sender_device = Device.objects.get(device_id=sender_device_id)
             result = p2p_manager.send_p2p_message(sender_device, receiver_peer_id, message_payload)
@@ -88,7 +102,7 @@ def send_message_api(request):
         
         # Create or get receiver device (or handle broadcast)
         if receiver_device_id == 'BROADCAST':
-            receiver_device = sender_device  # For broadcast, use sender as placeholder
+            receiver_device = sender_device  # receiver is required; broadcasts reach units by gossip below
         else:
             receiver_device, created = Device.objects.get_or_create(
                 device_id=receiver_device_id,
@@ -120,6 +134,12 @@ def send_message_api(request):
             blockchain_tx=f'tx_{uuid.uuid4().hex[:16]}'
         )
         
+        # Spread broadcasts across the P2P mesh by gossip
+        broadcast = None
+        if receiver_device_id == 'BROADCAST':
+            from p2p_sync.p2p_comm import p2p_manager
+            broadcast = p2p_manager.broadcast_message(sender_device, payload)
+        
         # Log to blockchain if priority message
         if priority:
             try:
@@ -146,7 +166,8 @@ def send_message_api(request):
             'encrypted': encrypt,
             'priority': priority,
             'is_anomaly': message.anomaly_flag,
-            'blockchain_logged': priority
+            'blockchain_logged': priority,
+            'broadcast': broadcast
         })
         
     except Exception as e:
@@ -154,10 +175,9 @@ def send_message_api(request):
 
 @csrf_exempt
 def message_list_api(request):
-    """Simple API for getting message list"""
+    """Simple API for getting message list; follow next for older messages"""
     try:
-        limit = int(request.GET.get('limit', 20))
-        messages = Message.objects.order_by('-timestamp')[:limit]
+        messages, next_link = paginate_messages(request, Message.objects.all(), page_size=20)
         
         message_data = []
         for msg in messages:
@@ -171,7 +191,7 @@ def message_list_api(request):
                 'anomaly_flag': msg.anomaly_flag
             })
         
-        return JsonResponse({'messages': message_data})
+        return JsonResponse({'messages': message_data, 'next': next_link})
         
     except Exception as e:
         return JsonResponse({'error': str(e)})
@@ -200,18 +220,17 @@ def message_stats_api(request):
 def message_list_view(request):
     """Display message list page"""
     from django.shortcuts import render
-    from datetime import timedelta
+    from dashboard.stats import dashboard_stats
     
-    messages = Message.objects.select_related('sender', 'receiver').order_by('-timestamp')
-    anomaly_count = Message.objects.filter(anomaly_flag=True).count()
-    recent_count = Message.objects.filter(
-        timestamp__gte=timezone.now() - timedelta(hours=24)
-    ).count()
+    messages, next_link = paginate_messages(request, Message.objects.all())
+    # Cached counters, so paging never runs full-table COUNTs
+    counters = dashboard_stats.get()['messages']
     
     context = {
         'messages': messages,
-        'anomaly_count': anomaly_count,
-        'recent_count': recent_count,
-        'total_count': messages.count(),
+        'next_link': next_link,
+        'anomaly_count': counters['anomalies'],
+        'recent_count': counters['recent_24h'],
+        'total_count': counters['total'],
     }
     return render(request, 'messaging/message_list.html', context)
@@ -89,8 +89,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL lets the outbox drainer and transport handlers write while requests read
+        'OPTIONS': {'init_command': 'PRAGMA journal_mode=WAL;'},
+        # Keep each worker's connection open between requests instead of reconnecting per hit
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# Same database on a second connection: Lamport leases commit there on their
+# own, so a rolled-back ledger write cannot undo a range already handed out
+DATABASES['lamport'] = dict(DATABASES['default'])
 
 
 # Password validation
@@ -131,6 +139,11 @@ STATIC_URL = 'static/'
 
 # Channels config
 ASGI_APPLICATION = 'military_comm.asgi.application'
+# Fans dashboard activity events out to open WebSockets. In-memory reaches only
+# this process; run several workers with channels_redis.core.RedisChannelLayer
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
 
 # REST Framework config
 REST_FRAMEWORK = {
@@ -143,6 +156,47 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Ledger signature config
+LEDGER_SIGNATURE_WORKERS = 4  # Process pool size for batch RSA verification (1 = inline)
+LEDGER_SIGNATURE_BATCH_SIZE = 256  # Blocks per pool task
+LEDGER_REQUIRE_SIGNATURES = False  # Reject blocks from devices without a valid RSA public key
+LEDGER_SIGNING_KEY_DIR = BASE_DIR / 'keys'  # <device_id>.pem private keys for server-side P2P signing
+LAMPORT_LEASE_SIZE = 100  # Lamport values each worker reserves per DB round-trip
+LAMPORT_DATABASE = 'lamport'  # Connection alias leases are taken on
+
+# P2P transport config
+P2P_NODE_ID = None  # device_id this node runs as; gossiped BROADCASTs are logged on its chain (None = relay only)
+P2P_LISTEN_HOST = '127.0.0.1'
+P2P_LISTEN_PORT = None  # TCP port for incoming peer links (None = outbound only)
+P2P_PEER_ADDRESSES = {}  # peer_id -> 'host:port' links opened when the transport starts
+P2P_PEER_SECRET = None  # Shared secret authenticating peers on anti-entropy requests and transport links (None = no rpc)
+P2P_SEND_QUEUE_SIZE = 1000  # Queued + unacknowledged messages per peer before sends are refused
+P2P_CONNECT_TIMEOUT = 5  # Seconds
+P2P_RETRY_BASE_DELAY = 0.5  # Reconnect backoff start, doubled per failure with +/-50% jitter
+P2P_RETRY_MAX_DELAY = 30
+P2P_MAX_SEND_ATTEMPTS = 5  # Transmissions of one message before it is dropped
+P2P_ACK_TIMEOUT = 10  # Seconds without an ack before a frame is resent
+P2P_RPC_TIMEOUT = 30  # Seconds to wait for a peer's reply (anti-entropy)
+P2P_BATCH_WINDOW = 0.05  # Seconds queued messages wait to be coalesced into one frame
+P2P_BATCH_MAX_MESSAGES = 100  # Messages per batch frame
+P2P_BATCH_MAX_BYTES = 64 * 1024  # Uncompressed envelope bytes per batch frame
+P2P_OUTBOX_BATCH_SIZE = 200  # Due outbox rows handed to the transport per drainer pass
+P2P_OUTBOX_POLL_INTERVAL = 5  # Seconds between drainer passes when nothing is due
+P2P_OUTBOX_RETRY_BASE_DELAY = 5  # Seconds before an unacked row is resent, doubled per attempt
+P2P_OUTBOX_RETRY_MAX_DELAY = 300
+P2P_OUTBOX_RETENTION_HOURS = 24  # Delivered rows are purged after this long
+P2P_OUTBOX_PURGE_EVERY = 100  # Drainer passes between purges
+P2P_PEER_TTL = 120  # Seconds without an announcement before a peer expires from the registry
+P2P_PEER_SIGNAL_ALPHA = 0.3  # EWMA weight of the newest signal/distance sample
+P2P_PEER_MIN_SIGNAL = 70  # Smoothed signal strength above which a peer counts as connected
+
+# Ledger state history config
+LEDGER_SNAPSHOT_INTERVAL = 300  # Seconds between state snapshots; bounds the deltas replayed per reconstruction
+LEDGER_SNAPSHOT_MAX_DELTAS = 10000  # Deltas after which a snapshot is due early
+
+# Dashboard config
+DASHBOARD_STATS_TTL = 2  # Seconds dashboard counters are served from one computation per worker
+
 # Graphene config
 GRAPHENE = {
     'SCHEMA': 'military_comm.schema.schema',
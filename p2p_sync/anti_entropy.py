@@ -0,0 +1,396 @@
+"""
+Anti-entropy block exchange between peer ledgers
+Peers compare Merkle-style digests over per-device Lamport ranges and only
+transfer the blocks that differ, so near-identical ledgers cost a few
+digests instead of a full ledger over the radio link.
+
+Protocol (initiator drives, responder answers; every message is a dict):
+  digest  -> digest_reply   compare range digests; mismatches come back as the
+                            FANOUT child digests, or as leaf hashes once small
+An empty range has an empty digest, so one side missing a whole range is
+settled with a single fetch or push instead of further digest rounds.
+  fetch   -> blocks         blocks of whole ranges or of listed leaf hashes
+  push    -> push_reply     blocks the responder is missing
+"""
+from .models import LocalLedgerBlock
+from .signatures import check_signature
+from . import vector_clock as vector_clocks
+from abc import ABC, abstractmethod
+from datetime import datetime
+import hashlib
+import json
+
+# Children per range split
+FANOUT = 16
+# Ranges holding at most this many responder blocks are answered with leaf hashes
+LEAF_LIMIT = 16
+# Hex characters kept from leaf and range digests
+DIGEST_CHARS = 16
+EMPTY_DIGEST = ''
+
+
+def leaf_hash(block_id, payload_hash):
+    """Short identity hash of one block"""
+    return hashlib.sha256(f'{block_id}:{payload_hash}'.encode()).hexdigest()[:DIGEST_CHARS]
+
+
+def range_digest(hashes):
+    """Order-independent digest of a set of leaf hashes"""
+    if not hashes:
+        return EMPTY_DIGEST
+    return hashlib.sha256(''.join(sorted(hashes)).encode()).hexdigest()[:DIGEST_CHARS]
+
+
+def root_bound(max_lamport):
+    """Smallest power of FANOUT above max_lamport; upper bound of a device's root range"""
+    bound = FANOUT
+    while bound <= max_lamport:
+        bound *= FANOUT
+    return bound
+
+
+def child_ranges(lo, hi):
+    """Split [lo, hi) into up to FANOUT contiguous, non-empty sub-ranges"""
+    width = -(-(hi - lo) // FANOUT)
+    return [(start, min(start + width, hi)) for start in range(lo, hi, width)]
+
+
+class LedgerStore(ABC):
+    """
+    Block storage seen by the protocol. Subclasses provide device_ids,
+    leaves, blocks and insert_blocks; digests are derived from leaves.
+    """
+
+    @abstractmethod
+    def device_ids(self):
+        """Sorted ids of the devices that have at least one block"""
+
+    @abstractmethod
+    def leaves(self, device_id, lo=0, hi=None):
+        """[(lamport_clock, leaf_hash)] for device_id's blocks in [lo, hi)"""
+
+    @abstractmethod
+    def blocks(self, device_id, lo=0, hi=None, hashes=None):
+        """Wire dicts for device_id's blocks in [lo, hi), optionally only those in hashes"""
+
+    @abstractmethod
+    def insert_blocks(self, blocks):
+        """Store wire dicts; returns (accepted, rejected)"""
+
+    def children(self, device_id, lo, hi):
+        """Digest of each child range of [lo, hi)"""
+        return bucket_children(lo, hi, self.leaves(device_id, lo, hi))
+
+
+def bucket_children(lo, hi, leaves):
+    """Digest per child range of [lo, hi) from that range's leaves"""
+    ranges = child_ranges(lo, hi)
+    buckets = [[] for _ in ranges]
+    width = ranges[0][1] - ranges[0][0]
+    for lamport, leaf in leaves:
+        buckets[(lamport - lo) // width].append(leaf)
+    return [range_digest(bucket) for bucket in buckets]
+
+
+def summarize(leaves):
+    """(digest, max_lamport) of a list of leaves"""
+    return (
+        range_digest([leaf for _, leaf in leaves]),
+        max((lamport for lamport, _ in leaves), default=0)
+    )
+
+
+class DatabaseLedgerStore(LedgerStore):
+    """
+    LocalLedgerBlock table of this node. Blocks from peers are stored only if
+    their signature verifies against the device's RSA key, whatever
+    LEDGER_REQUIRE_SIGNATURES says: a peer can claim any device id.
+    """
+
+    def device_ids(self):
+        return list(
+            LocalLedgerBlock.objects.values_list('device__device_id', flat=True)
+            .distinct().order_by('device__device_id')
+        )
+
+    def _queryset(self, device_id, lo=0, hi=None):
+        queryset = LocalLedgerBlock.objects.filter(device__device_id=device_id, lamport_clock__gte=lo)
+        if hi is not None:
+            queryset = queryset.filter(lamport_clock__lt=hi)
+        return queryset
+
+    def leaves(self, device_id, lo=0, hi=None):
+        return [
+            (lamport, leaf_hash(block_id, payload_hash))
+            for lamport, block_id, payload_hash in self._queryset(device_id, lo, hi).values_list(
+                'lamport_clock', 'block_id', 'payload_hash'
+            ).iterator()
+        ]
+
+    def blocks(self, device_id, lo=0, hi=None, hashes=None):
+        wanted = set(hashes) if hashes is not None else None
+        return [
+            block_to_wire(block, device_id)
+            for block in self._queryset(device_id, lo, hi).order_by('lamport_clock', 'pk')
+            if wanted is None or leaf_hash(block.block_id, block.payload_hash) in wanted
+        ]
+
+    def insert_blocks(self, blocks):
+        from users.models import Device
+        from .blockchain_sync import blockchain_sync
+
+        devices = {
+            device.device_id: device
+            for device in Device.objects.filter(device_id__in={block['device_id'] for block in blocks})
+        }
+        accepted = rejected = 0
+        for device_id, device_blocks in group_by_device(blocks).items():
+            device = devices.get(device_id)
+            if device is None:
+                rejected += len(device_blocks)
+                continue
+            valid = [
+                block for block in (wire_to_block(block, device) for block in device_blocks)
+                if check_signature(block.payload_hash, block.signature, device.public_key) is True
+            ]
+            rejected += len(device_blocks) - len(valid)
+            accepted += blockchain_sync.import_local_blocks(device, valid)
+        return accepted, rejected
+
+
+class MemoryLedgerStore(LedgerStore):
+    """In-memory ledger of wire dicts, for in-process peers and loopback simulation"""
+
+    def __init__(self, blocks=()):
+        self.by_device = {}
+        self.insert_blocks(blocks)
+
+    def device_ids(self):
+        return sorted(device_id for device_id, blocks in self.by_device.items() if blocks)
+
+    def _select(self, device_id, lo=0, hi=None):
+        return [
+            block for block in self.by_device.get(device_id, {}).values()
+            if block['lamport_clock'] >= lo and (hi is None or block['lamport_clock'] < hi)
+        ]
+
+    def leaves(self, device_id, lo=0, hi=None):
+        return [
+            (block['lamport_clock'], leaf_hash(block['block_id'], block['payload_hash']))
+            for block in self._select(device_id, lo, hi)
+        ]
+
+    def blocks(self, device_id, lo=0, hi=None, hashes=None):
+        wanted = set(hashes) if hashes is not None else None
+        return sorted(
+            (
+                block for block in self._select(device_id, lo, hi)
+                if wanted is None or leaf_hash(block['block_id'], block['payload_hash']) in wanted
+            ),
+            key=lambda block: (block['lamport_clock'], block['block_id'])
+        )
+
+    def insert_blocks(self, blocks):
+        accepted = 0
+        for block in blocks:
+            device_blocks = self.by_device.setdefault(block['device_id'], {})
+            if block['block_id'] not in device_blocks:
+                device_blocks[block['block_id']] = dict(block)
+                accepted += 1
+        return accepted, 0
+
+
+def block_to_wire(block, device_id):
+    return {
+        'block_id': block.block_id,
+        'prev_hash': block.prev_hash,
+        'payload_hash': block.payload_hash,
+        'signature': block.signature,
+        'device_id': device_id,
+        'lamport_clock': block.lamport_clock,
+        'vector_clock': block.vector_clock,
+        'timestamp': block.timestamp.isoformat()
+    }
+
+
+def wire_to_block(block, device):
+    local_block = LocalLedgerBlock(
+        block_id=block['block_id'],
+        prev_hash=block['prev_hash'],
+        payload_hash=block['payload_hash'],
+        signature=block.get('signature', ''),
+        device=device,
+        lamport_clock=int(block['lamport_clock']),
+        vector_clock_packed=vector_clocks.pack(block.get('vector_clock')),
+        is_synced=False
+    )
+    local_block.timestamp = datetime.fromisoformat(block['timestamp'])
+    return local_block
+
+
+def group_by_device(blocks):
+    grouped = {}
+    for block in blocks:
+        grouped.setdefault(block['device_id'], []).append(block)
+    return grouped
+
+
+class AntiEntropyNode:
+    """
+    One peer in the exchange. handle() answers a peer's requests against the
+    local store; sync() drives a full exchange with a peer through a transport
+    (any callable taking a request dict and returning the reply dict).
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else DatabaseLedgerStore()
+
+    # Responder side
+
+    def handle(self, message):
+        handler = getattr(self, f"handle_{message.get('type')}", None)
+        if handler is None:
+            return {'type': 'error', 'error': f"unknown message type {message.get('type')!r}"}
+        return handler(message)
+
+    def handle_digest(self, message):
+        ranges = []
+        leaves = []
+        # Roots: [device_id, digest, max_lamport]; devices only we hold are empty on their side
+        roots = {root[0]: root for root in message.get('roots', [])}
+        if 'roots' in message:
+            for device_id in self.store.device_ids():
+                roots.setdefault(device_id, [device_id, EMPTY_DIGEST, 0])
+        for device_id, digest, their_max in roots.values():
+            device_leaves = self.store.leaves(device_id)
+            my_digest, my_max = summarize(device_leaves)
+            if my_digest != digest:
+                bound = root_bound(max(my_max, their_max))
+                self._answer_range(device_id, 0, bound, device_leaves, ranges, leaves)
+
+        # Ranges: [device_id, lo, hi, digest]
+        for device_id, lo, hi, digest in message.get('ranges', []):
+            range_leaves = self.store.leaves(device_id, lo, hi)
+            if summarize(range_leaves)[0] != digest:
+                self._answer_range(device_id, lo, hi, range_leaves, ranges, leaves)
+
+        return {'type': 'digest_reply', 'ranges': ranges, 'leaves': leaves}
+
+    def _answer_range(self, device_id, lo, hi, range_leaves, ranges, leaves):
+        if len(range_leaves) <= LEAF_LIMIT or hi - lo <= 1:
+            leaves.append([device_id, lo, hi, [leaf for _, leaf in range_leaves]])
+            return
+        ranges.append([device_id, lo, hi, bucket_children(lo, hi, range_leaves)])
+
+    def handle_fetch(self, message):
+        blocks = []
+        for device_id, lo, hi in message.get('ranges', []):
+            blocks.extend(self.store.blocks(device_id, lo, hi))
+        for device_id, lo, hi, hashes in message.get('leaves', []):
+            blocks.extend(self.store.blocks(device_id, lo, hi, hashes))
+        return {'type': 'blocks', 'blocks': blocks}
+
+    def handle_push(self, message):
+        accepted, rejected = self.store.insert_blocks(message.get('blocks', []))
+        return {'type': 'push_reply', 'accepted': accepted, 'rejected': rejected}
+
+    # Initiator side
+
+    def sync(self, transport):
+        """
+        Reconcile the local store with a peer. Returns transfer stats;
+        transports that count bytes (see LoopbackTransport) report them too.
+        """
+        fetch_ranges, fetch_leaves, push_blocks = [], [], []
+        bytes_before = (getattr(transport, 'bytes_sent', 0), getattr(transport, 'bytes_received', 0))
+        request = {'type': 'digest', 'roots': [
+            [device_id, *summarize(self.store.leaves(device_id))]
+            for device_id in self.store.device_ids()
+        ]}
+        rounds = 0
+
+        while True:
+            reply = transport(request)
+            rounds += 1
+            pending = []
+
+            for device_id, lo, hi, their_children in reply.get('ranges', []):
+                mine = self.store.children(device_id, lo, hi)
+                for (child_lo, child_hi), my_digest, their_digest in zip(child_ranges(lo, hi), mine, their_children):
+                    if my_digest == their_digest:
+                        continue
+                    if their_digest == EMPTY_DIGEST:
+                        push_blocks.extend(self.store.blocks(device_id, child_lo, child_hi))
+                    elif my_digest == EMPTY_DIGEST:
+                        fetch_ranges.append([device_id, child_lo, child_hi])
+                    else:
+                        pending.append([device_id, child_lo, child_hi, my_digest])
+
+            for device_id, lo, hi, their_hashes in reply.get('leaves', []):
+                their_hashes = set(their_hashes)
+                my_hashes = {leaf for _, leaf in self.store.leaves(device_id, lo, hi)}
+                missing = sorted(their_hashes - my_hashes)
+                if missing:
+                    fetch_leaves.append([device_id, lo, hi, missing])
+                extra = my_hashes - their_hashes
+                if extra:
+                    push_blocks.extend(self.store.blocks(device_id, lo, hi, extra))
+
+            if not pending:
+                break
+            request = {'type': 'digest', 'ranges': pending}
+
+        received = accepted = rejected = 0
+        if fetch_ranges or fetch_leaves:
+            reply = transport({'type': 'fetch', 'ranges': fetch_ranges, 'leaves': fetch_leaves})
+            received = len(reply['blocks'])
+            accepted, rejected = self.store.insert_blocks(reply['blocks'])
+
+        pushed = peer_accepted = 0
+        if push_blocks:
+            reply = transport({'type': 'push', 'blocks': push_blocks})
+            pushed = len(push_blocks)
+            peer_accepted = reply['accepted']
+
+        stats = {
+            'status': 'success',
+            'digest_rounds': rounds,
+            'blocks_received': received,
+            'blocks_accepted': accepted,
+            'blocks_rejected': rejected,
+            'blocks_sent': pushed,
+            'blocks_accepted_by_peer': peer_accepted
+        }
+        if hasattr(transport, 'bytes_sent'):
+            stats['bytes_sent'] = transport.bytes_sent - bytes_before[0]
+            stats['bytes_received'] = transport.bytes_received - bytes_before[1]
+        return stats
+
+
+def encode_message(message):
+    return json.dumps(message, separators=(',', ':')).encode()
+
+
+def decode_message(data):
+    return json.loads(data)
+
+
+class LoopbackTransport:
+    """
+    In-process transport to a peer node: messages are encoded to bytes and
+    decoded on the other side exactly as over a link, and bytes are counted.
+    """
+
+    def __init__(self, peer):
+        self.peer = peer
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages = 0
+
+    def __call__(self, message):
+        data = encode_message(message)
+        self.bytes_sent += len(data)
+        reply = encode_message(self.peer.handle(decode_message(data)))
+        self.bytes_received += len(reply)
+        self.messages += 1
+        return decode_message(reply)
@@ -3,13 +3,66 @@ Blockchain sync logic for P2P offline-first communications
 Handles master ledger, local mini-ledgers, conflict resolution
 """
 from django.utils import timezone
-from .models import LocalLedgerBlock
+from django.db import transaction
+from django.db.models import Q
+from .models import LocalLedgerBlock, ChainHead
+from . import vector_clock as vector_clocks
+from .signatures import check_signature, apply_signature_policy, signature_verifier
+from .lamport import lamport_clock_service
+from .ledger_stats import ledger_stats
+from .state_history import state_history
+from .signals import blocks_imported, transactions_merged
+from .wire import block_hash
 from blockchain.models import BlockchainTransaction
-from Crypto.Hash import SHA256
-from Crypto.Signature import PKCS1_v1_5
-from Crypto.PublicKey import RSA
-import json
-import hashlib
+from users.models import Device
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+# Blocks closer together than this are treated as conflicting
+CONFLICT_WINDOW = timedelta(seconds=1)
+# Maximum number of OR'd timestamp ranges per master ledger query
+MASTER_WINDOW_BATCH = 100
+# Rows per bulk insert when merging local blocks into the master ledger
+MERGE_CHUNK_SIZE = 500
+# Blocks per chunk in the cursor-based resync protocol
+RESYNC_CHUNK_SIZE = 200
+RESYNC_MAX_CHUNK_SIZE = 1000
+
+
+def _timestamp_key(value):
+    """Integer microseconds since epoch, exact for window comparisons"""
+    return int(value.timestamp()) * 1_000_000 + value.microsecond
+
+
+class MasterLedgerIndex:
+    """
+    Sorted timestamp index over master ledger blocks.
+    Conflict lookups bisect into the window instead of scanning every block.
+    """
+
+    def __init__(self, master_blocks, window=CONFLICT_WINDOW):
+        self.window = window // timedelta(microseconds=1)
+        # Keep the original position so ties resolve to the first listed block
+        entries = sorted(
+            (_timestamp_key(block.timestamp), position, block)
+            for position, block in enumerate(master_blocks)
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+
+    def find_conflict(self, timestamp):
+        """Return the first-listed master block within the window, or None"""
+        key = _timestamp_key(timestamp)
+        lo = bisect_left(self.keys, key - self.window)
+        hi = bisect_right(self.keys, key + self.window)
+
+        match = None
+        for i in range(lo, hi):
+            master_key, position, block = self.entries[i]
+            if abs(master_key - key) < self.window and (match is None or position < match[0]):
+                match = (position, block)
+        return match[1] if match else None
+
 
 class BlockchainSyncManager:
     """
@@ -20,160 +73,301 @@ class BlockchainSyncManager:
     4. Resync with conflict resolution using Lamport/vector clocks
     """
     
-    def __init__(self):
-        self.lamport_clock = 0
+    def __init__(self, clock_service=lamport_clock_service):
+        self.clock_service = clock_service
         
     def create_block_hash(self, block_data):
-        """Create SHA256 hash of block data"""
-        block_string = json.dumps(block_data, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        """SHA256 of block data in wire.py's canonical binary block hash form"""
+        return block_hash(block_data)
     
-    def validate_signature(self, block, public_key):
-        """Validate block signature using RSA"""
-        # TODO: Implement RSA signature validation
-        # This is a placeholder for cryptographic validation
-        return True
+    def validate_signature(self, block, public_key=None):
+        """Validate block signature using RSA (PKCS#1 v1.5 over the payload hash)"""
+        if public_key is None:
+            public_key = block.device.public_key
+        return apply_signature_policy(
+            check_signature(block.payload_hash, block.signature, public_key)
+        )
     
     def increment_lamport_clock(self, received_clock=None):
-        """Increment Lamport clock for ordering events"""
-        if received_clock:
-            self.lamport_clock = max(self.lamport_clock, received_clock) + 1
-        else:
-            self.lamport_clock += 1
-        return self.lamport_clock
-    
-    def update_vector_clock(self, node_id, vector_clock=None):
-        """Update vector clock for distributed systems"""
-        if vector_clock is None:
-            vector_clock = {}
-        vector_clock[node_id] = vector_clock.get(node_id, 0) + 1
-        return vector_clock
+        """Increment Lamport clock for ordering events (shared across worker processes)"""
+        return self.clock_service.tick(received_clock)
+    
+    def update_vector_clock(self, node_id, vector_clock=None, received_clock=None):
+        """
+        Advance node_id's entry on top of its previous clock, merging in the
+        sender's clock for receive events
+        """
+        return vector_clocks.increment(
+            vector_clocks.merge(vector_clock, received_clock), node_id
+        )
+    
+    def lock_chain_head(self, device):
+        """
+        Lock and return device's ChainHead; call inside transaction.atomic().
+        The touch UPDATE takes the write lock before the head is read, which
+        serializes appends on SQLite as well as on row-locking backends.
+        """
+        if not ChainHead.objects.filter(device=device).update(updated_at=timezone.now()):
+            # First append through the head: seed it from the latest block
+            ledger_stats.seed_chain_head(device.pk)
+        return ChainHead.objects.select_for_update().get(device=device)
+    
+    def append_local_block(self, device, block_id, payload_hash, signature,
+                           received_lamport=None, received_vector_clock=None, lamport_clock=None):
+        """
+        Append a block to device's local chain, linking it to the chain head.
+        Head read, block insert and head advance share one transaction, so
+        concurrent appends for the same device cannot fork the chain.
+        Callers appending several blocks in one transaction pass lamport_clock
+        ticked beforehand (see LamportClockService).
+        """
+        if lamport_clock is None:
+            lamport_clock = self.increment_lamport_clock(received_lamport)
+        with transaction.atomic():
+            head = self.lock_chain_head(device)
+            block = LocalLedgerBlock.objects.create(
+                block_id=block_id,
+                prev_hash=head.head_hash,
+                payload_hash=payload_hash,
+                signature=signature,
+                device=device,
+                lamport_clock=lamport_clock,
+                vector_clock=self.update_vector_clock(
+                    device.device_id, head.vector_clock, received_clock=received_vector_clock
+                ),
+                is_synced=False  # Will sync when back online
+            )
+            head.advance(block)
+            state_history.record_blocks(device.pk, 1, 1)
+        return block
+    
+    def import_local_blocks(self, device, blocks):
+        """
+        Store blocks of device's chain received from a peer, skipping ones
+        already present, and move the chain head to the device's latest block.
+        Returns the number of blocks inserted.
+        """
+        if not blocks:
+            return 0
+        with transaction.atomic():
+            head = self.lock_chain_head(device)
+            existing = set(LocalLedgerBlock.objects.filter(
+                block_id__in=[block.block_id for block in blocks]
+            ).values_list('block_id', flat=True))
+            new_blocks = [block for block in blocks if block.block_id not in existing]
+            timestamps = {block.block_id: block.timestamp for block in new_blocks}
+            LocalLedgerBlock.objects.bulk_create(new_blocks, ignore_conflicts=True)
+            
+            # auto_now_add stamped the rows on insert; keep the peer's timestamps
+            stored = list(LocalLedgerBlock.objects.filter(block_id__in=timestamps).only('pk', 'block_id'))
+            for block in stored:
+                block.timestamp = timestamps[block.block_id]
+            LocalLedgerBlock.objects.bulk_update(stored, ['timestamp'])
+            
+            inserted = len(stored)
+            if inserted:
+                latest = LocalLedgerBlock.objects.filter(device=device).order_by('-timestamp', '-pk').first()
+                head.height += inserted
+                head.pending_blocks += inserted
+                head.head_block_pk = latest.pk
+                head.head_hash = latest.payload_hash
+                head.vector_clock_packed = latest.vector_clock_packed
+                head.save()
+                state_history.record_blocks(device.pk, inserted, inserted)
+                block_ids = [block.block_id for block in stored]
+                transaction.on_commit(lambda: blocks_imported.send(
+                    sender=self.__class__, device=device, block_ids=block_ids
+                ))
+        return inserted
     
     def resolve_conflicts(self, local_blocks, master_blocks):
         """
         Resolve conflicts using Lamport clocks and vector clocks
         Priority: 1) Lamport clock, 2) Vector clock comparison, 3) Hash comparison
+        On a Lamport tie the local block wins only if it causally follows the
+        master block, or if the two are concurrent and its payload hash is higher.
         """
         conflicts = []
         resolved_blocks = []
+        master_index = MasterLedgerIndex(master_blocks)
         
         for local_block in local_blocks:
-            conflict_found = False
-            
-            for master_block in master_blocks:
-                # Check for timestamp conflicts
-                if (local_block.timestamp == master_block.timestamp or
-                    abs((local_block.timestamp - master_block.timestamp).total_seconds()) < 1):
-                    
-                    # Use Lamport clock for ordering
-                    if local_block.lamport_clock > master_block.lamport_clock:
-                        resolved_blocks.append(local_block)
-                        conflicts.append({
-                            'type': 'timestamp_conflict',
-                            'resolution': 'lamport_clock_priority',
-                            'local_block': local_block.block_id,
-                            'master_block': master_block.tx_hash
-                        })
-                    elif local_block.lamport_clock < master_block.lamport_clock:
-                        # Master block takes priority
-                        pass
-                    else:
-                        # Vector clock comparison or hash-based tie-breaking
-                        if self.compare_vector_clocks(local_block.vector_clock, master_block.vector_clock):
-                            resolved_blocks.append(local_block)
-                        conflicts.append({
-                            'type': 'lamport_tie',
-                            'resolution': 'vector_clock_comparison',
-                            'local_block': local_block.block_id
-                        })
-                    
-                    conflict_found = True
-                    break
+            # Check for timestamp conflicts
+            master_block = master_index.find_conflict(local_block.timestamp)
+            if master_block is None:
+                resolved_blocks.append(local_block)
+                continue
             
-            if not conflict_found:
+            # Use Lamport clock for ordering
+            if local_block.lamport_clock > master_block.lamport_clock:
                 resolved_blocks.append(local_block)
+                conflicts.append({
+                    'type': 'timestamp_conflict',
+                    'resolution': 'lamport_clock_priority',
+                    'local_block': local_block.block_id,
+                    'master_block': master_block.tx_hash
+                })
+            elif local_block.lamport_clock < master_block.lamport_clock:
+                # Master block takes priority
+                pass
+            else:
+                # Vector clock comparison or hash-based tie-breaking
+                ordering = self.compare_vector_clocks(local_block.vector_clock, master_block.vector_clock)
+                if ordering == vector_clocks.AFTER or (
+                    ordering == vector_clocks.CONCURRENT and
+                    local_block.payload_hash > master_block.payload_hash
+                ):
+                    resolved_blocks.append(local_block)
+                conflicts.append({
+                    'type': 'lamport_tie',
+                    'resolution': 'vector_clock_comparison',
+                    'ordering': ordering,
+                    'local_block': local_block.block_id
+                })
         
         return resolved_blocks, conflicts
     
+    def fetch_master_window(self, local_blocks):
+        """
+        Load only the master blocks that can conflict with local_blocks.
+        Overlapping conflict windows are merged and queried in OR'd batches.
+        """
+        ranges = []
+        for timestamp in sorted(block.timestamp for block in local_blocks):
+            start, end = timestamp - CONFLICT_WINDOW, timestamp + CONFLICT_WINDOW
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        
+        master_blocks = []
+        for i in range(0, len(ranges), MASTER_WINDOW_BATCH):
+            window_filter = Q()
+            for start, end in ranges[i:i + MASTER_WINDOW_BATCH]:
+                window_filter |= Q(timestamp__gt=start, timestamp__lt=end)
+            master_blocks.extend(
+                BlockchainTransaction.objects.filter(window_filter)
+                .only('tx_hash', 'timestamp', 'lamport_clock', 'payload_hash', 'vector_clock_packed')
+                .order_by('id')
+            )
+        return master_blocks
+    
     def compare_vector_clocks(self, clock1, clock2):
-        """Compare vector clocks to determine causal ordering"""
-        # TODO: Implement proper vector clock comparison
-        # For now, use simple comparison
-        return sum(clock1.values()) > sum(clock2.values())
+        """Causal ordering of clock1 relative to clock2 (before/after/equal/concurrent)"""
+        return vector_clocks.compare(clock1, clock2)
     
-    def validate_block_integrity(self, block):
-        """Validate block hash, signature, and chain integrity"""
+    def block_digest(self, block, prev_digest='genesis'):
+        """Chain digest of block folded onto the digest of everything before it"""
+        return self.create_block_hash({
+            'block_id': block.block_id,
+            'prev_hash': block.prev_hash,
+            'payload_hash': block.payload_hash,
+            'timestamp': block.timestamp,
+            'device': block.device_id,
+            'prev_digest': prev_digest
+        })
+    
+    def validate_block_integrity(self, block, expected_prev_hash=None, signature_valid=None):
+        """
+        Validate block hash, signature, and chain integrity
+        expected_prev_hash is the payload_hash of the preceding block (or
+        'genesis'); linkage is only checked when the caller knows it.
+        signature_valid lets batch callers pass a precomputed signature result.
+        """
         try:
-            # 1. Validate hash
-            expected_hash = self.create_block_hash({
-                'block_id': block.block_id,
-                'prev_hash': block.prev_hash,
-                'payload_hash': block.payload_hash,
-                'timestamp': block.timestamp.isoformat(),
-                'device': str(block.device_id)
-            })
+            # 1. Validate hash fields are present
+            if not block.payload_hash or not block.prev_hash:
+                return False
             
-            # 2. Validate signature (placeholder)
-            signature_valid = self.validate_signature(block, None)  # TODO: Add public key
+            # 2. Validate signature
+            if signature_valid is None:
+                signature_valid = self.validate_signature(block)
+            if not signature_valid:
+                return False
             
             # 3. Check chain integrity (prev_hash linkage)
-            # TODO: Implement chain validation
+            if expected_prev_hash is not None and block.prev_hash != expected_prev_hash:
+                return False
             
-            return signature_valid
+            return True
         except Exception as e:
             return False
     
+    def encode_resync_cursor(self, block):
+        """Cursor pointing just past block in (lamport_clock, id) order"""
+        return f"{block.lamport_clock}:{block.pk}"
+    
+    def decode_resync_cursor(self, cursor):
+        """Parse a resync cursor; raises ValueError if malformed"""
+        lamport_clock, block_pk = str(cursor).split(':')
+        return int(lamport_clock), int(block_pk)
+    
+    def fetch_resync_chunk(self, device_id, cursor=None, chunk_size=RESYNC_CHUNK_SIZE):
+        """
+        Fetch the next chunk of unsynced blocks for a device after cursor.
+        Blocks are keyed on (lamport_clock, id), so a client that resends its
+        last acknowledged cursor resumes exactly where that chunk ended.
+        Returns: blocks, next_cursor, has_more
+        """
+        chunk_size = max(1, min(int(chunk_size), RESYNC_MAX_CHUNK_SIZE))
+        queryset = LocalLedgerBlock.objects.filter(
+            device__device_id=device_id,
+            is_synced=False
+        )
+        
+        if cursor:
+            lamport_clock, block_pk = self.decode_resync_cursor(cursor)
+            queryset = queryset.filter(
+                Q(lamport_clock__gt=lamport_clock) |
+                Q(lamport_clock=lamport_clock, pk__gt=block_pk)
+            )
+        
+        # One extra row tells us whether another chunk follows
+        blocks = list(queryset.order_by('lamport_clock', 'pk')[:chunk_size + 1])
+        has_more = len(blocks) > chunk_size
+        blocks = blocks[:chunk_size]
+        next_cursor = self.encode_resync_cursor(blocks[-1]) if blocks else cursor
+        
+        return blocks, next_cursor, has_more
+    
     def sync_local_to_master(self, local_blocks):
         """
         Sync local ledger blocks to master blockchain ledger
         Returns: sync_status, conflicts, merged_blocks
         """
         try:
-            # 1. Fetch current master ledger
-            master_blocks = list(BlockchainTransaction.objects.all())
-            
-            # 2. Validate local blocks
+            # 1. Validate local blocks, verifying signatures in one batch
+            pending_blocks = [block for block in local_blocks if not block.is_synced]
+            public_keys = dict(Device.objects.filter(
+                pk__in={block.device_id for block in pending_blocks}
+            ).values_list('pk', 'public_key'))
+            signature_results, signature_stats = signature_verifier.verify_blocks(
+                pending_blocks, public_keys
+            )
             valid_local_blocks = [
-                block for block in local_blocks 
-                if self.validate_block_integrity(block) and not block.is_synced
+                block for block in pending_blocks
+                if self.validate_block_integrity(block, signature_valid=signature_results[block.pk])
             ]
             
+            # 2. Fetch the master ledger window around the local blocks
+            master_blocks = self.fetch_master_window(valid_local_blocks)
+            
             # 3. Resolve conflicts
             resolved_blocks, conflicts = self.resolve_conflicts(valid_local_blocks, master_blocks)
             
-            # 4. Append resolved blocks to master ledger
-            merged_count = 0
-            for block in resolved_blocks:
-                try:
-                    # Convert LocalLedgerBlock to BlockchainTransaction
-                    master_block = BlockchainTransaction.objects.create(
-                        tx_hash=f"tx_{block.block_id}",
-                        block_id=block.block_id,
-                        sender=str(block.device_id),
-                        receiver="broadcast",  # TODO: Get actual receiver
-                        payload_hash=block.payload_hash,
-                        timestamp=block.timestamp,
-                        signature=block.signature,
-                        lamport_clock=block.lamport_clock,
-                        vector_clock=block.vector_clock,
-                        is_synced=True
-                    )
-                    
-                    # Mark local block as synced
-                    block.is_synced = True
-                    block.save()
-                    
-                    merged_count += 1
-                except Exception as e:
-                    # Handle duplicate or invalid blocks
-                    continue
+            # 4. Append resolved blocks to master ledger in one transaction
+            with transaction.atomic():
+                inserted_count, skipped_count = self.merge_blocks(resolved_blocks)
             
             return {
                 'status': 'success',
                 'received_blocks': len(local_blocks),
                 'valid_blocks': len(valid_local_blocks),
                 'conflicts': conflicts,
-                'merged_blocks': merged_count,
+                'merged_blocks': inserted_count,
+                'inserted_blocks': inserted_count,
+                'skipped_blocks': skipped_count,
+                'signature_verification': signature_stats,
                 'master_ledger_size': BlockchainTransaction.objects.count()
             }
             
@@ -181,8 +375,60 @@ class BlockchainSyncManager:
             return {
                 'status': 'error',
                 'error': str(e),
-                'merged_blocks': 0
+                'merged_blocks': 0,
+                'inserted_blocks': 0,
+                'skipped_blocks': 0
             }
+    
+    def merge_blocks(self, blocks, chunk_size=MERGE_CHUNK_SIZE):
+        """
+        Bulk-insert blocks into the master ledger and mark them synced locally.
+        Blocks already present in the master ledger (same tx_hash) are skipped
+        but still marked synced. Returns (inserted_count, skipped_count).
+        """
+        inserted_count = 0
+        skipped_count = 0
+        
+        for i in range(0, len(blocks), chunk_size):
+            chunk = blocks[i:i + chunk_size]
+            tx_hashes = [f"tx_{block.block_id}" for block in chunk]
+            existing = BlockchainTransaction.objects.filter(tx_hash__in=tx_hashes).count()
+            device_ids = dict(Device.objects.filter(
+                pk__in={block.device_id for block in chunk}
+            ).values_list('pk', 'device_id'))
+            
+            transactions = [
+                # Convert LocalLedgerBlock to BlockchainTransaction
+                BlockchainTransaction(
+                    tx_hash=tx_hash,
+                    block_id=block.block_id,
+                    sender=str(block.device_id),
+                    receiver="broadcast",  # TODO: Get actual receiver
+                    payload_hash=block.payload_hash,
+                    timestamp=block.timestamp,
+                    signature=block.signature,
+                    lamport_clock=block.lamport_clock,
+                    vector_clock_packed=block.vector_clock_packed,
+                    is_synced=True
+                )
+                for tx_hash, block in zip(tx_hashes, chunk)
+            ]
+            BlockchainTransaction.objects.bulk_create(transactions, ignore_conflicts=True)
+            transactions_merged.send(
+                sender=self.__class__, transactions=transactions,
+                sender_device_ids=[device_ids[block.device_id] for block in chunk]
+            )
+            
+            added = BlockchainTransaction.objects.filter(tx_hash__in=tx_hashes).count() - existing
+            inserted_count += added
+            skipped_count += len(chunk) - added
+            
+            # Mark local blocks as synced
+            ledger_stats.mark_synced([block.pk for block in chunk])
+            for block in chunk:
+                block.is_synced = True
+        
+        return inserted_count, skipped_count
 
 # Singleton instance
 blockchain_sync = BlockchainSyncManager()
\ No newline at end of file
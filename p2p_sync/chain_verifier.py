@@ -0,0 +1,121 @@
+"""
+Incremental chain-integrity verification for local mini-ledgers
+Walks each device's LocalLedgerBlock chain and records verified checkpoints
+"""
+from django.db.models import Q
+from users.models import Device
+from .models import LocalLedgerBlock, ChainCheckpoint
+from .blockchain_sync import blockchain_sync
+
+# Rows fetched per round-trip while streaming a chain
+VERIFY_ITERATOR_CHUNK = 2000
+# Persist checkpoint progress every N verified blocks
+CHECKPOINT_INTERVAL = 10000
+
+
+class ChainVerifier:
+    """
+    Verifies prev_hash linkage and RSA signatures of each device's chain in
+    (timestamp, id) order, the same order used to pick prev_hash on append.
+    A ChainCheckpoint per device records how far the chain has been verified,
+    so regular runs only look at blocks appended since the last run. A full
+    audit re-walks from genesis and checks the running digest against the
+    stored checkpoint to catch edits to already-verified history, and flags
+    a chain that now ends below the checkpoint as truncated. A full audit
+    never lowers the stored checkpoint.
+    """
+
+    def verify_device(self, device, full=False):
+        """Verify one device's chain; returns a result dict"""
+        checkpoint, _ = ChainCheckpoint.objects.get_or_create(device=device)
+        blocks = LocalLedgerBlock.objects.filter(device=device).only(
+            'id', 'block_id', 'prev_hash', 'payload_hash', 'timestamp', 'signature', 'device_id'
+        ).order_by('timestamp', 'pk')
+
+        if full:
+            height, head_hash, digest = 0, 'genesis', 'genesis'
+            audit_height, audit_digest = checkpoint.height, checkpoint.chain_digest
+        else:
+            height, head_hash, digest = checkpoint.height, checkpoint.head_hash, checkpoint.chain_digest
+            audit_height, audit_digest = None, None
+            if checkpoint.last_block_pk is not None:
+                blocks = blocks.filter(
+                    Q(timestamp__gt=checkpoint.last_timestamp) |
+                    Q(timestamp=checkpoint.last_timestamp, pk__gt=checkpoint.last_block_pk)
+                )
+
+        start_height = height
+        public_key = device.public_key
+        last_block = None
+        failure = None
+
+        for block in blocks.iterator(chunk_size=VERIFY_ITERATOR_CHUNK):
+            signature_valid = blockchain_sync.validate_signature(block, public_key)
+            if not blockchain_sync.validate_block_integrity(
+                block, expected_prev_hash=head_hash, signature_valid=signature_valid
+            ):
+                failure = {
+                    'block_id': block.block_id,
+                    'height': height + 1,
+                    'reason': 'broken_link' if block.prev_hash != head_hash else 'invalid_block'
+                }
+                break
+
+            height += 1
+            head_hash = block.payload_hash
+            digest = blockchain_sync.block_digest(block, digest)
+            last_block = block
+
+            if height == audit_height and digest != audit_digest:
+                # Verified history no longer hashes to the stored checkpoint
+                failure = {
+                    'block_id': block.block_id,
+                    'height': height,
+                    'reason': 'checkpoint_digest_mismatch'
+                }
+                break
+
+            if height % CHECKPOINT_INTERVAL == 0 and (audit_height is None or height > audit_height):
+                self._save_checkpoint(checkpoint, height, head_hash, digest, last_block)
+
+        if failure is None and full and audit_height and height < audit_height:
+            # Verified blocks at the tail of the chain have been deleted
+            failure = {
+                'block_id': last_block.block_id if last_block else None,
+                'height': height,
+                'reason': 'truncated'
+            }
+
+        # Record the verified prefix, unless it contradicts or rewinds the stored checkpoint
+        rewinds = full and audit_height and height < audit_height
+        if (failure is None or failure['reason'] != 'checkpoint_digest_mismatch') and not rewinds \
+                and (last_block is not None or full):
+            self._save_checkpoint(checkpoint, height, head_hash, digest, last_block)
+
+        return {
+            'device_id': device.device_id,
+            'status': 'ok' if failure is None else 'broken',
+            'verified_blocks': height - start_height,
+            'height': height,
+            'chain_digest': digest,
+            'failure': failure
+        }
+
+    def verify_all(self, device_ids=None, full=False):
+        """Verify every device chain (or only device_ids); yields result dicts"""
+        devices = Device.objects.only('id', 'device_id', 'public_key').order_by('pk')
+        if device_ids:
+            devices = devices.filter(device_id__in=device_ids)
+        for device in devices.iterator():
+            yield self.verify_device(device, full=full)
+
+    def _save_checkpoint(self, checkpoint, height, head_hash, digest, last_block):
+        checkpoint.height = height
+        checkpoint.head_hash = head_hash
+        checkpoint.chain_digest = digest
+        checkpoint.last_block_pk = last_block.pk if last_block else None
+        checkpoint.last_timestamp = last_block.timestamp if last_block else None
+        checkpoint.save()
+
+# Singleton instance
+chain_verifier = ChainVerifier()
@@ -0,0 +1,203 @@
+"""
+Gossip dissemination for BROADCAST messages across the P2P mesh
+Push-pull epidemic spread: each node forwards a new rumor to FANOUT peers,
+and periodic pulls repair anything the pushes missed.
+
+Protocol (every message is a dict):
+  gossip_push -> gossip_ack       rumor with hop count and a bloom filter of
+                                  nodes known to have it; receivers forward it
+                                  only to peers outside the filter
+  gossip_pull -> gossip_rumors    bloom filter of rumor ids the puller holds;
+                                  the reply carries retained rumors it lacks
+"""
+from collections import OrderedDict
+import base64
+import hashlib
+import json
+import math
+import random
+import threading
+
+# Peers each node pushes a new rumor to
+FANOUT = 4
+# Forwarding stops after this many hops; pulls reach anything beyond
+MAX_HOPS = 12
+# Rumors kept per node for deduplication and for answering pulls
+RETAIN = 1000
+# Rumors returned per pull reply
+PULL_LIMIT = 100
+# Capacity and false-positive rate of the per-rumor seen-set; a rumor copy
+# collects at most FANOUT + 1 nodes per hop along its path
+SEEN_CAPACITY = 64
+SEEN_ERROR_RATE = 0.02
+# False-positive rate of the pull filter, sized to the rumors held (at least PULL_MIN_CAPACITY)
+PULL_ERROR_RATE = 0.01
+PULL_MIN_CAPACITY = 16
+
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over string keys. seed salts the hash functions,
+    so a key that collides in one filter is unlikely to collide in the next.
+    """
+
+    def __init__(self, bits, hashes, seed=0, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.seed = seed
+        self.data = bytearray(data) if data is not None else bytearray(-(-bits // 8))
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate, seed=0):
+        bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes, seed)
+
+    def _positions(self, key):
+        digest = hashlib.sha256(f'{self.seed}:{key}'.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_wire(self):
+        return [self.bits, self.hashes, self.seed, base64.b64encode(bytes(self.data)).decode()]
+
+    @classmethod
+    def from_wire(cls, wire):
+        bits, hashes, seed, data = wire
+        data = base64.b64decode(data)
+        if len(data) != -(-bits // 8):
+            raise ValueError('bloom filter size does not match its bit count')
+        return cls(bits, hashes, seed, data)
+
+
+def make_rumor_id(payload):
+    """Default rumor id: hash of the canonical JSON payload"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class GossipNode:
+    """
+    One node's view of the gossip protocol. peers() returns the ids this node
+    can reach, send(peer_id, message) delivers fire-and-forget and returns
+    False if the peer is unreachable, deliver(payload) is called once per new
+    rumor. Handlers may run on several transport threads at once: rumors and
+    stats are only touched under _lock, which is released before deliver()
+    and send() so a send that loops back into this node cannot deadlock.
+    """
+
+    def __init__(self, node_id, peers, send, deliver=None, fanout=FANOUT, max_hops=MAX_HOPS,
+                 retain=RETAIN, rng=None):
+        self.node_id = node_id
+        self.peers = peers
+        self.send = send
+        self.deliver = deliver
+        self.fanout = fanout
+        self.max_hops = max_hops
+        self.retain = retain
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.rumors = OrderedDict()  # rumor id -> rumor, oldest first
+        self.stats = {'pushed': 0, 'received': 0, 'duplicates': 0, 'delivered': 0, 'pulls': 0, 'pulled': 0}
+
+    def broadcast(self, payload, rumor_id=None):
+        """Deliver payload locally and start spreading it; returns the rumor"""
+        rumor = {
+            'type': 'gossip_push',
+            'id': rumor_id or make_rumor_id(payload),
+            'origin': self.node_id,
+            'hops': 0,
+            'seen': None,
+            'payload': payload
+        }
+        self._accept(rumor)
+        return rumor
+
+    def handle(self, message):
+        handler = getattr(self, f"handle_{message.get('type')}", None)
+        if handler is None:
+            return {'type': 'error', 'error': f"unknown message type {message.get('type')!r}"}
+        return handler(message)
+
+    def handle_gossip_push(self, message):
+        with self._lock:
+            self.stats['received'] += 1
+        if not self._accept(message):
+            with self._lock:
+                self.stats['duplicates'] += 1
+            return {'type': 'gossip_ack', 'id': message['id'], 'new': False}
+        return {'type': 'gossip_ack', 'id': message['id'], 'new': True}
+
+    def handle_gossip_pull(self, message):
+        have = BloomFilter.from_wire(message['have'])
+        with self._lock:
+            held = list(reversed(self.rumors.items()))
+        missing = [rumor for rumor_id, rumor in held if rumor_id not in have]
+        return {'type': 'gossip_rumors', 'rumors': missing[:PULL_LIMIT]}
+
+    def pull_request(self):
+        """gossip_pull message listing (as a freshly salted bloom filter) the rumors held"""
+        with self._lock:
+            held = list(self.rumors)
+            self.stats['pulls'] += 1
+        have = BloomFilter.for_capacity(max(len(held), PULL_MIN_CAPACITY), PULL_ERROR_RATE,
+                                        seed=self.rng.getrandbits(32))
+        for rumor_id in held:
+            have.add(rumor_id)
+        return {'type': 'gossip_pull', 'have': have.to_wire()}
+
+    def handle_gossip_rumors(self, message):
+        """Apply a pull reply; rumors found this way are kept and served, not re-pushed"""
+        new = 0
+        for rumor in message.get('rumors', []):
+            if self._accept(rumor, forward=False):
+                new += 1
+        with self._lock:
+            self.stats['pulled'] += new
+        return {'type': 'gossip_ack', 'new': new}
+
+    def _accept(self, rumor, forward=True):
+        """Store rumor if it is new, then deliver and forward it; False for a rumor already held"""
+        with self._lock:
+            if rumor['id'] in self.rumors:
+                return False
+            self.rumors[rumor['id']] = rumor
+            while len(self.rumors) > self.retain:
+                self.rumors.popitem(last=False)
+            self.stats['delivered'] += 1
+        if self.deliver is not None:
+            self.deliver(rumor['payload'])
+        if forward and rumor['hops'] < self.max_hops:
+            self._forward(rumor)
+        return True
+
+    def _forward(self, rumor):
+        """Push to up to fanout reachable peers outside the rumor's seen-set"""
+        if rumor['seen'] is not None:
+            seen = BloomFilter.from_wire(rumor['seen'])
+        else:
+            seen = BloomFilter.for_capacity(SEEN_CAPACITY, SEEN_ERROR_RATE)
+        seen.add(self.node_id)
+        candidates = [peer_id for peer_id in self.peers() if peer_id != self.node_id and peer_id not in seen]
+        self.rng.shuffle(candidates)
+
+        # Targets join the seen-set before sending, so they skip each other
+        targets = candidates[:self.fanout]
+        for peer_id in targets:
+            seen.add(peer_id)
+        outgoing = {**rumor, 'hops': rumor['hops'] + 1, 'seen': seen.to_wire()}
+        spare = iter(candidates[self.fanout:])
+        for peer_id in targets:
+            while peer_id is not None and not self.send(peer_id, outgoing):
+                # Unreachable: try the next candidate instead
+                peer_id = next(spare, None)
+            if peer_id is not None:
+                with self._lock:
+                    self.stats['pushed'] += 1
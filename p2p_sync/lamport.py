@@ -0,0 +1,75 @@
+"""
+Process-safe, persistent Lamport clock
+Workers lease blocks of values from a LamportCounter row so every process
+hands out unique, increasing values without a DB round-trip per event
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import LamportCounter
+import os
+import threading
+
+LEDGER_CLOCK = 'ledger'
+
+
+class LamportClockService:
+    """
+    Hands out Lamport values from a leased range [next_value, ceiling].
+    A lease is one atomic UPDATE on the counter row, so ranges never overlap
+    across workers and the clock survives restarts (unused values are skipped).
+    Leases commit on the LAMPORT_DATABASE connection, outside any transaction
+    the caller has open; on SQLite take ticks before that transaction writes,
+    since it would hold the write lock the lease needs.
+    """
+
+    def __init__(self, name=LEDGER_CLOCK, lease_size=None):
+        self.name = name
+        self.lease_size = lease_size
+        self.next_value = 1
+        self.ceiling = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_lease_size(self):
+        return self.lease_size or settings.LAMPORT_LEASE_SIZE
+
+    def lease(self, floor=0):
+        """Reserve the next block of values above both the counter and floor"""
+        size = self.get_lease_size()
+        alias = settings.LAMPORT_DATABASE
+        counters = LamportCounter.objects.using(alias)
+        with transaction.atomic(using=alias):
+            counters.get_or_create(name=self.name)
+            counters.filter(name=self.name).update(value=Greatest(F('value'), floor) + size)
+            ceiling = counters.filter(name=self.name).values_list('value', flat=True).get()
+        self.next_value = ceiling - size + 1
+        self.ceiling = ceiling
+        self._pid = os.getpid()
+
+    def tick(self, received_clock=None):
+        """Next clock value; for receive events it is greater than received_clock"""
+        received_clock = int(received_clock or 0)
+        with self._lock:
+            # A forked worker must not reuse the lease it inherited from its parent
+            if self._pid != os.getpid() or self.next_value > self.ceiling:
+                self.lease(received_clock)
+            elif received_clock >= self.next_value:
+                if received_clock < self.ceiling:
+                    self.next_value = received_clock + 1
+                else:
+                    self.lease(received_clock)
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+    def reset(self):
+        """Drop the current lease; the next tick leases a fresh block"""
+        with self._lock:
+            self.next_value = 1
+            self.ceiling = 0
+            self._pid = None
+
+# Singleton instance
+lamport_clock_service = LamportClockService()
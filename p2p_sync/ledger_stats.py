@@ -0,0 +1,115 @@
+"""
+Pending/total block counters for local mini-ledgers
+Kept on each device's ChainHead so status polls read counters instead of
+running COUNT(*) over LocalLedgerBlock
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from collections import Counter
+from .models import LocalLedgerBlock, ChainHead
+from .state_history import state_history
+
+
+class LedgerStats:
+    """
+    Appends bump ChainHead.height/pending_blocks (see ChainHead.advance) and
+    mark_synced decrements pending_blocks in the same transaction as the
+    is_synced update. reconcile() recounts from LocalLedgerBlock to correct
+    drift from writes that bypass both paths (admin, CRUD API, raw SQL).
+    Every counter change is also logged to state_history.
+    """
+
+    def device_counts(self, device_pk):
+        """Actual (total, pending) block counts for one device"""
+        blocks = LocalLedgerBlock.objects.filter(device_id=device_pk)
+        return blocks.count(), blocks.filter(is_synced=False).count()
+
+    def seed_chain_head(self, device_pk):
+        """Create device's ChainHead from its latest block and counts, if missing"""
+        latest = LocalLedgerBlock.objects.filter(device_id=device_pk).order_by('-timestamp', '-pk').first()
+        total, pending = self.device_counts(device_pk)
+        head, created = ChainHead.objects.get_or_create(device_id=device_pk, defaults={
+            'height': total,
+            'pending_blocks': pending,
+            'head_block_pk': latest.pk if latest else None,
+            'head_hash': latest.payload_hash if latest else 'genesis',
+            'vector_clock_packed': latest.vector_clock_packed if latest else b''
+        })
+        if created:
+            state_history.record_blocks(device_pk, total, pending)
+        return head
+
+    def mark_synced(self, block_pks):
+        """Mark blocks synced and decrement their devices' pending counters"""
+        with transaction.atomic():
+            # Lock the still-pending rows so concurrent syncs never decrement twice
+            pending = list(LocalLedgerBlock.objects.select_for_update().filter(
+                pk__in=block_pks, is_synced=False
+            ).values_list('pk', 'device_id'))
+            if not pending:
+                return 0
+            LocalLedgerBlock.objects.filter(pk__in=[pk for pk, _ in pending]).update(
+                is_synced=True, synced_at=timezone.now()
+            )
+            synced_per_device = Counter(device_pk for _, device_pk in pending)
+            for device_pk, synced in synced_per_device.items():
+                ChainHead.objects.filter(device_id=device_pk).update(
+                    pending_blocks=F('pending_blocks') - synced
+                )
+            state_history.record_synced(synced_per_device)
+        return len(pending)
+
+    def totals(self, device=None):
+        """{'total', 'pending', 'synced'} for one device or the whole deployment"""
+        heads = ChainHead.objects.all()
+        if device is not None:
+            heads = heads.filter(device=device)
+        counts = heads.aggregate(total=Sum('height'), pending=Sum('pending_blocks'))
+        total, pending = counts['total'] or 0, counts['pending'] or 0
+        return {'total': total, 'pending': pending, 'synced': total - pending}
+
+    def reconcile(self):
+        """
+        Recount every device's blocks and correct drifted counters.
+        Drifted devices are recounted under the chain-head lock so concurrent
+        appends are not lost. Returns a list of correction dicts.
+        """
+        actual = {
+            row['device_id']: (row['total'], row['pending'])
+            for row in LocalLedgerBlock.objects.values('device_id').annotate(
+                total=Count('pk'), pending=Count('pk', filter=Q(is_synced=False))
+            ).order_by()
+        }
+        stored = {
+            row['device_id']: (row['height'], row['pending_blocks'])
+            for row in ChainHead.objects.values('device_id', 'height', 'pending_blocks')
+        }
+
+        corrections = []
+        for device_pk in sorted(set(actual) | set(stored)):
+            if actual.get(device_pk, (0, 0)) == stored.get(device_pk, (0, 0)):
+                continue
+            with transaction.atomic():
+                if not ChainHead.objects.filter(device_id=device_pk).update(updated_at=timezone.now()):
+                    head = self.seed_chain_head(device_pk)
+                    corrections.append({
+                        'device_pk': device_pk,
+                        'before': None,
+                        'after': (head.height, head.pending_blocks)
+                    })
+                    continue
+                head = ChainHead.objects.select_for_update().get(device_id=device_pk)
+                total, pending = self.device_counts(device_pk)
+                if (head.height, head.pending_blocks) != (total, pending):
+                    corrections.append({
+                        'device_pk': device_pk,
+                        'before': (head.height, head.pending_blocks),
+                        'after': (total, pending)
+                    })
+                    ChainHead.objects.filter(pk=head.pk).update(height=total, pending_blocks=pending)
+                    state_history.record_blocks(device_pk, total - head.height, pending - head.pending_blocks)
+        return corrections
+
+# Singleton instance
+ledger_stats = LedgerStats()
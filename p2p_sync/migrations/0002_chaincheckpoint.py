@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0001_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.BigIntegerField(default=0)),
+                ('last_block_pk', models.BigIntegerField(blank=True, null=True)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('head_hash', models.CharField(default='genesis', max_length=128)),
+                ('chain_digest', models.CharField(default='genesis', max_length=64)),
+                ('verified_at', models.DateTimeField(auto_now=True)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chain_checkpoint', to='users.device')),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:09
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_ledger_clock(apps, schema_editor):
+    """Start the shared clock above every Lamport value already on the ledgers"""
+    LamportCounter = apps.get_model('p2p_sync', 'LamportCounter')
+    LocalLedgerBlock = apps.get_model('p2p_sync', 'LocalLedgerBlock')
+    BlockchainTransaction = apps.get_model('blockchain', 'BlockchainTransaction')
+    value = max(
+        LocalLedgerBlock.objects.aggregate(value=Max('lamport_clock'))['value'] or 0,
+        BlockchainTransaction.objects.aggregate(value=Max('lamport_clock'))['value'] or 0,
+    )
+    LamportCounter.objects.update_or_create(name='ledger', defaults={'value': value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blockchain', '0002_packed_vector_clock'),
+        ('p2p_sync', '0003_packed_vector_clock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LamportCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_ledger_clock, migrations.RunPython.noop),
+    ]
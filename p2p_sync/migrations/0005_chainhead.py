@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_chain_heads(apps, schema_editor):
+    """Point each device's chain head at its current latest block"""
+    ChainHead = apps.get_model('p2p_sync', 'ChainHead')
+    LocalLedgerBlock = apps.get_model('p2p_sync', 'LocalLedgerBlock')
+    heights = LocalLedgerBlock.objects.values('device_id').annotate(height=Count('pk'))
+    for row in heights.order_by('device_id'):
+        block = LocalLedgerBlock.objects.filter(device_id=row['device_id']).order_by('-timestamp', '-pk').first()
+        ChainHead.objects.create(
+            device_id=row['device_id'],
+            height=row['height'],
+            head_block_pk=block.pk,
+            head_hash=block.payload_hash,
+            vector_clock_packed=block.vector_clock_packed
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0004_lamportcounter'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.BigIntegerField(default=0)),
+                ('head_block_pk', models.BigIntegerField(blank=True, null=True)),
+                ('head_hash', models.CharField(default='genesis', max_length=128)),
+                ('vector_clock_packed', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='chain_head', to='users.device')),
+            ],
+        ),
+        migrations.RunPython(seed_chain_heads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0005_chainhead'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='localledgerblock',
+            index=models.Index(fields=['device', 'timestamp'], name='ledger_device_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='localledgerblock',
+            index=models.Index(condition=models.Q(('is_synced', False)), fields=['device', 'lamport_clock'], name='ledger_pending_device_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='localledgerblock',
+            index=models.Index(condition=models.Q(('is_synced', False)), fields=['timestamp'], name='ledger_pending_ts_idx'),
+        ),
+    ]
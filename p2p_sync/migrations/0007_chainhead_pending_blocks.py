@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:14
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_pending_blocks(apps, schema_editor):
+    ChainHead = apps.get_model('p2p_sync', 'ChainHead')
+    LocalLedgerBlock = apps.get_model('p2p_sync', 'LocalLedgerBlock')
+    counts = LocalLedgerBlock.objects.values('device_id').annotate(
+        total=Count('pk'), pending=Count('pk', filter=Q(is_synced=False))
+    ).order_by()
+    for row in counts:
+        ChainHead.objects.filter(device_id=row['device_id']).update(
+            height=row['total'], pending_blocks=row['pending']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chainhead',
+            name='pending_blocks',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(seed_pending_blocks, migrations.RunPython.noop),
+    ]
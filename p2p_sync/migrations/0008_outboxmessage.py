@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0007_chainhead_pending_blocks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peer_id', models.CharField(max_length=128)),
+                ('idempotency_key', models.CharField(max_length=128)),
+                ('envelope', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, default='', max_length=64)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['next_attempt_at'], name='outbox_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('peer_id', 'idempotency_key'), name='outbox_peer_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('p2p_sync', '0008_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerStateDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('device_pk', models.BigIntegerField(blank=True, null=True)),
+                ('height_delta', models.BigIntegerField(default=0)),
+                ('pending_delta', models.BigIntegerField(default=0)),
+                ('mode', models.CharField(blank=True, default='', max_length=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerStateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True)),
+                ('last_delta_pk', models.BigIntegerField(default=0)),
+                ('mode', models.CharField(blank=True, default='', max_length=16)),
+                ('devices', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='localledgerblock',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Dropped after 0003 packed the clocks, so rolling back re-adds the column before they are unpacked"""
+
+    dependencies = [
+        ('p2p_sync', '0009_ledger_state_history'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='localledgerblock',
+            name='vector_clock',
+        ),
+    ]
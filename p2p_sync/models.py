@@ -1,4 +1,12 @@
 from django.db import models
+from django.utils import timezone
+from . import vector_clock as vector_clocks
+
+
+class ClockNode(models.Model):
+    """Per-deployment node index table; packed vector clocks refer to nodes by pk"""
+    node_id = models.CharField(max_length=128, unique=True)
+
 
 class LocalLedgerBlock(models.Model):
     """Local mini-ledger - each peer maintains this for offline redundancy"""
@@ -9,6 +17,104 @@ class LocalLedgerBlock(models.Model):
     signature = models.TextField()
     device = models.ForeignKey('users.Device', on_delete=models.CASCADE)
     lamport_clock = models.IntegerField(default=0)  # For conflict resolution
-    vector_clock = models.JSONField(default=dict)   # For distributed ordering
+    vector_clock_packed = models.BinaryField(default=bytes)  # Packed vector clock for distributed ordering
     is_synced = models.BooleanField(default=False)  # Track if synced to master
-    sync_attempts = models.IntegerField(default=0)  # Track failed sync attempts# Create your models here.
+    sync_attempts = models.IntegerField(default=0)  # Track failed sync attempts
+    synced_at = models.DateTimeField(null=True, blank=True)  # Set by LedgerStats.mark_synced
+
+    class Meta:
+        indexes = [
+            # Chain order per device: head seeding and chain verification
+            models.Index(fields=['device', 'timestamp'], name='ledger_device_ts_idx'),
+            # Resync chunks walk a device's unsynced blocks in (lamport_clock, id) order
+            models.Index(fields=['device', 'lamport_clock'], condition=models.Q(is_synced=False), name='ledger_pending_device_idx'),
+            # Global pending counts and listings
+            models.Index(fields=['timestamp'], condition=models.Q(is_synced=False), name='ledger_pending_ts_idx'),
+        ]
+
+    @property
+    def vector_clock(self):
+        return vector_clocks.unpack(self.vector_clock_packed)
+
+    @vector_clock.setter
+    def vector_clock(self, clock):
+        self.vector_clock_packed = vector_clocks.pack(clock)# Create your models here.
+
+
+class ChainCheckpoint(models.Model):
+    """Verified-up-to marker for a device's local ledger chain"""
+    device = models.OneToOneField('users.Device', on_delete=models.CASCADE, related_name='chain_checkpoint')
+    height = models.BigIntegerField(default=0)  # Number of blocks verified from genesis
+    last_block_pk = models.BigIntegerField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    head_hash = models.CharField(max_length=128, default='genesis')  # payload_hash of the last verified block
+    chain_digest = models.CharField(max_length=64, default='genesis')  # Running hash over all verified blocks
+    verified_at = models.DateTimeField(auto_now=True)
+
+
+class ChainHead(models.Model):
+    """Latest block of a device's local ledger chain, advanced in the same transaction as each append"""
+    device = models.OneToOneField('users.Device', on_delete=models.CASCADE, related_name='chain_head')
+    height = models.BigIntegerField(default=0)  # Blocks on the device's chain
+    pending_blocks = models.BigIntegerField(default=0)  # Blocks not yet synced to the master ledger
+    head_block_pk = models.BigIntegerField(null=True, blank=True)
+    head_hash = models.CharField(max_length=128, default='genesis')  # payload_hash of the latest block
+    vector_clock_packed = models.BinaryField(default=bytes)  # Vector clock of the latest block
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def vector_clock(self):
+        return vector_clocks.unpack(self.vector_clock_packed)
+
+    def advance(self, block):
+        self.height += 1
+        if not block.is_synced:
+            self.pending_blocks += 1
+        self.head_block_pk = block.pk
+        self.head_hash = block.payload_hash
+        self.vector_clock_packed = block.vector_clock_packed
+        self.save()
+
+
+class LamportCounter(models.Model):
+    """Persistent Lamport clock high-water mark; workers lease value blocks from it"""
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)  # Highest value leased to any worker
+
+
+class OutboxMessage(models.Model):
+    """Durable outbound P2P message, kept until the peer acknowledges it (at-least-once delivery)"""
+    peer_id = models.CharField(max_length=128)
+    idempotency_key = models.CharField(max_length=128)  # payload_hash; receivers drop repeats
+    envelope = models.BinaryField()  # wire.encode_envelope bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField()  # Due time for the next (re)transmission
+    attempts = models.IntegerField(default=0)
+    last_error = models.CharField(max_length=64, blank=True, default='')
+    delivered_at = models.DateTimeField(null=True, blank=True)  # Set when the peer acks
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['peer_id', 'idempotency_key'], name='outbox_peer_key_uniq'),
+        ]
+        indexes = [
+            # Drainer scans only undelivered rows in due order
+            models.Index(fields=['next_attempt_at'], condition=models.Q(delivered_at__isnull=True), name='outbox_due_idx'),
+        ]
+
+
+class LedgerStateDelta(models.Model):
+    """One change to ledger state: a device's chain counters or the command-center mode"""
+    recorded_at = models.DateTimeField(default=timezone.now, db_index=True)
+    device_pk = models.BigIntegerField(null=True, blank=True)  # Plain pk, so history outlives deleted devices
+    height_delta = models.BigIntegerField(default=0)
+    pending_delta = models.BigIntegerField(default=0)
+    mode = models.CharField(max_length=16, blank=True, default='')  # New command-center mode, for mode changes
+
+
+class LedgerStateSnapshot(models.Model):
+    """Full ledger state as of taken_at, covering every delta up to last_delta_pk"""
+    taken_at = models.DateTimeField(db_index=True)
+    last_delta_pk = models.BigIntegerField(default=0)
+    mode = models.CharField(max_length=16, blank=True, default='')  # Command-center mode ('' if no command center)
+    devices = models.JSONField(default=dict)  # {device pk: [height, pending_blocks]}
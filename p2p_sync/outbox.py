@@ -0,0 +1,172 @@
+"""
+Durable outbox for offline P2P sends
+Rows are written in the same transaction as the sender's ledger block and
+stay until the peer acks, so a crash or dropped link only delays delivery.
+"""
+from django.conf import settings
+from django.db import close_old_connections, transaction, IntegrityError
+from django.utils import timezone
+from datetime import timedelta
+from .models import OutboxMessage
+from .wire import encode_envelope
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    At-least-once delivery over a P2PTransport. Each transmission first
+    claims the row (a compare-and-set on attempts) and leases it until
+    next_attempt_at (exponential backoff), so processes sharing the table
+    never send a row twice in one lease; the transport's ack marks it
+    delivered. A row that is not acked in time is simply sent again, and
+    receivers drop repeats by payload_hash. A process without a link to the
+    row's peer leaves it due for one that has one. The drainer reads only
+    undelivered rows (outbox_due_idx), so restarting never rescans the
+    ledger; it runs only where started (the drain_outbox command), never
+    from request handling.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {'queued': 0, 'delivered': 0}  # This process's dispatches and acks, guarded by _lock
+
+    def enqueue(self, peer_id, envelope):
+        """
+        Store envelope for peer_id (idempotent per payload_hash); call inside
+        the ledger transaction, then dispatch() the row after commit or leave
+        it for the drainer's next pass
+        """
+        try:
+            with transaction.atomic():
+                row = OutboxMessage.objects.create(
+                    peer_id=peer_id,
+                    idempotency_key=envelope['payload_hash'],
+                    envelope=encode_envelope(envelope),
+                    next_attempt_at=timezone.now()
+                )
+        except IntegrityError:
+            row = OutboxMessage.objects.get(peer_id=peer_id, idempotency_key=envelope['payload_hash'])
+        return row
+
+    def dispatch(self, rows, now=None):
+        """
+        Claim the rows this process has a link for, hand them to the transport
+        and lease them until their retry time; returns rows queued. Rows
+        without a route here are left untouched and due.
+        """
+        now = now or timezone.now()
+        self.transport.start()
+        claimed = self.claim([row for row in rows if self.transport.has_peer(row.peer_id)], now)
+        full = [row.pk for row in claimed if not self.transport.send(row.peer_id, bytes(row.envelope), token=row.pk)]
+        if full:
+            OutboxMessage.objects.filter(pk__in=full).update(last_error='queue_full')
+        queued = len(claimed) - len(full)
+        with self._lock:
+            self._counters['queued'] += queued
+        return queued
+
+    def claim(self, rows, now):
+        """
+        Lease rows whose attempts are unchanged since they were read; a row
+        another process claimed meanwhile is skipped. Returns the rows claimed.
+        """
+        claimed = []
+        with transaction.atomic():
+            for row in rows:
+                lease = now + timedelta(seconds=self.backoff(row.attempts + 1))
+                won = OutboxMessage.objects.filter(
+                    pk=row.pk, attempts=row.attempts, delivered_at__isnull=True
+                ).update(attempts=row.attempts + 1, next_attempt_at=lease, last_error='')
+                if won:
+                    row.attempts += 1
+                    row.next_attempt_at = lease
+                    claimed.append(row)
+        return claimed
+
+    def backoff(self, attempts):
+        return min(settings.P2P_OUTBOX_RETRY_MAX_DELAY, settings.P2P_OUTBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+    def drain(self, limit=None):
+        """One pass over due rows for the peers this process has links to, oldest first; returns {'due', 'queued'}"""
+        now = timezone.now()
+        self.transport.start()
+        peer_ids = self.transport.peer_ids()
+        if not peer_ids:
+            return {'due': 0, 'queued': 0}
+        rows = list(OutboxMessage.objects.filter(
+            delivered_at__isnull=True, next_attempt_at__lte=now, peer_id__in=peer_ids
+        ).order_by('next_attempt_at', 'pk')[:limit or settings.P2P_OUTBOX_BATCH_SIZE])
+        return {'due': len(rows), 'queued': self.dispatch(rows, now) if rows else 0}
+
+    def mark_delivered(self, tokens):
+        """Transport ack_handler: tokens are OutboxMessage pks"""
+        delivered = OutboxMessage.objects.filter(pk__in=tokens, delivered_at__isnull=True).update(
+            delivered_at=timezone.now()
+        )
+        with self._lock:
+            self._counters['delivered'] += delivered
+        return delivered
+
+    def purge(self):
+        """Delete delivered rows older than P2P_OUTBOX_RETENTION_HOURS"""
+        cutoff = timezone.now() - timedelta(hours=settings.P2P_OUTBOX_RETENTION_HOURS)
+        deleted, _ = OutboxMessage.objects.filter(delivered_at__lt=cutoff).delete()
+        return deleted
+
+    def stats(self):
+        """This process's counters; no queries, so status polls stay cheap (see pending_counts)"""
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, 'drainer_running': self._thread is not None and self._thread.is_alive()}
+
+    def pending_counts(self):
+        """{'pending', 'due'} undelivered rows across all processes; two COUNTs, for the drain_outbox command"""
+        pending = OutboxMessage.objects.filter(delivered_at__isnull=True)
+        return {
+            'pending': pending.count(),
+            'due': pending.filter(next_attempt_at__lte=timezone.now()).count()
+        }
+
+    # Background drainer
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='p2p-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join()
+
+    def _run(self):
+        passes = 0
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                result = self.drain()
+                passes += 1
+                if passes % settings.P2P_OUTBOX_PURGE_EVERY == 0:
+                    self.purge()
+            except Exception:
+                logger.exception('Outbox drain failed')
+                result = {'due': 0}
+            finally:
+                close_old_connections()
+            # A full batch means more rows are probably due: go again straight away
+            if result['due'] < settings.P2P_OUTBOX_BATCH_SIZE:
+                self._wakeup.wait(settings.P2P_OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,43 @@
+"""
+Authentication of peers by the P2P_PEER_SECRET shared secret
+HTTP anti-entropy requests carry an HMAC-SHA256 of the raw body in the
+PEER_SIGNATURE_HEADER header. Transport links answer the listener's random
+challenge with its HMAC when they connect. Without a secret nobody is
+authenticated.
+"""
+from django.conf import settings
+import hashlib
+import hmac
+import secrets
+
+PEER_SIGNATURE_HEADER = 'X-P2P-Signature'
+# Keeps a link challenge answer from being replayed as an HTTP body signature
+LINK_CHALLENGE_PREFIX = b'p2p-link:'
+
+
+def sign_request(body, secret=None):
+    """Hex HMAC-SHA256 of body (bytes) for PEER_SIGNATURE_HEADER"""
+    secret = secret or settings.P2P_PEER_SECRET
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_request(body, signature):
+    """True if signature is body's HMAC under P2P_PEER_SECRET; always False when no secret is set"""
+    if not settings.P2P_PEER_SECRET or not signature or not isinstance(signature, str):
+        return False
+    return hmac.compare_digest(sign_request(body).encode(), signature.encode())
+
+
+def new_challenge():
+    """Random nonce a listener sends each incoming link"""
+    return secrets.token_hex(16)
+
+
+def sign_challenge(nonce, secret=None):
+    """Answer to a link challenge"""
+    return sign_request(LINK_CHALLENGE_PREFIX + nonce.encode(), secret)
+
+
+def verify_challenge(nonce, signature):
+    """True if signature answers nonce under P2P_PEER_SECRET; always False when no secret is set"""
+    return verify_request(LINK_CHALLENGE_PREFIX + nonce.encode(), signature)
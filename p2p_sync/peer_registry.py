@@ -0,0 +1,145 @@
+"""
+In-memory registry of discovered P2P peers
+Discovery announcements update it incrementally; status polls read it
+without touching the database.
+"""
+from django.conf import settings
+from django.utils import timezone
+from collections import OrderedDict
+import threading
+import time
+
+
+class PeerRecord:
+    """One peer's last announcement and smoothed link quality"""
+    __slots__ = (
+        'peer_id', 'name', 'address', 'device_type', 'signal', 'distance',
+        'first_seen', 'last_seen', 'last_seen_at', 'announcements'
+    )
+
+    def __init__(self, peer_id, now):
+        self.peer_id = peer_id
+        self.name = peer_id
+        self.address = None
+        self.device_type = None
+        self.signal = None  # EWMA of announced signal strength (0-100)
+        self.distance = None  # EWMA of announced distance (km)
+        self.first_seen = now
+        self.last_seen = now  # time.monotonic(), for expiry
+        self.last_seen_at = timezone.now()  # Wall clock, for display
+        self.announcements = 0
+
+    def to_dict(self, now):
+        signal = round(self.signal) if self.signal is not None else None
+        return {
+            'peer_id': self.peer_id,
+            'id': self.peer_id,
+            'name': self.name,
+            'ip': self.address,
+            'status': 'online' if signal is None or signal > settings.P2P_PEER_MIN_SIGNAL else 'weak',
+            'signal_strength': signal,
+            'signal': signal,  # For compatibility
+            'distance': f'{self.distance:.1f}km' if self.distance is not None else None,
+            'device_type': self.device_type,
+            'last_seen': timezone.localtime(self.last_seen_at).strftime('%H:%M:%S'),
+            'seen_seconds_ago': round(now - self.last_seen, 1),
+            'announcements': self.announcements
+        }
+
+
+class PeerRegistry:
+    """
+    Peers keyed by peer_id in an OrderedDict kept in last-seen order, so
+    lookups are O(1) and expiry pops only the peers older than ttl seconds.
+    Link quality is an EWMA of announced signal strength (weight alpha for
+    the newest sample).
+    """
+
+    def __init__(self, ttl=None, alpha=None):
+        self.ttl = settings.P2P_PEER_TTL if ttl is None else ttl
+        self.alpha = settings.P2P_PEER_SIGNAL_ALPHA if alpha is None else alpha
+        self._peers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def announce(self, peer_id, signal=None, distance=None, address=None, name=None, device_type=None, now=None):
+        """Record an announcement (or any traffic) from peer_id; returns its record"""
+        now = time.monotonic() if now is None else now
+        signal = float(signal) if signal is not None else None
+        distance = float(distance) if distance is not None else None
+        with self._lock:
+            record = self._peers.get(peer_id)
+            if record is None:
+                record = self._peers[peer_id] = PeerRecord(peer_id, now)
+            else:
+                self._peers.move_to_end(peer_id)
+            record.last_seen = now
+            record.last_seen_at = timezone.now()
+            record.announcements += 1
+            if signal is not None:
+                record.signal = self._smooth(record.signal, signal)
+            if distance is not None:
+                record.distance = self._smooth(record.distance, distance)
+            if address is not None:
+                record.address = address
+            if name is not None:
+                record.name = name
+            if device_type is not None:
+                record.device_type = device_type
+            return record
+
+    def _smooth(self, average, sample):
+        return sample if average is None else self.alpha * sample + (1 - self.alpha) * average
+
+    def get(self, peer_id, now=None):
+        """The peer's record, or None if unknown or expired"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            record = self._peers.get(peer_id)
+            if record is None or now - record.last_seen > self.ttl:
+                return None
+            return record
+
+    def remove(self, peer_id):
+        with self._lock:
+            return self._peers.pop(peer_id, None) is not None
+
+    def prune(self, now=None):
+        """Drop peers not seen within ttl; returns their ids"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            while self._peers:
+                peer_id, record = next(iter(self._peers.items()))
+                if now - record.last_seen <= self.ttl:
+                    break
+                self._peers.popitem(last=False)
+                expired.append(peer_id)
+        return expired
+
+    def peers(self, now=None):
+        """Live peers as dicts, most recently seen first"""
+        now = time.monotonic() if now is None else now
+        self.prune(now)
+        with self._lock:
+            return [record.to_dict(now) for record in reversed(self._peers.values())]
+
+    def connected_ids(self, now=None):
+        """Ids of live peers whose smoothed signal is usable (unknown signal counts as usable)"""
+        now = time.monotonic() if now is None else now
+        self.prune(now)
+        with self._lock:
+            return [
+                peer_id for peer_id, record in self._peers.items()
+                if record.signal is None or record.signal > settings.P2P_PEER_MIN_SIGNAL
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._peers.clear()
+
+    def __contains__(self, peer_id):
+        return self.get(peer_id) is not None
+
+    def __len__(self):
+        self.prune()
+        return len(self._peers)
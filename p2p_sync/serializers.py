@@ -4,10 +4,11 @@ from .models import LocalLedgerBlock
 class LocalLedgerBlockSerializer(serializers.ModelSerializer):
     device_id = serializers.CharField(source='device.device_id', read_only=True)
     device_owner = serializers.CharField(source='device.owner.username', read_only=True)
+    vector_clock = serializers.DictField(child=serializers.IntegerField(min_value=0), required=False)
     
     class Meta:
         model = LocalLedgerBlock
-        fields = '__all__'
+        exclude = ['vector_clock_packed']
 
 class P2PStatusSerializer(serializers.Serializer):
     """Serializer for P2P status information"""
@@ -0,0 +1,14 @@
+"""
+Signals sent by the P2P sync layer
+"""
+from django.dispatch import Signal
+
+# Sent after commit when blocks received from a peer are stored in bulk
+# (bulk_create skips post_save); kwargs: device, block_ids
+blocks_imported = Signal()
+
+# Sent after merge_blocks bulk-inserts a chunk into the master ledger
+# (BlockchainTransaction); kwargs: transactions (unsaved instances, including
+# any that already existed and were skipped) and sender_device_ids (the
+# device_id of each transaction's sending Device, in the same order)
+transactions_merged = Signal()
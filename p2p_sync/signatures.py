@@ -0,0 +1,139 @@
+"""
+RSA signing and verification for ledger blocks
+PKCS#1 v1.5 over SHA256 of the block payload_hash, batched on a process pool
+"""
+from django.conf import settings
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5
+from Crypto.PublicKey import RSA
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import base64
+import binascii
+import time
+
+
+@lru_cache(maxsize=1024)
+def import_public_key(public_key):
+    """Parse a device public key once per process; None if it is not an RSA key"""
+    try:
+        return RSA.import_key(public_key)
+    except (ValueError, IndexError, TypeError):
+        return None
+
+
+def sign_payload(payload_hash, private_key):
+    """Sign a payload hash with an RSA private key, base64-encoded"""
+    key = RSA.import_key(private_key)
+    digest = SHA256.new(payload_hash.encode())
+    return base64.b64encode(PKCS1_v1_5.new(key).sign(digest)).decode()
+
+
+def check_signature(payload_hash, signature, public_key):
+    """
+    Check one block signature.
+    Returns True/False for RSA keys, None if the device key is not an RSA key.
+    """
+    key = import_public_key(public_key)
+    if key is None:
+        return None
+    try:
+        raw_signature = base64.b64decode(signature or '', validate=True)
+    except (binascii.Error, ValueError):
+        return False
+    return PKCS1_v1_5.new(key).verify(SHA256.new(payload_hash.encode()), raw_signature)
+
+
+def apply_signature_policy(result):
+    """Unverifiable (non-RSA device key) blocks pass unless signatures are required"""
+    if result is None:
+        return not settings.LEDGER_REQUIRE_SIGNATURES
+    return result
+
+
+def _verify_batch(tasks):
+    """Pool worker: tasks are (payload_hash, signature, public_key) tuples"""
+    return [check_signature(*task) for task in tasks]
+
+
+def load_signing_key(device_id):
+    """Private key PEM for a device from LEDGER_SIGNING_KEY_DIR, or None"""
+    key_path = settings.LEDGER_SIGNING_KEY_DIR / f'{device_id}.pem'
+    try:
+        return key_path.read_text()
+    except OSError:
+        return None
+
+
+class SignatureVerifier:
+    """
+    Verifies bursts of block signatures in batches on a process pool.
+    Parsed RSA keys are cached per public key inside each worker.
+    """
+
+    def __init__(self, workers=None, batch_size=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._pool = None
+
+    def get_workers(self):
+        return self.workers or settings.LEDGER_SIGNATURE_WORKERS
+
+    def get_batch_size(self):
+        return self.batch_size or settings.LEDGER_SIGNATURE_BATCH_SIZE
+
+    def get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.get_workers())
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def verify_blocks(self, blocks, public_keys):
+        """
+        Verify signatures for blocks; public_keys maps device pk -> public key.
+        Returns ({block_pk: bool}, stats) with throughput in blocks per second.
+        """
+        started = time.perf_counter()
+        tasks = [
+            (block.payload_hash, block.signature, public_keys.get(block.device_id, ''))
+            for block in blocks
+        ]
+        batch_size = self.get_batch_size()
+        pooled = self.get_workers() > 1 and len(tasks) > batch_size
+
+        if not pooled:
+            raw_results = _verify_batch(tasks)
+        else:
+            batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+            try:
+                raw_results = [
+                    result
+                    for batch_results in self.get_pool().map(_verify_batch, batches)
+                    for result in batch_results
+                ]
+            except BrokenProcessPool:
+                # A dead worker should not fail the resync; fall back to inline
+                self._pool = None
+                pooled = False
+                raw_results = _verify_batch(tasks)
+
+        results = {
+            block.pk: apply_signature_policy(result)
+            for block, result in zip(blocks, raw_results)
+        }
+        elapsed = time.perf_counter() - started
+        stats = {
+            'blocks': len(tasks),
+            'seconds': round(elapsed, 4),
+            'blocks_per_second': round(len(tasks) / elapsed, 1) if elapsed > 0 else 0,
+            'workers': self.get_workers() if pooled else 1
+        }
+        return results, stats
+
+# Singleton instance
+signature_verifier = SignatureVerifier()
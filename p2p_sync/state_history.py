@@ -0,0 +1,188 @@
+"""
+Time-travel history of ledger state for after-action review
+Every change to the ChainHead counters or the command-center mode appends a
+LedgerStateDelta in the writer's transaction; take_snapshot() periodically
+checkpoints the full state, so state_at(T) loads the latest snapshot before T
+and folds in only the deltas recorded since it.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from datetime import timedelta
+from blockchain.models import COMMAND_CENTER_TABLE
+from users.models import Device
+from .models import LocalLedgerBlock, ChainHead, LedgerStateDelta, LedgerStateSnapshot
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Newest blocks listed per device by device_blocks_at()
+BLOCK_LIST_SIZE = 50
+MAX_BLOCK_LIST_SIZE = 1000
+# Seconds between snapshot_if_due checks triggered by recorded deltas
+SNAPSHOT_CHECK_INTERVAL = 60
+
+
+class StateHistory:
+    """
+    Deltas mirror the counter updates exactly (appends, peer imports,
+    mark_synced, head seeding, reconcile corrections), so a snapshot plus
+    the deltas after it equals the live counters. History starts at the
+    first snapshot; earlier instants cannot be reconstructed.
+    Recording a delta also checks, at most once a minute and after the
+    writer commits, whether a snapshot is due.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+
+    def record_blocks(self, device_pk, height_delta, pending_delta):
+        if height_delta or pending_delta:
+            LedgerStateDelta.objects.create(
+                device_pk=device_pk, height_delta=height_delta, pending_delta=pending_delta
+            )
+            self._schedule_snapshot_check()
+
+    def record_synced(self, synced_per_device):
+        """{device pk: blocks marked synced} from one mark_synced call"""
+        LedgerStateDelta.objects.bulk_create([
+            LedgerStateDelta(device_pk=device_pk, pending_delta=-synced)
+            for device_pk, synced in synced_per_device.items()
+        ])
+        self._schedule_snapshot_check()
+
+    def record_mode(self, mode):
+        LedgerStateDelta.objects.create(mode=mode)
+        self._schedule_snapshot_check()
+
+    def take_snapshot(self):
+        """
+        Checkpoint the live counters and mode. Devices with blocks but no
+        ChainHead yet are seeded first so the snapshot covers them. The chain
+        heads are locked first, so every delta either is counted in them and
+        covered by last_delta_pk, or is written after the snapshot commits.
+        """
+        from .ledger_stats import ledger_stats
+        with transaction.atomic():
+            unseeded = LocalLedgerBlock.objects.exclude(
+                device_id__in=ChainHead.objects.values('device_id')
+            ).values_list('device_id', flat=True).distinct().order_by()
+            for device_pk in list(unseeded):
+                ledger_stats.seed_chain_head(device_pk)
+            heads = list(ChainHead.objects.select_for_update().order_by('pk').values_list(
+                'device_id', 'height', 'pending_blocks'
+            ))
+            last = LedgerStateDelta.objects.order_by('-pk').values_list('pk', flat=True).first()
+            return LedgerStateSnapshot.objects.create(
+                taken_at=timezone.now(),
+                last_delta_pk=last or 0,
+                mode=self.current_mode(),
+                devices={str(device_pk): [height, pending] for device_pk, height, pending in heads}
+            )
+
+    def snapshot_if_due(self):
+        """Take a snapshot when the latest is older than LEDGER_SNAPSHOT_INTERVAL or too many deltas followed it"""
+        latest = LedgerStateSnapshot.objects.order_by('-taken_at', '-pk').first()
+        if latest is not None:
+            age = timezone.now() - latest.taken_at
+            pending = LedgerStateDelta.objects.filter(pk__gt=latest.last_delta_pk).count()
+            if age < timedelta(seconds=settings.LEDGER_SNAPSHOT_INTERVAL) and pending < settings.LEDGER_SNAPSHOT_MAX_DELTAS:
+                return None
+        return self.take_snapshot()
+
+    def _schedule_snapshot_check(self):
+        """Run snapshot_if_due once the current transaction commits, if the last check is old enough"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + min(SNAPSHOT_CHECK_INTERVAL, settings.LEDGER_SNAPSHOT_INTERVAL)
+        transaction.on_commit(self._check_snapshot)
+
+    def _check_snapshot(self):
+        try:
+            self.snapshot_if_due()
+        except Exception:
+            # The writer has already committed; a missed snapshot is retried on the next check
+            logger.exception('Ledger state snapshot failed')
+
+    def current_mode(self):
+        if COMMAND_CENTER_TABLE not in connection.introspection.table_names():
+            return ''
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT current_mode FROM {COMMAND_CENTER_TABLE} LIMIT 1')
+            row = cursor.fetchone()
+        return row[0] if row else ''
+
+    def state_at(self, at):
+        """
+        {'at', 'mode', 'devices', 'totals', 'snapshot', 'replayed_deltas'} as
+        of at; ValueError if at precedes the first snapshot
+        """
+        snapshot = LedgerStateSnapshot.objects.filter(taken_at__lte=at).order_by('-taken_at', '-pk').first()
+        if snapshot is None:
+            first = LedgerStateSnapshot.objects.order_by('taken_at').values_list('taken_at', flat=True).first()
+            raise ValueError(
+                f'ledger history starts at {first.isoformat()}' if first else 'no ledger state snapshots yet'
+            )
+        deltas = LedgerStateDelta.objects.filter(pk__gt=snapshot.last_delta_pk, recorded_at__lte=at)
+
+        counters = {int(device_pk): list(counts) for device_pk, counts in snapshot.devices.items()}
+        # The replay is aggregated in the database: one row per changed device
+        changes = deltas.filter(device_pk__isnull=False).values('device_pk').annotate(
+            height=Sum('height_delta'), pending=Sum('pending_delta'), count=Count('pk')
+        ).order_by()
+        replayed = 0
+        for change in changes:
+            height, pending = counters.setdefault(change['device_pk'], [0, 0])
+            counters[change['device_pk']] = [height + change['height'], pending + change['pending']]
+            replayed += change['count']
+        mode_changes = deltas.exclude(mode='')
+        mode = mode_changes.order_by('-pk').values_list('mode', flat=True).first() or snapshot.mode
+        replayed += mode_changes.count()
+
+        device_ids = dict(Device.objects.filter(pk__in=counters).values_list('pk', 'device_id'))
+        devices = [
+            {
+                'device_id': device_ids.get(device_pk, f'#{device_pk}'),
+                'total': height,
+                'pending': pending,
+                'synced': height - pending
+            }
+            for device_pk, (height, pending) in sorted(counters.items())
+        ]
+        total = sum(device['total'] for device in devices)
+        pending = sum(device['pending'] for device in devices)
+        return {
+            'at': at,
+            'mode': mode or 'normal',
+            'devices': devices,
+            'totals': {'total': total, 'pending': pending, 'synced': total - pending},
+            'snapshot': {'id': snapshot.pk, 'taken_at': snapshot.taken_at},
+            'replayed_deltas': replayed
+        }
+
+    def device_blocks_at(self, device, at, limit=BLOCK_LIST_SIZE):
+        """
+        device's newest blocks created by at, each with whether it was synced
+        by then. Blocks synced before synced_at was recorded count as synced:
+        that predates every snapshot, so any instant state_at accepts.
+        """
+        limit = max(1, min(limit, MAX_BLOCK_LIST_SIZE))
+        blocks = LocalLedgerBlock.objects.filter(device=device, timestamp__lte=at).order_by('-timestamp', '-pk')
+        return [
+            {
+                'block_id': block.block_id,
+                'timestamp': block.timestamp,
+                'synced': block.synced_at <= at if block.synced_at else block.is_synced,
+                'synced_at': block.synced_at
+            }
+            for block in blocks.only('block_id', 'timestamp', 'is_synced', 'synced_at')[:limit]
+        ]
+
+# Singleton instance
+state_history = StateHistory()
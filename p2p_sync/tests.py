@@ -1,3 +1,475 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from Crypto.PublicKey import RSA
+from users.models import Device
+from .anti_entropy import AntiEntropyNode, MemoryLedgerStore, LoopbackTransport, encode_message
+from .chain_verifier import chain_verifier
+from .gossip import GossipNode
+from .models import LocalLedgerBlock, ChainCheckpoint, LedgerStateSnapshot, OutboxMessage
+from .outbox import Outbox
+from .peer_auth import sign_request, sign_challenge, PEER_SIGNATURE_HEADER
+from .signatures import sign_payload
+from .state_history import state_history
+from .transport import P2PTransport, read_frame, encode_frame
+from .wire import (
+    encode_envelope, decode_envelope, encode_block, decode_block, encode_batch, decode_batch,
+    message_hash, block_hash, WireFormatError, CODEC_NONE, CODEC_ZLIB, CODEC_LZMA
+)
+from datetime import datetime, timedelta, timezone as dt_timezone
+import asyncio
+import base64
+import hashlib
+import queue
+import threading
+import time
 
-# Create your tests here.
+PEER_SECRET = 'test-peer-secret'
+
+
+def wire_block(device_id, lamport_clock, signature=''):
+    payload_hash = hashlib.sha256(f'{device_id}:{lamport_clock}'.encode()).hexdigest()
+    return {
+        'block_id': f'block_{payload_hash[:16]}',
+        'prev_hash': 'genesis',
+        'payload_hash': payload_hash,
+        'signature': signature,
+        'device_id': device_id,
+        'lamport_clock': lamport_clock,
+        'vector_clock': {device_id: lamport_clock},
+        'timestamp': f'2026-01-01T00:00:{lamport_clock % 60:02d}+00:00'
+    }
+
+
+class AntiEntropyLoopbackTests(SimpleTestCase):
+    """Two in-process nodes exchanging encoded messages over LoopbackTransport"""
+
+    def test_divergent_ledgers_converge(self):
+        shared = [wire_block('unit_a', clock) for clock in range(1, 200)]
+        only_a = [wire_block('unit_a', clock) for clock in range(200, 240)] + [wire_block('unit_c', 5)]
+        only_b = [wire_block('unit_b', clock) for clock in range(1, 30)]
+        node_a = AntiEntropyNode(MemoryLedgerStore(shared + only_a))
+        node_b = AntiEntropyNode(MemoryLedgerStore(shared + only_b))
+
+        stats = node_a.sync(LoopbackTransport(node_b))
+
+        self.assertEqual(stats['blocks_accepted'], len(only_b))
+        self.assertEqual(stats['blocks_accepted_by_peer'], len(only_a))
+        for device_id in ('unit_a', 'unit_b', 'unit_c'):
+            self.assertEqual(node_a.store.blocks(device_id), node_b.store.blocks(device_id))
+        self.assertEqual(node_a.sync(LoopbackTransport(node_b))['blocks_sent'], 0)
+
+    def test_identical_ledgers_exchange_only_root_digests(self):
+        blocks = [wire_block(device_id, clock) for device_id in ('unit_a', 'unit_b') for clock in range(1, 500)]
+        node_a = AntiEntropyNode(MemoryLedgerStore(blocks))
+        node_b = AntiEntropyNode(MemoryLedgerStore(blocks))
+        transport = LoopbackTransport(node_b)
+
+        stats = node_a.sync(transport)
+
+        self.assertEqual(transport.messages, 1)
+        self.assertEqual(stats['digest_rounds'], 1)
+        self.assertEqual(stats['blocks_received'] + stats['blocks_sent'], 0)
+        self.assertEqual(stats['bytes_received'], len(encode_message({'type': 'digest_reply', 'ranges': [], 'leaves': []})))
+        # One [device_id, digest, max_lamport] root per device, independent of ledger size
+        self.assertLess(stats['bytes_sent'], 150)
+
+
+@override_settings(P2P_PEER_SECRET=PEER_SECRET, LEDGER_REQUIRE_SIGNATURES=False)
+class AntiEntropyEndpointTests(TestCase):
+    url = '/p2p_sync/api/anti-entropy/'
+
+    @classmethod
+    def setUpTestData(cls):
+        key = RSA.generate(1024)
+        cls.private_key = key.export_key().decode()
+        owner = User.objects.create(username='unit_owner')
+        cls.device = Device.objects.create(
+            device_id='unit_a', owner=owner, public_key=key.publickey().export_key().decode()
+        )
+        cls.mock_device = Device.objects.create(device_id='unit_mock', owner=owner, public_key='mock_key_unit_mock')
+
+    def post(self, message, secret=PEER_SECRET):
+        body = encode_message(message)
+        headers = {PEER_SIGNATURE_HEADER: sign_request(body, secret)} if secret else {}
+        return self.client.post(self.url, body, content_type='application/json', headers=headers)
+
+    def test_unsigned_and_wrongly_signed_requests_are_refused(self):
+        self.assertEqual(self.post({'type': 'digest', 'roots': []}, secret=None).status_code, 403)
+        self.assertEqual(self.post({'type': 'digest', 'roots': []}, secret='wrong').status_code, 403)
+        self.assertEqual(self.post({'type': 'digest', 'roots': []}).status_code, 200)
+
+    @override_settings(P2P_PEER_SECRET=None)
+    def test_endpoint_closed_without_secret(self):
+        self.assertEqual(self.post({'type': 'digest', 'roots': []}, secret=PEER_SECRET).status_code, 403)
+
+    def test_push_stores_only_verifiable_blocks(self):
+        signed = wire_block('unit_a', 1)
+        signed['signature'] = sign_payload(signed['payload_hash'], self.private_key)
+        forged = wire_block('unit_a', 2, signature='Zm9yZ2Vk')
+        unverifiable = wire_block('unit_mock', 1)
+
+        reply = self.post({'type': 'push', 'blocks': [signed, forged, unverifiable]}).json()
+
+        self.assertEqual((reply['accepted'], reply['rejected']), (1, 2))
+        self.assertEqual(list(LocalLedgerBlock.objects.values_list('block_id', flat=True)), [signed['block_id']])
+
+
+@override_settings(LEDGER_REQUIRE_SIGNATURES=False)
+class ChainVerifierTests(TestCase):
+    """Device with a mock key: signatures pass, so only linkage and digests are checked"""
+
+    def setUp(self):
+        owner = User.objects.create(username='chain_owner')
+        self.device = Device.objects.create(device_id='unit_chain', owner=owner, public_key='mock_key_unit_chain')
+        prev_hash = 'genesis'
+        self.blocks = []
+        for height in range(1, 6):
+            payload_hash = hashlib.sha256(f'chain:{height}'.encode()).hexdigest()
+            self.blocks.append(LocalLedgerBlock.objects.create(
+                block_id=f'block_{payload_hash[:16]}', prev_hash=prev_hash, payload_hash=payload_hash,
+                signature='', device=self.device
+            ))
+            prev_hash = payload_hash
+
+    def checkpoint_height(self):
+        return ChainCheckpoint.objects.get(device=self.device).height
+
+    def test_intact_chain(self):
+        result = chain_verifier.verify_device(self.device, full=True)
+        self.assertEqual((result['status'], result['height']), ('ok', 5))
+        self.assertEqual(chain_verifier.verify_device(self.device)['verified_blocks'], 0)
+
+    def test_broken_link(self):
+        LocalLedgerBlock.objects.filter(pk=self.blocks[2].pk).update(prev_hash='f' * 64)
+        result = chain_verifier.verify_device(self.device, full=True)
+        self.assertEqual(result['failure']['reason'], 'broken_link')
+        self.assertEqual(result['failure']['height'], 3)
+
+    def test_rewritten_history_fails_the_checkpoint_digest(self):
+        chain_verifier.verify_device(self.device)
+        # Relinked consistently, so only the digest over verified history can tell
+        rewritten = hashlib.sha256(b'rewritten').hexdigest()
+        LocalLedgerBlock.objects.filter(pk=self.blocks[1].pk).update(payload_hash=rewritten)
+        LocalLedgerBlock.objects.filter(pk=self.blocks[2].pk).update(prev_hash=rewritten)
+
+        result = chain_verifier.verify_device(self.device, full=True)
+
+        self.assertEqual(result['failure']['reason'], 'checkpoint_digest_mismatch')
+        self.assertEqual(self.checkpoint_height(), 5)
+
+    def test_truncated_tail_is_flagged_and_checkpoint_kept(self):
+        chain_verifier.verify_device(self.device)
+        LocalLedgerBlock.objects.filter(pk__in=[block.pk for block in self.blocks[3:]]).delete()
+
+        result = chain_verifier.verify_device(self.device, full=True)
+
+        self.assertEqual(result['status'], 'broken')
+        self.assertEqual(result['failure'], {'block_id': self.blocks[2].block_id, 'height': 3, 'reason': 'truncated'})
+        self.assertEqual(self.checkpoint_height(), 5)
+
+
+class StateSnapshotTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create(username='snapshot_owner')
+        self.device = Device.objects.create(device_id='unit_snap', owner=owner, public_key='mock_key_unit_snap')
+        state_history._next_check = 0.0
+
+    def test_recorded_delta_takes_due_snapshot_after_commit(self):
+        # Blocks written around the counters, so the device has no ChainHead yet
+        LocalLedgerBlock.objects.create(
+            block_id='block_snap', prev_hash='genesis', payload_hash='a' * 64, signature='', device=self.device
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            state_history.record_mode('combat')
+            self.assertFalse(LedgerStateSnapshot.objects.exists())
+
+        snapshot = LedgerStateSnapshot.objects.get()
+        self.assertEqual(snapshot.devices, {str(self.device.pk): [1, 1]})
+        self.assertEqual(state_history.state_at(timezone.now())['totals']['total'], 1)
+
+        # Not due again until the interval passes
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            state_history.record_mode('normal')
+        self.assertEqual((len(callbacks), LedgerStateSnapshot.objects.count()), (0, 1))
+
+
+class GossipConcurrencyTests(SimpleTestCase):
+
+    def test_concurrent_pushes_deliver_each_rumor_once(self):
+        delivered = []
+        node = GossipNode('unit_a', peers=lambda: [], send=lambda peer_id, message: False, deliver=delivered.append)
+        rumors = [{'type': 'gossip_push', 'id': f'rumor_{i}', 'origin': 'unit_b', 'hops': 0, 'seen': None,
+                   'payload': {'n': i}} for i in range(200)]
+        barrier = threading.Barrier(8)
+
+        def push_all():
+            barrier.wait()
+            for rumor in rumors:
+                node.handle(rumor)
+                node.handle(node.pull_request())
+
+        threads = [threading.Thread(target=push_all) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(payload['n'] for payload in delivered), list(range(200)))
+        self.assertEqual((node.stats['received'], node.stats['duplicates']), (1600, 1400))
+
+
+def ping_envelope(lamport_clock=1):
+    return {
+        'sender': 'unit_b', 'receiver': 'unit_a', 'payload': 'ping',
+        'timestamp': '2026-01-01T00:00:00+00:00', 'lamport_clock': lamport_clock
+    }
+
+
+async def raw_rpc(address, answer):
+    """Connect without P2PTransport, answer the challenge with answer(nonce) and send one rpc"""
+    reader, writer = await asyncio.open_connection(*address)
+    try:
+        challenge = await read_frame(reader)
+        writer.write(encode_frame({'type': 'auth', 'signature': answer(challenge['nonce'])}))
+        writer.write(encode_frame({'type': 'rpc', 'id': 1, 'body': {'type': 'ping'}}))
+        await writer.drain()
+        return (await asyncio.wait_for(read_frame(reader), 5))['body']
+    except asyncio.IncompleteReadError:
+        return None
+    finally:
+        writer.close()
+
+
+@override_settings(P2P_PEER_SECRET=PEER_SECRET, P2P_PEER_ADDRESSES={}, P2P_LISTEN_PORT=None)
+class TransportAuthTests(SimpleTestCase):
+    """A listener and a client transport on loopback"""
+
+    def setUp(self):
+        self.received = queue.Queue()
+        self.server = P2PTransport(
+            message_handler=lambda envelope: self.received.put(envelope) or {'status': 'p2p_message_received'},
+            rpc_handler=lambda body: {'type': 'pong'}
+        )
+        self.address = self.server.start('127.0.0.1', 0)
+        self.client = P2PTransport()
+        self.client.start()
+        self.client.add_peer('server', *self.address)
+        self.addCleanup(self.client.stop)
+        self.addCleanup(self.server.stop)
+
+    def test_authenticated_link_carries_rpc_and_messages(self):
+        self.assertEqual(self.client.request('server', {'type': 'ping'}, timeout=5), {'type': 'pong'})
+        self.assertTrue(self.client.send('server', ping_envelope()))
+        self.assertEqual(self.received.get(timeout=5)['payload'], 'ping')
+
+    def test_wrong_secret_is_disconnected(self):
+        self.assertIsNone(asyncio.run(raw_rpc(self.address, lambda nonce: sign_challenge(nonce, 'wrong'))))
+        self.assertEqual(asyncio.run(raw_rpc(self.address, sign_challenge)), {'type': 'pong'})
+
+    def test_without_secret_rpc_is_refused_but_messages_flow(self):
+        with self.settings(P2P_PEER_SECRET=None):
+            self.assertEqual(
+                asyncio.run(raw_rpc(self.address, lambda nonce: '')), {'type': 'error', 'error': 'unauthenticated'}
+            )
+            self.assertEqual(
+                self.client.request('server', {'type': 'ping'}, timeout=5),
+                {'type': 'error', 'error': 'unauthenticated'}
+            )
+            self.assertTrue(self.client.send('server', ping_envelope()))
+            self.assertEqual(self.received.get(timeout=5)['payload'], 'ping')
+
+
+class RecordingTransport:
+    """Stands in for P2PTransport: links to peer_ids, records what is sent"""
+
+    def __init__(self, peer_ids=('unit_b',), accept=True):
+        self.links = list(peer_ids)
+        self.accept = accept
+        self.sent = []
+
+    def start(self):
+        pass
+
+    def has_peer(self, peer_id):
+        return peer_id in self.links
+
+    def peer_ids(self):
+        return list(self.links)
+
+    def send(self, peer_id, data, token=None):
+        if self.accept:
+            self.sent.append((peer_id, decode_envelope(data), token))
+        return self.accept
+
+
+def outbox_envelope(payload):
+    return {**ping_envelope(), 'payload': payload, 'payload_hash': hashlib.sha256(payload.encode()).hexdigest()}
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.transport = RecordingTransport()
+        self.outbox = Outbox(self.transport)
+
+    def past_due(self):
+        OutboxMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_enqueue_is_idempotent_per_payload_hash(self):
+        first = self.outbox.enqueue('unit_b', outbox_envelope('one'))
+        again = self.outbox.enqueue('unit_b', outbox_envelope('one'))
+        other_peer = self.outbox.enqueue('unit_c', outbox_envelope('one'))
+
+        self.assertEqual(first.pk, again.pk)
+        self.assertNotEqual(first.pk, other_peer.pk)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_unacked_rows_are_resent_once_their_lease_expires(self):
+        row = self.outbox.enqueue('unit_b', outbox_envelope('one'))
+        self.assertEqual(self.outbox.drain(), {'due': 1, 'queued': 1})
+        # Leased: not sent again until next_attempt_at
+        self.assertEqual(self.outbox.drain(), {'due': 0, 'queued': 0})
+
+        self.past_due()
+        self.assertEqual(self.outbox.drain(), {'due': 1, 'queued': 1})
+
+        self.assertEqual([token for _, _, token in self.transport.sent], [row.pk, row.pk])
+        self.assertEqual(self.transport.sent[0][1]['payload'], 'one')
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 2)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+
+    def test_acks_mark_rows_delivered(self):
+        row = self.outbox.enqueue('unit_b', outbox_envelope('one'))
+        self.outbox.drain()
+
+        self.assertEqual(self.outbox.mark_delivered([row.pk]), 1)
+        self.assertEqual(self.outbox.mark_delivered([row.pk]), 0)
+        self.past_due()
+        self.assertEqual(self.outbox.drain(), {'due': 0, 'queued': 0})
+        self.assertEqual(self.outbox.stats(), {'queued': 1, 'delivered': 1, 'drainer_running': False})
+
+    def test_pending_rows_resume_after_restart(self):
+        offline = Outbox(RecordingTransport(accept=False))
+        row = offline.enqueue('unit_b', outbox_envelope('one'))
+        offline.dispatch([row])
+        self.past_due()
+
+        # A new process: fresh outbox and transport over the same table
+        self.assertEqual(self.outbox.drain(), {'due': 1, 'queued': 1})
+        self.assertEqual(self.transport.sent[0][2], row.pk)
+
+    def test_no_route_leaves_row_due_without_backoff(self):
+        row = self.outbox.enqueue('unit_c', outbox_envelope('one'))
+
+        self.assertEqual(self.outbox.dispatch([row]), 0)
+        self.assertEqual(self.outbox.drain(), {'due': 0, 'queued': 0})
+
+        stored = OutboxMessage.objects.get(pk=row.pk)
+        self.assertEqual((stored.attempts, stored.next_attempt_at), (0, row.next_attempt_at))
+
+    def test_rows_claimed_elsewhere_are_not_sent_again(self):
+        self.outbox.enqueue('unit_b', outbox_envelope('one'))
+        stale = list(OutboxMessage.objects.all())
+        other = Outbox(RecordingTransport())
+
+        self.assertEqual(other.drain()['queued'], 1)
+        self.assertEqual(self.outbox.dispatch(stale), 0)
+        self.assertEqual(self.transport.sent, [])
+
+
+@override_settings(P2P_PEER_ADDRESSES={}, P2P_LISTEN_PORT=None)
+class OutboxLoopbackTests(TransactionTestCase):
+    """Outbox over a real transport link, with acks arriving on the transport's worker thread"""
+
+    def test_rows_are_delivered_once_the_peer_acks(self):
+        received = queue.Queue()
+        server = P2PTransport(message_handler=lambda envelope: received.put(envelope) or {'status': 'p2p_message_received'})
+        address = server.start('127.0.0.1', 0)
+        self.addCleanup(server.stop)
+        client = P2PTransport(ack_handler=lambda tokens: outbox.mark_delivered(tokens))
+        outbox = Outbox(client)
+        client.start()
+        client.add_peer('unit_a', *address)
+        self.addCleanup(client.stop)
+
+        rows = [outbox.enqueue('unit_a', outbox_envelope(payload)) for payload in ('one', 'two')]
+        self.assertEqual(outbox.drain()['queued'], 2)
+
+        self.assertEqual(sorted(received.get(timeout=5)['payload'] for _ in rows), ['one', 'two'])
+        deadline = time.monotonic() + 5
+        while OutboxMessage.objects.filter(delivered_at__isnull=True).exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(OutboxMessage.objects.filter(delivered_at__isnull=True).exists())
+
+
+class WireFormatTests(SimpleTestCase):
+    envelope = {
+        'sender': 'unit_b',
+        'receiver': 'unit_a',
+        'payload': 'grid 4471 — hold',
+        'timestamp': '2026-01-01T00:00:00.123456+00:00',
+        'payload_hash': 'ab' * 32,
+        'signature': base64.b64encode(b'\x01' * 128).decode(),
+        'lamport_clock': 300,
+        'vector_clock': {'unit_a': 2, 'unit_b': 300}
+    }
+
+    def test_envelope_round_trip(self):
+        self.assertEqual(decode_envelope(encode_envelope(self.envelope)), self.envelope)
+        # Non-base64 signatures travel as text; a missing payload_hash stays missing
+        bare = {**self.envelope, 'signature': 'mock_signature', 'vector_clock': {}}
+        del bare['payload_hash']
+        self.assertEqual(decode_envelope(encode_envelope(bare)), bare)
+
+    def test_block_round_trip(self):
+        block = wire_block('unit_a', 42, signature=base64.b64encode(b'\x02' * 64).decode())
+        self.assertEqual(decode_block(encode_block(block)), block)
+        linked = {**block, 'block_id': 'custom-id', 'prev_hash': 'cd' * 32}
+        self.assertEqual(decode_block(encode_block(linked)), linked)
+
+    def test_batch_round_trip_with_every_codec(self):
+        envelopes = [{**self.envelope, 'lamport_clock': clock} for clock in range(1, 50)]
+        encoded = [encode_envelope(envelope) for envelope in envelopes]
+        for codecs in ((), (CODEC_ZLIB,), (CODEC_LZMA,)):
+            batch = encode_batch(encoded, codecs)
+            self.assertEqual(batch[2], codecs[0] if codecs else CODEC_NONE)
+            self.assertEqual(decode_batch(batch), envelopes)
+
+    def test_message_hash_is_stable_across_timestamp_forms(self):
+        forms = [
+            '2026-01-01T05:30:00',
+            '2026-01-01T05:30:00+00:00',
+            '2026-01-01T11:00:00+05:30',
+            '2026-01-01T00:30:00-05:00',
+            datetime(2026, 1, 1, 5, 30, tzinfo=dt_timezone.utc),
+        ]
+        hashes = {message_hash({**self.envelope, 'timestamp': form}) for form in forms}
+        self.assertEqual(len(hashes), 1)
+        self.assertNotIn(message_hash({**self.envelope, 'timestamp': '2026-01-01T05:30:01+00:00'}), hashes)
+
+    def test_block_hash_is_stable_across_timestamp_forms(self):
+        block = {'block_id': 'block_1', 'prev_hash': 'genesis', 'payload_hash': 'ab' * 32, 'device': 7}
+        naive = block_hash({**block, 'timestamp': '2026-01-01T05:30:00'})
+        self.assertEqual(naive, block_hash({**block, 'timestamp': '2026-01-01T11:00:00+05:30'}))
+        self.assertNotEqual(naive, block_hash({**block, 'timestamp': '2026-01-01T05:30:00', 'prev_digest': naive}))
+
+    def test_truncated_or_garbage_input_raises(self):
+        records = [
+            (decode_envelope, encode_envelope(self.envelope)),
+            (decode_block, encode_block(wire_block('unit_a', 42))),
+            (decode_batch, encode_batch([encode_envelope(self.envelope)] * 3, (CODEC_NONE,))),
+        ]
+        for decode, data in records:
+            for size in range(len(data)):
+                with self.assertRaises(WireFormatError):
+                    decode(data[:size])
+            with self.assertRaises(WireFormatError):
+                decode(data + b'\x00')
+        for garbage in (b'\x09\x01\x00', b'\x01\x02\x00', b'\x01\x04\x01not zlib at all', b'\x01\x04\x07'):
+            with self.assertRaises(WireFormatError):
+                decode_batch(garbage)
+        with self.assertRaises(WireFormatError):
+            message_hash({**self.envelope, 'timestamp': 'yesterday'})
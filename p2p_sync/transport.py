@@ -0,0 +1,542 @@
+"""
+Asyncio transport for direct peer links
+One background event loop keeps a TCP connection per peer with a pipelined
+send queue, so Django request threads only enqueue and never wait on I/O.
+
+Frames are length-prefixed and tagged with a frame kind:
+  challenge -> auth        sent by the listener on accept; the connecting peer
+                           answers with the nonce's HMAC under P2P_PEER_SECRET
+  message  -> ack          P2P message delivery, acknowledged by sequence number
+  batch    -> ack          messages coalesced within P2P_BATCH_WINDOW, compressed
+  rpc      -> rpc_reply    request/response (anti-entropy exchange)
+Message and batch frames carry binary envelopes from wire.py; the others are compact JSON.
+With a secret configured, a link that fails the challenge is closed. Without
+one, links still deliver (device-signed) messages but rpc frames are refused.
+A frame the receiver could not store is answered with a nack instead of an
+ack and dropped from the link, leaving the retry to the sender's outbox.
+Unacknowledged frames are resent after P2P_ACK_TIMEOUT and after a
+reconnect; reconnects back off exponentially with jitter.
+"""
+from django.conf import settings
+from django.db import close_old_connections
+from .anti_entropy import encode_message, decode_message
+from .peer_auth import new_challenge, sign_challenge, verify_challenge
+from .vector_clock import encode_varint, decode_varint
+from .wire import encode_envelope, decode_envelope, decode_batch, CodecSelector
+from collections import deque
+import asyncio
+import itertools
+import random
+import struct
+import threading
+import time
+
+FRAME_HEADER = struct.Struct('>IB')  # body size, frame kind
+FRAME_JSON = 0  # ack/rpc/rpc_reply as compact JSON
+FRAME_MESSAGE = 1  # varint seq + binary message envelope
+FRAME_BATCH = 2  # varint seq + wire batch of envelopes
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Acks kept for the sliding throughput window
+THROUGHPUT_WINDOW = 10.0
+# Weight of the newest sample in the latency moving average
+LATENCY_SMOOTHING = 0.2
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(FRAME_HEADER.size)
+    size, kind = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f'frame of {size} bytes exceeds MAX_FRAME_SIZE')
+    data = await reader.readexactly(size)
+    if kind == FRAME_MESSAGE:
+        seq, pos = decode_varint(data, 0)
+        return {'type': 'message', 'seq': seq, 'data': decode_envelope(data[pos:])}
+    if kind == FRAME_BATCH:
+        seq, pos = decode_varint(data, 0)
+        return {'type': 'batch', 'seq': seq, 'data': decode_batch(data[pos:])}
+    return decode_message(data)
+
+
+def encode_frame(message):
+    data = encode_message(message)
+    return FRAME_HEADER.pack(len(data), FRAME_JSON) + data
+
+
+def encode_message_frame(seq, envelope, kind=FRAME_MESSAGE):
+    """Frame an envelope from wire.encode_envelope (or a batch from wire.encode_batch)"""
+    data = bytearray()
+    encode_varint(seq, data)
+    data += envelope
+    return FRAME_HEADER.pack(len(data), kind) + data
+
+
+class PeerLink:
+    """Connection, send queue and counters for one peer; lives on the transport loop"""
+
+    def __init__(self, peer_id, host, port):
+        self.peer_id = peer_id
+        self.host = host
+        self.port = port
+        self.queue = deque()  # (seq, frame, tokens) waiting to be written; one token per message
+        self.unacked = {}  # seq -> [frame, sent_at, attempts, tokens], in send order
+        self.batch = []  # (encoded envelope, token) waiting for the batch window
+        self.batch_bytes = 0
+        self.flush_handle = None
+        self.codec = CodecSelector()
+        self.wakeup = asyncio.Event()
+        self.rpc_waiters = {}
+        self.writer = None
+        self.task = None
+        self.connected = False
+        self.sent = 0
+        self.acked = 0
+        self.nacked = 0
+        self.retries = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.batches = 0
+        self.envelope_bytes = 0  # Envelope bytes before batching/compression
+        self.payload_bytes = 0  # The same envelopes as framed
+        self.latency = None
+        self.ack_window = deque()  # (acked_at, bytes)
+
+    def stats(self, pending):
+        now = time.monotonic()
+        while self.ack_window and now - self.ack_window[0][0] > THROUGHPUT_WINDOW:
+            self.ack_window.popleft()
+        window_bytes = sum(size for _, size in self.ack_window)
+        return {
+            'peer_id': self.peer_id,
+            'address': f'{self.host}:{self.port}',
+            'connected': self.connected,
+            'pending': pending,
+            'in_flight': len(self.unacked),
+            'sent': self.sent,
+            'acked': self.acked,
+            'nacked': self.nacked,
+            'retries': self.retries,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent,
+            'batches': self.batches,
+            'compression_ratio': round(self.payload_bytes / self.envelope_bytes, 3) if self.envelope_bytes else None,
+            'latency_ms': round(self.latency * 1000, 2) if self.latency is not None else None,
+            'throughput_bps': round(window_bytes / THROUGHPUT_WINDOW, 1)
+        }
+
+
+class P2PTransport:
+    """
+    Background asyncio transport. Thread-safe entry points (send, request,
+    stats, add_peer) hand work to the loop and return without blocking on I/O;
+    send() refuses new messages once a peer has P2P_SEND_QUEUE_SIZE pending.
+    Incoming messages go to message_handler, batches to batch_handler (or
+    message_handler per message if unset) and rpc requests to rpc_handler.
+    When a peer acks sent messages, the tokens passed to send() for them go
+    to ack_handler. Handlers run on a worker thread so they may use the ORM.
+    settled(result) decides whether an incoming message's handler result is
+    acked (by default every result is); a batch is acked only if all are.
+    """
+
+    def __init__(self, message_handler=None, rpc_handler=None, batch_handler=None, ack_handler=None,
+                 settled=None):
+        self.message_handler = message_handler
+        self.batch_handler = batch_handler
+        self.rpc_handler = rpc_handler
+        self.ack_handler = ack_handler
+        self.settled = settled
+        self.links = {}
+        self.pending = {}  # peer_id -> queued + unacked count, guarded by _lock
+        self.loop = None
+        self.server = None
+        self.address = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._serving = {}  # incoming connection task -> writer, on the loop
+
+    # Lifecycle
+
+    def start(self, host=None, port=None):
+        """Start the loop thread, listening on host:port (defaults from settings; port None = no listener)"""
+        with self._lock:
+            if self.loop is not None:
+                return self.address
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name='p2p-transport', daemon=True)
+            self._thread.start()
+        host = host or settings.P2P_LISTEN_HOST
+        port = settings.P2P_LISTEN_PORT if port is None else port
+        if port is not None:
+            self.address = self._call(self._start_server(host, port))
+        for peer_id, address in settings.P2P_PEER_ADDRESSES.items():
+            peer_host, peer_port = address.rsplit(':', 1)
+            self.add_peer(peer_id, peer_host, int(peer_port))
+        return self.address
+
+    def stop(self):
+        if self.loop is None:
+            return
+        self._call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+        self.server = None
+        self.address = None
+        self.links.clear()
+        self.pending.clear()
+
+    def _call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def _start_server(self, host, port):
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def _shutdown(self):
+        for link in self.links.values():
+            if link.flush_handle is not None:
+                link.flush_handle.cancel()
+        tasks = [link.task for link in self.links.values() if link.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.server:
+            self.server.close()
+        # Incoming connections outlive server.close(); hang them up and let their handlers finish
+        serving = dict(self._serving)
+        for writer in serving.values():
+            writer.close()
+        await asyncio.gather(*serving, return_exceptions=True)
+        if self.server:
+            await self.server.wait_closed()
+
+    # Thread-safe API
+
+    def add_peer(self, peer_id, host, port):
+        if self.loop is None:
+            self.start()
+        with self._lock:
+            self.pending.setdefault(peer_id, 0)
+        self.loop.call_soon_threadsafe(self._add_link, peer_id, host, port)
+
+    def has_peer(self, peer_id):
+        return peer_id in self.pending
+
+    def send(self, peer_id, data, token=None):
+        """
+        Queue a message for peer_id; False if the peer is unknown or its queue
+        is full. token (if given) is passed to ack_handler once the peer acks.
+        """
+        # Encode on the calling thread so malformed envelopes raise to the sender
+        envelope = data if isinstance(data, bytes) else encode_envelope(data)
+        with self._lock:
+            pending = self.pending.get(peer_id)
+            if pending is None or pending >= settings.P2P_SEND_QUEUE_SIZE:
+                return False
+            self.pending[peer_id] = pending + 1
+        self.loop.call_soon_threadsafe(self._enqueue, peer_id, envelope, token)
+        return True
+
+    def request(self, peer_id, body, timeout=None):
+        """Send an rpc to peer_id and wait for the reply body (blocks the calling thread)"""
+        future = asyncio.run_coroutine_threadsafe(self._request(peer_id, body), self.loop)
+        return future.result(timeout or settings.P2P_RPC_TIMEOUT)
+
+    def notify(self, peer_id, body):
+        """Send an rpc to peer_id without waiting; its reply is discarded. False if the peer is unknown"""
+        if self.loop is None or peer_id not in self.pending:
+            return False
+        self.loop.call_soon_threadsafe(self._notify, peer_id, body)
+        return True
+
+    def peer_ids(self):
+        with self._lock:
+            return list(self.pending)
+
+    def rpc_client(self, peer_id):
+        """Callable(request) -> reply for protocols such as anti-entropy sync"""
+        return RpcClient(self, peer_id)
+
+    def stats(self):
+        if self.loop is None:
+            return {}
+        with self._lock:
+            pending = dict(self.pending)
+        return {
+            peer_id: link.stats(pending.get(peer_id, 0))
+            for peer_id, link in list(self.links.items())
+        }
+
+    # Loop side: outbound
+
+    def _add_link(self, peer_id, host, port):
+        link = self.links.get(peer_id)
+        if link is not None and (link.host, link.port) == (host, port):
+            return
+        if link is not None and link.task:
+            link.task.cancel()
+        link = PeerLink(peer_id, host, port)
+        self.links[peer_id] = link
+        link.task = self.loop.create_task(self._run_link(link))
+
+    def _enqueue(self, peer_id, envelope, token):
+        link = self.links[peer_id]
+        link.batch.append((envelope, token))
+        link.batch_bytes += len(envelope)
+        if (len(link.batch) >= settings.P2P_BATCH_MAX_MESSAGES
+                or link.batch_bytes >= settings.P2P_BATCH_MAX_BYTES):
+            self._flush_batch(link)
+        elif link.flush_handle is None:
+            link.flush_handle = self.loop.call_later(settings.P2P_BATCH_WINDOW, self._flush_batch, link)
+
+    def _flush_batch(self, link):
+        """Queue the link's waiting envelopes as one frame (a plain message frame if only one)"""
+        if link.flush_handle is not None:
+            link.flush_handle.cancel()
+            link.flush_handle = None
+        entries, link.batch, link.batch_bytes = link.batch, [], 0
+        if not entries:
+            return
+        envelopes = [envelope for envelope, _ in entries]
+        seq = next(self._ids)
+        if len(envelopes) == 1:
+            frame = encode_message_frame(seq, envelopes[0])
+        else:
+            frame = encode_message_frame(seq, link.codec.encode(envelopes), FRAME_BATCH)
+            link.batches += 1
+        link.envelope_bytes += sum(len(envelope) for envelope in envelopes)
+        link.payload_bytes += len(frame)
+        link.queue.append((seq, frame, [token for _, token in entries]))
+        link.wakeup.set()
+
+    async def _request(self, peer_id, body):
+        link = self.links[peer_id]
+        request_id = next(self._ids)
+        waiter = self.loop.create_future()
+        link.rpc_waiters[request_id] = waiter
+        link.queue.appendleft((None, encode_frame({'type': 'rpc', 'id': request_id, 'body': body}), ()))
+        link.wakeup.set()
+        try:
+            return await waiter
+        finally:
+            link.rpc_waiters.pop(request_id, None)
+
+    def _notify(self, peer_id, body):
+        link = self.links[peer_id]
+        link.queue.appendleft((None, encode_frame({'type': 'rpc', 'id': next(self._ids), 'body': body}), ()))
+        link.wakeup.set()
+
+    def _release(self, link, count=1):
+        with self._lock:
+            self.pending[link.peer_id] = max(0, self.pending.get(link.peer_id, 0) - count)
+
+    async def _run_link(self, link):
+        failures = 0
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(link.host, link.port), settings.P2P_CONNECT_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError):
+                failures += 1
+                link.retries += 1
+                await asyncio.sleep(self._backoff(failures))
+                continue
+
+            try:
+                await asyncio.wait_for(self._answer_challenge(reader, writer), settings.P2P_CONNECT_TIMEOUT)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                writer.close()
+                failures += 1
+                link.retries += 1
+                await asyncio.sleep(self._backoff(failures))
+                continue
+
+            failures = 0
+            link.writer = writer
+            link.connected = True
+            reader_task = self.loop.create_task(self._read_replies(link, reader))
+            try:
+                await self._resend_unacked(link, writer)
+                await self._write_queue(link, writer, reader_task)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                link.connected = False
+                link.writer = None
+                if reader_task.done() and not reader_task.cancelled():
+                    reader_task.exception()  # Retrieved so a dropped link is not logged as unhandled
+                reader_task.cancel()
+                writer.close()
+                for waiter in link.rpc_waiters.values():
+                    if not waiter.done():
+                        waiter.set_exception(ConnectionError(f'link to {link.peer_id} lost'))
+            link.retries += 1
+            await asyncio.sleep(self._backoff(1))
+
+    async def _answer_challenge(self, reader, writer):
+        frame = await read_frame(reader)
+        if frame.get('type') != 'challenge' or not isinstance(frame.get('nonce'), str):
+            raise ConnectionError('peer did not send a link challenge')
+        signature = sign_challenge(frame['nonce']) if settings.P2P_PEER_SECRET else ''
+        writer.write(encode_frame({'type': 'auth', 'signature': signature}))
+        await writer.drain()
+
+    def _backoff(self, failures):
+        delay = min(settings.P2P_RETRY_MAX_DELAY, settings.P2P_RETRY_BASE_DELAY * 2 ** (failures - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    async def _resend_unacked(self, link, writer, sent_before=None):
+        """Resend frames still unacked (only those sent before sent_before, if given)"""
+        for seq in sorted(link.unacked):
+            entry = link.unacked[seq]
+            if sent_before is not None and entry[1] > sent_before:
+                continue
+            if entry[2] >= settings.P2P_MAX_SEND_ATTEMPTS:
+                del link.unacked[seq]
+                link.dropped += len(entry[3])
+                self._release(link, len(entry[3]))
+                continue
+            entry[1] = time.monotonic()
+            entry[2] += 1
+            writer.write(entry[0])
+            link.bytes_sent += len(entry[0])
+        await writer.drain()
+
+    async def _write_queue(self, link, writer, reader_task):
+        while True:
+            while link.queue:
+                seq, frame, tokens = link.queue.popleft()
+                if seq is not None:
+                    link.unacked[seq] = [frame, time.monotonic(), 1, tokens]
+                    link.sent += len(tokens)
+                writer.write(frame)
+                link.bytes_sent += len(frame)
+                # drain() waits while the socket buffer is full (TCP backpressure)
+                await writer.drain()
+            link.wakeup.clear()
+            wakeup_task = self.loop.create_task(link.wakeup.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    {wakeup_task, reader_task}, timeout=self._ack_deadline(link), return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                wakeup_task.cancel()
+            if reader_task in done:
+                raise ConnectionError(f'link to {link.peer_id} closed')
+            if link.unacked:
+                await self._resend_unacked(link, writer, sent_before=time.monotonic() - settings.P2P_ACK_TIMEOUT)
+
+    def _ack_deadline(self, link):
+        """Seconds until the oldest unacked frame times out, or None if none are in flight"""
+        if not link.unacked:
+            return None
+        oldest = min(entry[1] for entry in link.unacked.values())
+        return max(0, oldest + settings.P2P_ACK_TIMEOUT - time.monotonic())
+
+    async def _read_replies(self, link, reader):
+        while True:
+            frame = await read_frame(reader)
+            if frame.get('type') == 'ack':
+                entry = link.unacked.pop(frame['seq'], None)
+                if entry is None:
+                    continue
+                now = time.monotonic()
+                sample = now - entry[1]
+                link.latency = sample if link.latency is None else (
+                    LATENCY_SMOOTHING * sample + (1 - LATENCY_SMOOTHING) * link.latency
+                )
+                link.acked += len(entry[3])
+                link.ack_window.append((now, len(entry[0])))
+                self._release(link, len(entry[3]))
+                tokens = [token for token in entry[3] if token is not None]
+                if tokens and self.ack_handler is not None:
+                    self.loop.run_in_executor(None, self._run_handler, self.ack_handler, tokens)
+            elif frame.get('type') == 'nack':
+                # The peer could not store it; the outbox resends these rows on its own schedule
+                entry = link.unacked.pop(frame['seq'], None)
+                if entry is not None:
+                    link.nacked += len(entry[3])
+                    self._release(link, len(entry[3]))
+            elif frame.get('type') == 'rpc_reply':
+                waiter = link.rpc_waiters.get(frame['id'])
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(frame['body'])
+
+    # Loop side: inbound
+
+    async def _serve_connection(self, reader, writer):
+        self._serving[asyncio.current_task()] = writer
+        try:
+            authenticated = await asyncio.wait_for(self._challenge(reader, writer), settings.P2P_CONNECT_TIMEOUT)
+            if not authenticated and settings.P2P_PEER_SECRET:
+                return
+            while True:
+                frame = await read_frame(reader)
+                if frame.get('type') == 'message':
+                    result = None
+                    if self.message_handler is not None:
+                        result = await self.loop.run_in_executor(
+                            None, self._run_handler, self.message_handler, frame['data']
+                        )
+                    writer.write(self._reply_frame(frame['seq'], [result]))
+                elif frame.get('type') == 'batch':
+                    results = await self.loop.run_in_executor(None, self._run_handler, self._handle_batch, frame['data'])
+                    writer.write(self._reply_frame(frame['seq'], results or []))
+                elif frame.get('type') == 'rpc':
+                    if not authenticated:
+                        body = {'type': 'error', 'error': 'unauthenticated'}
+                    elif self.rpc_handler is None:
+                        body = {'type': 'error', 'error': 'rpc not supported'}
+                    else:
+                        body = await self.loop.run_in_executor(None, self._run_handler, self.rpc_handler, frame['body'])
+                    writer.write(encode_frame({'type': 'rpc_reply', 'id': frame['id'], 'body': body}))
+                await writer.drain()
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            # ValueError: undecodable frame (including WireFormatError); drop the connection
+            pass
+        finally:
+            self._serving.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _challenge(self, reader, writer):
+        """Challenge a new incoming link; True if it answered under P2P_PEER_SECRET"""
+        nonce = new_challenge()
+        writer.write(encode_frame({'type': 'challenge', 'nonce': nonce}))
+        await writer.drain()
+        frame = await read_frame(reader)
+        return frame.get('type') == 'auth' and verify_challenge(nonce, frame.get('signature'))
+
+    def _reply_frame(self, seq, results):
+        settled = self.settled is None or all(self.settled(result) for result in results)
+        return encode_frame({'type': 'ack' if settled else 'nack', 'seq': seq})
+
+    def _handle_batch(self, envelopes):
+        if self.batch_handler is not None:
+            return self.batch_handler(envelopes)
+        if self.message_handler is not None:
+            return [self.message_handler(envelope) for envelope in envelopes]
+
+    def _run_handler(self, handler, data):
+        close_old_connections()
+        try:
+            return handler(data)
+        finally:
+            close_old_connections()
+
+
+class RpcClient:
+    """Blocking request/reply callable over a transport link, counting payload bytes"""
+
+    def __init__(self, transport, peer_id):
+        self.transport = transport
+        self.peer_id = peer_id
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __call__(self, message):
+        self.bytes_sent += len(encode_message(message))
+        reply = self.transport.request(self.peer_id, message)
+        self.bytes_received += len(encode_message(reply))
+        return reply
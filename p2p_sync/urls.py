@@ -21,6 +21,8 @@ urlpatterns = [
     path('api/status/', views.p2p_status_api, name='api_status'),
     path('api/toggle/', views.toggle_p2p_mode, name='api_toggle'),
     path('api/discover/', views.peer_discovery_api, name='api_discover'),
+    path('api/announce/', views.peer_announce_api, name='api_announce'),
     path('api/sync/', views.sync_with_peers_api, name='api_sync'),
     path('api/send-message/', views.send_p2p_message_api, name='api_send_message'),
+    path('api/anti-entropy/', views.anti_entropy_api, name='api_anti_entropy'),
 ]
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Vector clock engine for distributed ledger ordering
+Happens-before comparison, merge, and compact packed storage
+
+Clocks are dicts of {device_id: counter} in memory. On disk they are packed
+as varint (node index delta, counter) pairs, where node indexes come from the
+per-deployment ClockNode table instead of repeating long device IDs per row.
+"""
+import json
+
+BEFORE = 'before'
+AFTER = 'after'
+EQUAL = 'equal'
+CONCURRENT = 'concurrent'
+
+# Leading byte of the packed representation
+PACKED_FORMAT_VERSION = 1
+
+
+def compare(clock1, clock2):
+    """Causal order of clock1 relative to clock2: BEFORE, AFTER, EQUAL or CONCURRENT"""
+    clock1 = clock1 or {}
+    clock2 = clock2 or {}
+    less = greater = False
+    for node_id in clock1.keys() | clock2.keys():
+        a = clock1.get(node_id, 0)
+        b = clock2.get(node_id, 0)
+        if a < b:
+            less = True
+        elif a > b:
+            greater = True
+        if less and greater:
+            return CONCURRENT
+    if less:
+        return BEFORE
+    if greater:
+        return AFTER
+    return EQUAL
+
+
+def happens_before(clock1, clock2):
+    return compare(clock1, clock2) == BEFORE
+
+
+def merge(*clocks):
+    """Element-wise maximum of the given clocks"""
+    merged = {}
+    for clock in clocks:
+        for node_id, counter in (clock or {}).items():
+            if counter > merged.get(node_id, 0):
+                merged[node_id] = counter
+    return merged
+
+
+def increment(clock, node_id):
+    """Copy of clock with node_id's counter advanced by one"""
+    clock = dict(clock or {})
+    clock[node_id] = clock.get(node_id, 0) + 1
+    return clock
+
+
+def encode_varint(value, out):
+    """Append unsigned LEB128 varint encoding of value to bytearray out"""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """Decode a varint from data at pos; returns (value, new_pos)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_entries(entries):
+    """Pack {node_index: counter} into bytes"""
+    out = bytearray([PACKED_FORMAT_VERSION])
+    encode_varint(len(entries), out)
+    previous = 0
+    for index in sorted(entries):
+        encode_varint(index - previous, out)
+        encode_varint(entries[index], out)
+        previous = index
+    return bytes(out)
+
+
+def decode_entries(data):
+    """Unpack bytes produced by encode_entries into {node_index: counter}"""
+    if not data:
+        return {}
+    data = bytes(data)
+    if data[0] != PACKED_FORMAT_VERSION:
+        raise ValueError(f'Unsupported vector clock format {data[0]}')
+    count, pos = decode_varint(data, 1)
+    entries = {}
+    index = 0
+    for _ in range(count):
+        delta, pos = decode_varint(data, pos)
+        counter, pos = decode_varint(data, pos)
+        index += delta
+        entries[index] = counter
+    return entries
+
+
+class NodeIndex:
+    """
+    Process-local cache of the ClockNode table (device_id <-> small integer).
+    Unknown device IDs are registered on first use.
+    """
+
+    def __init__(self):
+        self.index_by_node = {}
+        self.node_by_index = {}
+
+    def _remember(self, node_id, index):
+        self.index_by_node[node_id] = index
+        self.node_by_index[index] = node_id
+
+    def indexes_for(self, node_ids):
+        from .models import ClockNode
+
+        missing = [node_id for node_id in node_ids if node_id not in self.index_by_node]
+        if missing:
+            for node_id, index in ClockNode.objects.filter(node_id__in=missing).values_list('node_id', 'pk'):
+                self._remember(node_id, index)
+            for node_id in missing:
+                if node_id not in self.index_by_node:
+                    node, _ = ClockNode.objects.get_or_create(node_id=node_id)
+                    self._remember(node_id, node.pk)
+        return {node_id: self.index_by_node[node_id] for node_id in node_ids}
+
+    def nodes_for(self, indexes):
+        from .models import ClockNode
+
+        missing = [index for index in indexes if index not in self.node_by_index]
+        if missing:
+            for node_id, index in ClockNode.objects.filter(pk__in=missing).values_list('node_id', 'pk'):
+                self._remember(node_id, index)
+        return {index: self.node_by_index.get(index, f'node_{index}') for index in indexes}
+
+    def clear(self):
+        self.index_by_node.clear()
+        self.node_by_index.clear()
+
+
+node_index = NodeIndex()
+
+
+def normalize(clock):
+    """Clock dict with string node IDs and non-zero int counters; accepts JSON strings"""
+    if isinstance(clock, str):
+        clock = json.loads(clock) if clock else {}
+    return {str(node_id): int(counter) for node_id, counter in (clock or {}).items() if counter}
+
+
+def pack(clock):
+    """Pack a {device_id: counter} clock (or its JSON string) into bytes"""
+    clock = normalize(clock)
+    indexes = node_index.indexes_for(list(clock))
+    return encode_entries({indexes[node_id]: counter for node_id, counter in clock.items()})
+
+
+def unpack(data):
+    """Unpack bytes from pack() back into a {device_id: counter} clock"""
+    entries = decode_entries(data)
+    nodes = node_index.nodes_for(list(entries))
+    return {nodes[index]: counter for index, counter in entries.items()}
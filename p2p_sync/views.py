@@ -6,6 +6,7 @@ from django.views.decorators.http import require_POST
 from django.utils import timezone
 from .models import LocalLedgerBlock
 from .serializers import LocalLedgerBlockSerializer
+from .ledger_stats import ledger_stats
 
 # Local ledger CRUD
 class LocalLedgerBlockListCreateView(generics.ListCreateAPIView):
@@ -25,36 +26,52 @@ class ResyncLedgerView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
         """
-        Resync local ledger with master blockchain ledger
+        Resync local ledger with master blockchain ledger, one chunk per call
         Implements conflict resolution using Lamport/vector clocks
+
+        Clients send the next_cursor from the previous response to acknowledge
+        that chunk and request the next one; a dropped response only costs the
+        chunk that was in flight.
         """
-        from .blockchain_sync import blockchain_sync
+        from .blockchain_sync import blockchain_sync, RESYNC_CHUNK_SIZE
         
         # 1. Get device information
         device_id = request.data.get('device_id')
         if not device_id:
             return Response({'error': 'device_id required'}, status=400)
         
-        # 2. Fetch unsynced local blocks for this device
-        local_blocks = LocalLedgerBlock.objects.filter(
-            device__device_id=device_id,
-            is_synced=False
-        ).order_by('timestamp', 'lamport_clock')
+        # 2. Fetch the next chunk of unsynced local blocks for this device
+        cursor = request.data.get('cursor')
+        try:
+            chunk_size = int(request.data.get('chunk_size', RESYNC_CHUNK_SIZE))
+            local_blocks, next_cursor, has_more = blockchain_sync.fetch_resync_chunk(
+                device_id, cursor=cursor, chunk_size=chunk_size
+            )
+        except ValueError:
+            return Response({'error': 'invalid cursor or chunk_size'}, status=400)
         
         # 3. Perform sync with conflict resolution
         sync_result = blockchain_sync.sync_local_to_master(local_blocks)
+        chunk_ids = [block.pk for block in local_blocks]
         
         # 4. Update sync statistics
         if sync_result['status'] == 'success':
             # Reset failed sync attempts for successfully synced blocks
             LocalLedgerBlock.objects.filter(
-                device__device_id=device_id,
+                pk__in=chunk_ids,
                 is_synced=True
             ).update(sync_attempts=0)
+            sync_result['next_cursor'] = next_cursor
+            sync_result['has_more'] = has_more
         else:
-            # Increment failed sync attempts
-            local_blocks.update(sync_attempts=models.F('sync_attempts') + 1)
+            # Increment failed sync attempts; the client retries the same cursor
+            LocalLedgerBlock.objects.filter(pk__in=chunk_ids).update(
+                sync_attempts=models.F('sync_attempts') + 1
+            )
+            sync_result['next_cursor'] = cursor
+            sync_result['has_more'] = True
         
+        sync_result['chunk_size'] = len(local_blocks)
         return Response(sync_result)
 
 # P2P Mode Views
@@ -69,7 +86,7 @@ class SwitchOfflineView(APIView):
     def post(self, request):
         from .p2p_comm import p2p_manager
         result = p2p_manager.switch_to_offline_mode()
-        peers = p2p_manager.discover_peers()
+        peers = p2p_manager.discover_peers(scan=True)
         result['discovered_peers'] = peers
         return Response(result)
 
@@ -84,7 +101,11 @@ class ManualSyncView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
         from .p2p_comm import p2p_manager
-        result = p2p_manager.sync_with_peers()
+        try:
+            chunk_size = int(request.data.get('chunk_size', 0)) or None
+        except (TypeError, ValueError):
+            return Response({'error': 'invalid chunk_size'}, status=400)
+        result = p2p_manager.sync_with_peers(chunk_size=chunk_size)
         return Response({'status': 'success', 'sync_result': result})
 
 
@@ -114,8 +135,9 @@ def p2p_status_api(request):
         status = p2p_manager.get_offline_status()
         
         # Get database statistics
-        pending_blocks = LocalLedgerBlock.objects.filter(is_synced=False).count()
-        total_blocks = LocalLedgerBlock.objects.count()
+        ledger_totals = ledger_stats.totals()
+        pending_blocks = ledger_totals['pending']
+        total_blocks = ledger_totals['total']
         
         # Simulate some peer data if in offline mode
         if status.get('offline_mode', False):
@@ -184,7 +206,7 @@ def toggle_p2p_mode(request):
             mode = 'P2P Offline'
             offline_mode = True
             # Discover peers when going offline
-            peers = p2p_manager.discover_peers()
+            peers = p2p_manager.discover_peers(scan=True)
             result['discovered_peers'] = peers
         
         return JsonResponse({
@@ -227,19 +249,19 @@ def peer_discovery_api(request):
         from .p2p_comm import p2p_manager
         peers = p2p_manager.discover_peers()
         
-        # Enhanced peer information
+        # Registry peers (smoothed signal/distance, real last-seen times)
         enhanced_peers = []
-        for i, peer in enumerate(peers):
+        for peer in peers:
             enhanced_peers.append({
-                'id': peer.get('peer_id', f'peer_{i+1:03d}'),
-                'device_id': peer.get('peer_id', f'peer_{i+1:03d}'),
-                'name': f"Device-{peer.get('peer_id', f'{i+1:03d}').split('_')[-1]}",
-                'ip': peer.get('ip', f'192.168.1.{100+i}'),
-                'status': peer.get('status', 'online'),
-                'signal_strength': 85 - (i * 5),  # Simulate decreasing signal
-                'distance': f"{0.2 + (i * 0.3):.1f}km",
-                'last_seen': timezone.now().strftime('%H:%M:%S'),
-                'device_type': 'Mobile' if i % 2 == 0 else 'Base Station'
+                'id': peer['peer_id'],
+                'device_id': peer['peer_id'],
+                'name': peer['name'],
+                'ip': peer['ip'],
+                'status': peer['status'],
+                'signal_strength': peer['signal_strength'],
+                'distance': peer['distance'],
+                'last_seen': peer['last_seen'],
+                'device_type': peer['device_type']
             })
         
         return JsonResponse({
@@ -257,6 +279,21 @@ def peer_discovery_api(request):
         })
 
 
+@csrf_exempt
+@require_POST
+def peer_announce_api(request):
+    """Record a peer's discovery announcement in the registry"""
+    try:
+        import json
+        from .p2p_comm import p2p_manager
+        announcement = json.loads(request.body)
+        if not announcement.get('peer_id'):
+            return JsonResponse({'success': False, 'error': 'peer_id is required'}, status=400)
+        return JsonResponse({'success': True, 'peer': p2p_manager.handle_peer_announcement(announcement)})
+    except (ValueError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
 @csrf_exempt
 @require_POST
 def sync_with_peers_api(request):
@@ -266,8 +303,9 @@ def sync_with_peers_api(request):
         sync_result = p2p_manager.sync_with_peers()
         
         # Get sync statistics
-        pending_blocks = LocalLedgerBlock.objects.filter(is_synced=False).count()
-        total_blocks = LocalLedgerBlock.objects.count()
+        ledger_totals = ledger_stats.totals()
+        pending_blocks = ledger_totals['pending']
+        total_blocks = ledger_totals['total']
         synced_blocks = total_blocks - pending_blocks
         
         return JsonResponse({
@@ -276,6 +314,7 @@ def sync_with_peers_api(request):
             'blocks_synced': synced_blocks,
             'blocks_pending': pending_blocks,
             'total_blocks': total_blocks,
+            'sync_chunks': sync_result.get('chunks', []),
             'sync_time': timezone.now().strftime('%H:%M:%S'),
             'message': f'✅ Synced {synced_blocks} blocks successfully'
         })
@@ -349,3 +388,22 @@ def send_p2p_message_api(request):
             'success': False,
             'error': str(e)
         })
+
+
+@csrf_exempt
+@require_POST
+def anti_entropy_api(request):
+    """
+    Answer a peer's anti-entropy (digest/fetch/push) or gossip request against
+    the local node; the body must be signed with the shared peer secret
+    """
+    from .peer_auth import verify_request, PEER_SIGNATURE_HEADER
+    if not verify_request(request.body, request.headers.get(PEER_SIGNATURE_HEADER)):
+        return JsonResponse({'type': 'error', 'error': 'peer authentication failed'}, status=403)
+    try:
+        import json
+        from .p2p_comm import p2p_manager
+        message = json.loads(request.body)
+        return JsonResponse(p2p_manager.handle_peer_rpc(message))
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({'type': 'error', 'error': str(e)}, status=400)
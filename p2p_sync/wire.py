@@ -0,0 +1,381 @@
+"""
+Compact binary wire format for P2P message envelopes and ledger blocks
+Versioned and canonical: equal records always encode to the same bytes.
+
+Layout: [WIRE_VERSION][kind][flags] followed by the record's fields.
+Batches use the flags byte for the codec of their compressed body.
+Strings and byte strings are varint length-prefixed, hashes are fixed
+32-byte fields, clocks and timestamps (microseconds since the epoch, UTC)
+are varints, and vector clocks are varint-counted (node, counter) pairs
+sorted by node.
+"""
+from datetime import datetime, timezone as dt_timezone
+from .vector_clock import encode_varint, decode_varint
+import base64
+import binascii
+import hashlib
+import lzma
+import zlib
+
+WIRE_VERSION = 1
+
+KIND_MESSAGE = 1
+KIND_BLOCK = 2
+KIND_HASH_FORM = 3
+KIND_BATCH = 4
+KIND_BLOCK_HASH_FORM = 5
+
+# Batch codecs
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+# Raw streams: zlib/xz container headers would cost more than small batches save
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6}]
+ZLIB_WBITS = -15
+MAX_BATCH_SIZE = 16 * 1024 * 1024  # Decompressed bytes accepted from one batch
+# A codec later in the (cheapest-first) candidate list must shrink the body by
+# this fraction more than the current best to be worth its CPU cost
+CODEC_MIN_GAIN = 0.05
+# Batches between re-measuring every codec in CodecSelector
+CODEC_PROBE_INTERVAL = 32
+
+# Flag bits
+FLAG_SIGNATURE_TEXT = 0x01  # Signature kept as text because it is not canonical base64
+FLAG_GENESIS = 0x02  # prev_hash is 'genesis'
+FLAG_DERIVED_BLOCK_ID = 0x04  # block_id is '<prefix>_' + payload_hash[:16]; only the prefix is sent
+FLAG_NO_PAYLOAD_HASH = 0x08  # Envelope carries no payload_hash
+
+HASH_SIZE = 32
+GENESIS = 'genesis'
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = datetime.resolution
+DERIVED_ID_CHARS = 16
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+# Field encoders
+
+def _put_str(value, out):
+    if not isinstance(value, str):
+        raise WireFormatError(f'expected a string, got {type(value).__name__}')
+    data = value.encode()
+    encode_varint(len(data), out)
+    out += data
+
+
+def _put_bytes(value, out):
+    encode_varint(len(value), out)
+    out += value
+
+
+def _put_hash(value, out):
+    try:
+        raw = bytes.fromhex(value)
+    except (TypeError, ValueError):
+        raw = b''
+    if len(raw) != HASH_SIZE:
+        raise WireFormatError(f'expected a {HASH_SIZE}-byte hex hash, got {value!r}')
+    out += raw
+
+
+def _put_timestamp(value, out):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise WireFormatError(f'invalid timestamp {value!r}') from None
+    if not isinstance(value, datetime):
+        raise WireFormatError(f'expected a timestamp, got {type(value).__name__}')
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    encode_varint((value - EPOCH) // _MICROSECOND, out)
+
+
+def _put_clock(clock, out):
+    clock = {str(node): int(counter) for node, counter in (clock or {}).items() if counter}
+    encode_varint(len(clock), out)
+    for node in sorted(clock):
+        _put_str(node, out)
+        encode_varint(clock[node], out)
+
+
+def _signature_flags(signature):
+    """(flag, raw bytes) for a signature; non-canonical base64 travels as text"""
+    try:
+        raw = base64.b64decode(signature, validate=True)
+    except (binascii.Error, ValueError):
+        return FLAG_SIGNATURE_TEXT, signature.encode()
+    if base64.b64encode(raw).decode() != signature:
+        return FLAG_SIGNATURE_TEXT, signature.encode()
+    return 0, raw
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+
+    def varint(self):
+        try:
+            value, self.pos = decode_varint(self.data, self.pos)
+        except IndexError:
+            raise WireFormatError('truncated varint')
+        return value
+
+    def raw(self, size):
+        if self.pos + size > len(self.data):
+            raise WireFormatError('truncated field')
+        value = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return value
+
+    def bytes(self):
+        return self.raw(self.varint())
+
+    def str(self):
+        try:
+            return self.bytes().decode()
+        except UnicodeDecodeError:
+            raise WireFormatError('invalid utf-8 string')
+
+    def hash(self):
+        return self.raw(HASH_SIZE).hex()
+
+    def timestamp(self):
+        return (EPOCH + self.varint() * _MICROSECOND).isoformat()
+
+    def clock(self):
+        return {self.str(): self.varint() for _ in range(self.varint())}
+
+    def signature(self, flags):
+        raw = self.bytes()
+        if flags & FLAG_SIGNATURE_TEXT:
+            return raw.decode()
+        return base64.b64encode(raw).decode()
+
+    def done(self):
+        if self.pos != len(self.data):
+            raise WireFormatError(f'{len(self.data) - self.pos} trailing bytes')
+
+
+def _header(data, kind):
+    reader = _Reader(data)
+    version, record_kind, flags = reader.raw(3)
+    if version != WIRE_VERSION:
+        raise WireFormatError(f'unsupported wire version {version}')
+    if record_kind != kind:
+        raise WireFormatError(f'expected record kind {kind}, got {record_kind}')
+    return reader, flags
+
+
+# Message envelopes
+
+def encode_envelope(envelope):
+    """
+    Encode a P2P message envelope: sender, receiver, payload, timestamp and
+    optional payload_hash, signature, lamport_clock, vector_clock.
+    """
+    signature_flag, signature = _signature_flags(envelope.get('signature') or '')
+    flags = signature_flag | (0 if envelope.get('payload_hash') else FLAG_NO_PAYLOAD_HASH)
+    out = bytearray([WIRE_VERSION, KIND_MESSAGE, flags])
+    _put_str(envelope['sender'], out)
+    _put_str(envelope['receiver'], out)
+    _put_str(envelope['payload'], out)
+    _put_timestamp(envelope['timestamp'], out)
+    if envelope.get('payload_hash'):
+        _put_hash(envelope['payload_hash'], out)
+    _put_bytes(signature, out)
+    encode_varint(int(envelope.get('lamport_clock') or 0), out)
+    _put_clock(envelope.get('vector_clock'), out)
+    return bytes(out)
+
+
+def decode_envelope(data):
+    reader, flags = _header(data, KIND_MESSAGE)
+    envelope = {
+        'sender': reader.str(),
+        'receiver': reader.str(),
+        'payload': reader.str(),
+        'timestamp': reader.timestamp()
+    }
+    if not flags & FLAG_NO_PAYLOAD_HASH:
+        envelope['payload_hash'] = reader.hash()
+    envelope['signature'] = reader.signature(flags)
+    envelope['lamport_clock'] = reader.varint()
+    envelope['vector_clock'] = reader.clock()
+    reader.done()
+    return envelope
+
+
+def message_hash(message):
+    """
+    Deterministic SHA256 (hex) of a message's sender, receiver, payload and
+    timestamp over their canonical binary form; WireFormatError if a field
+    has the wrong type
+    """
+    out = bytearray([WIRE_VERSION, KIND_HASH_FORM, 0])
+    _put_str(message['sender'], out)
+    _put_str(message['receiver'], out)
+    _put_str(message['payload'], out)
+    _put_timestamp(message['timestamp'], out)
+    return hashlib.sha256(out).hexdigest()
+
+
+# Ledger blocks
+
+def block_hash(block):
+    """
+    Deterministic SHA256 (hex) of a ledger block's block_id, prev_hash,
+    payload_hash, timestamp and device (pk) chained onto prev_digest, over
+    their canonical binary form; the digest chain checkpoints are built from
+    """
+    out = bytearray([WIRE_VERSION, KIND_BLOCK_HASH_FORM, 0])
+    _put_str(block['block_id'], out)
+    _put_str(block['prev_hash'], out)
+    _put_str(block['payload_hash'], out)
+    _put_timestamp(block['timestamp'], out)
+    encode_varint(int(block['device']), out)
+    _put_str(block.get('prev_digest', GENESIS), out)
+    return hashlib.sha256(out).hexdigest()
+
+
+def encode_block(block):
+    """Encode a ledger block given as a LocalLedgerBlock or an anti-entropy wire dict"""
+    if not isinstance(block, dict):
+        block = {
+            'block_id': block.block_id,
+            'prev_hash': block.prev_hash,
+            'payload_hash': block.payload_hash,
+            'signature': block.signature,
+            'device_id': block.device.device_id,
+            'lamport_clock': block.lamport_clock,
+            'vector_clock': block.vector_clock,
+            'timestamp': block.timestamp
+        }
+    signature_flag, signature = _signature_flags(block.get('signature') or '')
+    flags = signature_flag
+    if block['prev_hash'] == GENESIS:
+        flags |= FLAG_GENESIS
+    prefix, _, suffix = block['block_id'].rpartition('_')
+    if prefix and suffix == block['payload_hash'][:DERIVED_ID_CHARS]:
+        flags |= FLAG_DERIVED_BLOCK_ID
+
+    out = bytearray([WIRE_VERSION, KIND_BLOCK, flags])
+    _put_str(prefix if flags & FLAG_DERIVED_BLOCK_ID else block['block_id'], out)
+    if not flags & FLAG_GENESIS:
+        _put_hash(block['prev_hash'], out)
+    _put_hash(block['payload_hash'], out)
+    _put_bytes(signature, out)
+    _put_str(block['device_id'], out)
+    encode_varint(int(block['lamport_clock']), out)
+    _put_clock(block.get('vector_clock'), out)
+    _put_timestamp(block['timestamp'], out)
+    return bytes(out)
+
+
+def decode_block(data):
+    """Decode bytes from encode_block into an anti-entropy wire dict"""
+    reader, flags = _header(data, KIND_BLOCK)
+    block_id = reader.str()
+    prev_hash = GENESIS if flags & FLAG_GENESIS else reader.hash()
+    payload_hash = reader.hash()
+    if flags & FLAG_DERIVED_BLOCK_ID:
+        block_id = f'{block_id}_{payload_hash[:DERIVED_ID_CHARS]}'
+    block = {
+        'block_id': block_id,
+        'prev_hash': prev_hash,
+        'payload_hash': payload_hash,
+        'signature': reader.signature(flags),
+        'device_id': reader.str(),
+        'lamport_clock': reader.varint(),
+        'vector_clock': reader.clock(),
+        'timestamp': reader.timestamp()
+    }
+    reader.done()
+    return block
+
+
+# Batches
+
+def _compress(codec, data):
+    if codec == CODEC_ZLIB:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, ZLIB_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if codec == CODEC_LZMA:
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+    return data
+
+
+def _decompress(codec, data):
+    try:
+        if codec == CODEC_ZLIB:
+            decompressor = zlib.decompressobj(ZLIB_WBITS)
+            data = decompressor.decompress(data, MAX_BATCH_SIZE)
+            truncated = bool(decompressor.unconsumed_tail)
+        elif codec == CODEC_LZMA:
+            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+            data = decompressor.decompress(data, MAX_BATCH_SIZE)
+            truncated = not decompressor.eof and not decompressor.needs_input
+        elif codec == CODEC_NONE:
+            truncated = False
+        else:
+            raise WireFormatError(f'unknown batch codec {codec}')
+    except (zlib.error, lzma.LZMAError) as e:
+        raise WireFormatError(f'corrupt batch: {e}')
+    if truncated:
+        raise WireFormatError('batch exceeds MAX_BATCH_SIZE')
+    return data
+
+
+def encode_batch(envelopes, codecs=(CODEC_ZLIB, CODEC_LZMA)):
+    """
+    Pack already-encoded envelopes into one batch, compressed with whichever
+    of codecs (cheapest first) gives the smallest body by at least
+    CODEC_MIN_GAIN; stored uncompressed if none helps
+    """
+    body = bytearray()
+    encode_varint(len(envelopes), body)
+    for envelope in envelopes:
+        _put_bytes(envelope, body)
+    body = bytes(body)
+
+    codec, best = CODEC_NONE, body
+    for candidate in codecs:
+        compressed = _compress(candidate, body)
+        if len(compressed) < len(best) * (1 - CODEC_MIN_GAIN):
+            codec, best = candidate, compressed
+    return bytes([WIRE_VERSION, KIND_BATCH, codec]) + best
+
+
+def decode_batch(data):
+    """Decode a batch into its list of envelope dicts"""
+    reader, codec = _header(data, KIND_BATCH)
+    reader = _Reader(_decompress(codec, reader.data[reader.pos:]))
+    envelopes = [decode_envelope(reader.bytes()) for _ in range(reader.varint())]
+    reader.done()
+    return envelopes
+
+
+class CodecSelector:
+    """
+    Picks a link's batch codec by measured ratio without paying for every
+    codec on every batch: each CODEC_PROBE_INTERVAL-th batch is compressed
+    with all codecs and the winner is used until the next probe
+    """
+
+    def __init__(self, codecs=(CODEC_ZLIB, CODEC_LZMA)):
+        self.codecs = tuple(codecs)
+        self.codec = None
+        self.batches = 0
+
+    def encode(self, envelopes):
+        if self.codec is None or self.batches % CODEC_PROBE_INTERVAL == 0:
+            data = encode_batch(envelopes, self.codecs)
+            self.codec = data[2]
+        else:
+            data = encode_batch(envelopes, () if self.codec == CODEC_NONE else (self.codec,))
+        self.batches += 1
+        return data